@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.batch_fitting import *
+
+
+def generate_curves(model, num_curves, num_datapoints=15, max_conc=10000, dilution_factor=2, noise=0.04, seed=0):
+    rng = np.random.default_rng(seed)
+    x_data = max_conc / (dilution_factor ** np.arange(num_datapoints))
+    kd = 10 ** rng.uniform(0, 3.5, num_curves)
+    hill_slope = rng.uniform(0.6, 2.5, num_curves) if model == hill_equation else np.ones(num_curves)
+    y_data = hill_equation(x_data, kd[:, None], hill_slope[:, None])
+    return x_data, y_data + rng.normal(0, noise, y_data.shape)
+
+
+def benchmark_model(model, num_curves, loop_curves):
+    x_data, y_data = generate_curves(model, num_curves)
+
+    start = time.perf_counter()
+    batch_result = fit_curves(x_data, y_data, model)
+    batch_time = time.perf_counter() - start
+
+    # the per-curve loop is timed on a subset and extrapolated when it would take too long
+    loop_curves = min(loop_curves, num_curves)
+    start = time.perf_counter()
+    loop_kd = np.array([fit[0][0] if fit[0] is not None else np.nan
+                        for fit in (fit_model(model, x_data, y) for y in y_data[:loop_curves])])
+    loop_time = (time.perf_counter() - start) * num_curves / loop_curves
+
+    batch_kd = batch_result[KD][PARAMETER][:loop_curves]
+    agreement = np.nanmedian(np.abs(batch_kd - loop_kd) / loop_kd)
+    failed = np.count_nonzero(batch_result[KD][PARAMETER] == 999)
+    return batch_time, loop_time, agreement, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare batched curve fitting with the per-curve fitting loop")
+    parser.add_argument("--curves", type=int, default=10000, help="number of synthetic curves per model")
+    parser.add_argument("--loop-curves", type=int, default=1000,
+                        help="number of curves fitted with the per-curve loop, extrapolated to --curves")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    print(f"{'Model':<20}{'batch (s)':>12}{'loop (s)':>12}{'speedup':>10}{'median rel. diff':>18}{'failed':>8}")
+    for model_name, model in MODEL_EQUATIONS.items():
+        batch_time, loop_time, agreement, failed = benchmark_model(model, args.curves, args.loop_curves)
+        print(f"{model_name:<20}{batch_time:>12.3f}{loop_time:>12.3f}{loop_time / batch_time:>9.1f}x"
+              f"{agreement:>18.2e}{failed:>8}")
+
+
+if __name__ == "__main__":
+    main()
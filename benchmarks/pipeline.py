@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dataProcess
+from benchmarks.synthetic import *
+from modules.curve_fitting import *
+from modules.save_xlsx import *
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results.json")
+
+# generate_dataset arguments of each benchmarked dataset
+SCENARIOS = {
+    "384_columns_3x15": {},
+    "384_rows_3x15": {"plate_format": ROW_PLATE_FORMAT},
+    "384_increasing_4x11_dil3": {"num_datapoints": 11, "replicates": 4, "dilution_factor": 3, "increasing": True},
+    "384_noisy_3x15": {"noise": 0.15},
+    "384_failing_3x15": {"failing": True},
+    "1536_columns_8x63": {"num_datapoints": 63, "replicates": 8, "plate_wells": 1536},
+    "1536_full_plate_2x767": {"num_datapoints": 767, "replicates": 2, "plate_wells": 1536},
+}
+
+
+def run_pipeline(dataset_info, timings):
+    # the stages of dataProcess.process_signal and output_results, each timed on its own
+    def timed(stage, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        timings.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    plates = timed("parse_dataset", dataProcess.parse_dataset, dataset_info)
+    raw_signal = timed("format_raw_signal", dataProcess.format_raw_signal, plates)
+    corrected_signal = {SIGNAL_VALUES: timed("correct_signal", dataProcess.correct_signal, raw_signal)}
+    dataset_info[NUM_REPEATS], dataset_info[NUM_DATAPOINTS] = corrected_signal[SIGNAL_VALUES].shape
+
+    corrected_signal[STATS] = timed("calculate_signal_statistics", dataProcess.calculate_signal_statistics,
+                                    corrected_signal)
+    normalized_signal = {SIGNAL_VALUES: timed("normalize_signal", dataProcess.normalize_signal, corrected_signal)}
+    corrected_signal[CONC] = normalized_signal[CONC] = dataProcess.calculate_concentrations(dataset_info)
+    corrected_signal[LOG_CONC] = normalized_signal[LOG_CONC] = dataProcess.convert_conc_to_log(corrected_signal[CONC])
+    normalized_signal[STATS] = dataProcess.calculate_signal_statistics(normalized_signal)
+
+    fit_results = {}
+    for model, equation in MODEL_EQUATIONS.items():
+        fit_results[model] = timed(f"fit_curve[{model}]", fit_curve, normalized_signal, equation)
+    x_data, y_data, _ = prepare_fit_inputs(normalized_signal)
+    fit_results[MODEL_SELECTION] = timed("select_model", select_model, fit_results, x_data, y_data)
+
+    timed("output_results", output_results, dataset_info, corrected_signal, normalized_signal, fit_results)
+    return fit_results
+
+
+def benchmark_scenario(name, options, work_dir, repeats):
+    dataset_info = generate_dataset(os.path.join(work_dir, name), **options)
+
+    # one untimed run so file caches and lazily loaded modules do not count against the first stage
+    run_pipeline(dict(dataset_info), {})
+
+    timings = {}
+    for _ in range(repeats):
+        fit_results = run_pipeline(dict(dataset_info), timings)
+
+    failed_fits = [model for model in MODELS if fit_results[model][KD][PARAMETER] == 999]
+    return {"options": options,
+            "failed_fits": failed_fits,
+            "stages": {stage: {"median_ms": float(np.median(times)) * 1000, "min_ms": min(times) * 1000}
+                       for stage, times in timings.items()}}
+
+
+def compare_with_baseline(results, baseline, threshold, min_delta_ms):
+    # a stage regressed when its median is more than threshold slower than the baseline and by at least min_delta_ms
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        baseline_stages = baseline["scenarios"].get(name, {}).get("stages", {})
+        for stage, timing in scenario["stages"].items():
+            if stage not in baseline_stages:
+                continue
+            before, after = baseline_stages[stage]["median_ms"], timing["median_ms"]
+            if after > before * (1 + threshold) and after - before >= min_delta_ms:
+                regressions.append((name, stage, before, after))
+    return regressions
+
+
+def print_results(results, baseline=None):
+    for name, scenario in results["scenarios"].items():
+        failed = f", failed fits: {', '.join(scenario['failed_fits'])}" if scenario["failed_fits"] else ""
+        print(f"{name}{failed}")
+        baseline_stages = (baseline or {}).get("scenarios", {}).get(name, {}).get("stages", {})
+        for stage, timing in scenario["stages"].items():
+            change = ""
+            if stage in baseline_stages:
+                before = baseline_stages[stage]["median_ms"]
+                change = f"  ({(timing['median_ms'] - before) / before:+.0%} vs. baseline {before:.2f} ms)"
+            print(f"    {stage:<30} {timing['median_ms']:>10.2f} ms  (min {timing['min_ms']:.2f} ms){change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every stage of the pipeline on synthetic plate exports.")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run, can be repeated (default: all)")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs per scenario (default: 5)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT,
+                        help="JSON file the results are written to (default: benchmarks/benchmark_results.json)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="JSON results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as a regression (default: 0.2)")
+    parser.add_argument("--min-delta", type=float, default=1.0, metavar="MS",
+                        help="smallest absolute slowdown reported as a regression (default: 1 ms)")
+    args = parser.parse_args()
+
+    results = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "python": platform.python_version(),
+               "numpy": np.__version__,
+               "machine": platform.platform(),
+               "repeats": args.repeats,
+               "scenarios": {}}
+    with tempfile.TemporaryDirectory() as work_dir, warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for name in args.scenario or SCENARIOS:
+            results["scenarios"][name] = benchmark_scenario(name, SCENARIOS[name], work_dir, args.repeats)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"\nResults written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if baseline is None:
+        print("No baseline to compare with, run with --save-baseline to create one")
+        return 0
+
+    regressions = compare_with_baseline(results, baseline, args.threshold, args.min_delta)
+    for name, stage, before, after in regressions:
+        print(f"REGRESSION {name} {stage}: {before:.2f} ms -> {after:.2f} ms ({(after - before) / before:+.0%})")
+    if not regressions:
+        print("No regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
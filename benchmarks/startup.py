@@ -0,0 +1,53 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import *
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_command(command, repeats):
+    # every run starts a new interpreter, so the times include loading python and all imports
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=PACKAGE_DIR, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return {"median_s": float(np.median(times)), "min_s": min(times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold-start time of dataProcess.py.")
+    parser.add_argument("--repeats", type=int, default=5, help="runs of each command (default: 5)")
+    parser.add_argument("--output", help="JSON file the results are written to")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        generate_dataset(os.path.join(work_dir, "dataset"))
+        commands = {"python": [sys.executable, "-c", "pass"],
+                    "import dataProcess": [sys.executable, "-c", "import dataProcess"]}
+        for output_format in (XLSX_OUTPUT, PARQUET_OUTPUT):
+            manifest = os.path.join(work_dir, f"{output_format}.json")
+            with open(manifest, "w") as f:
+                json.dump([{MANIFEST_PATH: "dataset", MANIFEST_OUTPUT: output_format}], f)
+            commands[f"first result ({output_format})"] = [sys.executable, "dataProcess.py", "--batch", manifest,
+                                                          "--workers", "1"]
+
+        results = {name: time_command(command, args.repeats) for name, command in commands.items()}
+
+    for name, timing in results.items():
+        print(f"{name:<30} {timing['median_s'] * 1000:>8.0f} ms  (min {timing['min_s'] * 1000:.0f} ms)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
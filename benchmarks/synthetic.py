@@ -0,0 +1,81 @@
+import csv
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.constants import *
+
+PLATE_SHAPES = {96: (8, 12), 384: (16, 24), 1536: (32, 48)}
+
+
+def generate_replicate(num_datapoints, max_conc=DEFAULT_MAX_CONC, dilution_factor=DEFAULT_DIL_FACTOR, kd=100.0,
+                       hill_slope=1.0, noise=0.02, failing=False, increasing=False, rng=None):
+    # returns the 615 nm and 665 nm readings of one replicate in the well order expected by correct_signal:
+    # donor only wells for every concentration followed by donor + acceptor wells, the last one without ligand
+    # is used as the reference for the acceptor bleed-through (alpha)
+    rng = rng or np.random.default_rng()
+    num_wells = 2 * (num_datapoints + 1)
+    concentrations = float(max_conc) * 1000 / (float(dilution_factor) ** np.arange(num_datapoints))
+
+    bound_fraction = hill_equation(concentrations, kd, hill_slope)
+    if failing:
+        # no binding, only noise, so fits are poorly conditioned
+        bound_fraction = rng.normal(0, 0.3, num_datapoints)
+
+    data_615 = rng.normal(1.3e6, 1.3e6 * noise, num_wells)
+    alpha = 0.008
+    data_665 = alpha * data_615 + rng.normal(2000, 2000 * noise, num_wells)
+    donor_plus = slice(num_datapoints + 1, 2 * num_datapoints + 1)
+    data_665[donor_plus] += 40000 * (bound_fraction + rng.normal(0, noise, num_datapoints))
+
+    if increasing:
+        # the concentration series runs the other way, the reference well stays last
+        donor_only = np.arange(num_datapoints)[::-1]
+        order = np.concatenate([donor_only, [num_datapoints], donor_only + num_datapoints + 1, [num_wells - 1]])
+        data_615, data_665 = data_615[order], data_665[order]
+    return np.round(np.maximum(data_615, 1)), np.round(np.maximum(data_665, 1))
+
+
+def create_plate_grid(values, plate_wells=384, first_col=0):
+    # wells fill the plate column by column, top to bottom, starting at first_col
+    rows, cols = PLATE_SHAPES[plate_wells]
+    if first_col * rows + len(values) > rows * cols:
+        raise ValueError(f"{len(values)} wells do not fit on a {plate_wells}-well plate starting at column {first_col}")
+    grid = [[""] * cols for _ in range(rows)]
+    for i, value in enumerate(values):
+        col, row = divmod(first_col * rows + i, rows)
+        grid[row][col] = str(int(value))
+    return grid
+
+
+def write_plate_export(file_path, data_615, data_665, plate_wells=384, plate_format=COLUMN_PLATE_FORMAT,
+                       first_col=0):
+    # the 615 nm plate, a blank row and the 665 nm plate; row format files are the transpose of this layout
+    grid_615 = create_plate_grid(data_615, plate_wells, first_col)
+    grid_665 = create_plate_grid(data_665, plate_wells, first_col)
+    grid = grid_615 + [None] + grid_665
+    if plate_format == ROW_PLATE_FORMAT:
+        grid = [list(row) for row in zip(*(grid_615 + [[""] * len(grid_615[0])] + grid_665))]
+
+    # as in an export of the plate reader, only the line between the plates is empty
+    with open(file_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        for row in grid:
+            writer.writerow(row or [])
+
+
+def generate_dataset(path, num_datapoints=15, replicates=3, plate_wells=384, plate_format=COLUMN_PLATE_FORMAT,
+                     max_conc=DEFAULT_MAX_CONC, dilution_factor=DEFAULT_DIL_FACTOR, kd=100.0, hill_slope=1.0,
+                     noise=0.02, failing=False, increasing=False, seed=0):
+    # writes one csv file per replicate into the directory path and returns the matching dataset info
+    rng = np.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+    for replicate in range(1, replicates + 1):
+        data_615, data_665 = generate_replicate(num_datapoints, max_conc, dilution_factor, kd, hill_slope, noise,
+                                                failing, increasing, rng)
+        write_plate_export(os.path.join(path, f"replicate_{replicate}.csv"), data_615, data_665, plate_wells,
+                           plate_format)
+
+    return {PATH: path, PLATE_FORMAT: plate_format, MAX_CONC: max_conc, CONC_REVERSE: increasing,
+            DIL_FACTOR: dilution_factor}
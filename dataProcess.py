@@ -1,18 +1,156 @@
+import argparse
+import logging
+import os
 import re
+import sys
+import time
 
-from modules.curve_fitting import *
-from modules.save_xlsx import *
+from modules.batch import *
+from modules.journal import BatchJournal
+from modules.pipeline import *
+from modules.plate_layout import *
+from modules.results_index import index_results
+from modules.staged import *
+from modules.stream import *
+from modules.watch import *
 
 
 def main():
+    args = parse_arguments()
+    logging.basicConfig(level=args.log_level or (logging.INFO if args.watch or args.serve else logging.WARNING),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if args.batch or args.layout:
+        start = time.perf_counter()
+        datasets = read_manifest(args.batch) if args.batch else read_layout_datasets(args.layout)
+        for dataset_info in datasets:
+            add_dataset_options(dataset_info, args)
+        # no more workers than datasets are started, unless exports holding many datasets are read while processing
+        workers = args.workers
+        if not any(dataset_info.get(PLATES_PER_DATASET) for dataset_info in datasets):
+            workers = min(workers or os.cpu_count() or 1, max(len(datasets), 1))
+        datasets = expand_datasets(datasets)
+        # with a journal, datasets completed by an earlier run are skipped and every result is recorded as it finishes
+        journal = BatchJournal(args.journal) if args.journal else None
+        if journal:
+            datasets = journal.pending(datasets)
+        on_result = journal.record if journal else None
+        if args.pipeline:
+            results, stage_stats = run_staged(datasets, args.ingest_workers, workers, args.output_workers,
+                                              args.queue_size, on_result)
+        else:
+            results = run_batch(datasets, dataProcess, workers, on_result)
+        if args.index:
+            print(f"Added {index_results(results)} dataset(s) to {args.index}")
+        print_batch_report(results, time.perf_counter() - start)
+        if journal and journal.skipped:
+            print(f"Skipped {len(journal.skipped)} dataset(s) completed in an earlier run (see {args.journal})")
+        if args.pipeline:
+            print_stage_report(stage_stats)
+        return 0 if all(result[BATCH_STATUS] == BATCH_OK for result in results) else 1
+
+    if args.serve:
+        # the service is only loaded when it is used
+        from modules.service import serve
+        serve(args.host, args.port, args.workers, args.max_pending)
+        return 0
+
+    if args.watch:
+        dataset_options = add_dataset_options({}, args)
+        watch_directory(args.watch, dataProcess, args.workers, args.poll_interval, args.settle_time,
+                        args.process_existing, dataset_options)
+        return 0
+
     print("Program requires csv file(s) with single replicates arranged in a specific format. See README")
-    dataProcess(get_dataset_info())
-    print(f"\n{'*' * 50}\n")
     while True:
-        dataProcess(get_dataset_info())
+        dataset_info = add_dataset_options(get_dataset_info(), args)
+        dataProcess(dataset_info)
+        index_results([dataset_info])
         print(f"\n{'*' * 50}\n")
 
 
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Process TR-FRET binding data. Without arguments, datasets are "
+                                                 "requested interactively.")
+    parser.add_argument("--batch", metavar="MANIFEST",
+                        help="CSV, JSON or TOML manifest listing path, max_conc, direction, plate_format and "
+                             "dilution_factor for each dataset")
+    parser.add_argument("--layout", metavar="LAYOUT",
+                        help="JSON plate layout listing plate exports and the sets of wells on them; every set is "
+                             "processed as its own dataset")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes for batch, watch and service mode (default: number of "
+                             "cores)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="process a batch in three overlapping stages (read, compute, write) connected by bounded "
+                             "queues; --workers sets the compute processes")
+    parser.add_argument("--ingest-workers", type=int, default=2, metavar="N",
+                        help="threads reading plate exports in --pipeline mode (default: 2)")
+    parser.add_argument("--output-workers", type=int, default=None, metavar="N",
+                        help="processes writing outputs in --pipeline mode (default: same as --workers)")
+    parser.add_argument("--queue-size", type=int, default=None, metavar="N",
+                        help="datasets waiting in front of each stage in --pipeline mode (default: twice the "
+                             "stage's workers)")
+    parser.add_argument("--watch", metavar="DIR",
+                        help="watch DIR and process csv files as they are written; each subdirectory is a dataset "
+                             "and parameters are read from dataset.json files")
+    parser.add_argument("--poll-interval", type=float, default=1.0, metavar="SECONDS",
+                        help="how often the watched directory is scanned (default: 1)")
+    parser.add_argument("--settle-time", type=float, default=2.0, metavar="SECONDS",
+                        help="time a dataset's files must stay unchanged before it is processed (default: 2)")
+    parser.add_argument("--process-existing", action="store_true",
+                        help="also process the datasets already in the watched directory")
+    parser.add_argument("--serve", action="store_true",
+                        help="run a local HTTP service that analyses plate exports posted to /analyze")
+    parser.add_argument("--host", default=DEFAULT_SERVICE_HOST,
+                        help=f"address the service listens on (default: {DEFAULT_SERVICE_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_SERVICE_PORT,
+                        help=f"port the service listens on (default: {DEFAULT_SERVICE_PORT})")
+    parser.add_argument("--max-pending", type=int, default=None, metavar="N",
+                        help="requests queued or running at once before new ones are rejected with 503 "
+                             "(default: twice the number of workers)")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="directory of a result cache; unchanged datasets are not processed or written again")
+    parser.add_argument("--cache-size", type=float, default=DEFAULT_CACHE_SIZE / 1e6, metavar="MB",
+                        help=f"maximum size of the result cache (default: {DEFAULT_CACHE_SIZE / 1e6:g} MB)")
+    parser.add_argument("--index", metavar="DB",
+                        help="add the parameters and fit results of every processed dataset to a SQLite database; "
+                             "query it with python3 -m modules.results_index DB")
+    parser.add_argument("--journal", metavar="FILE",
+                        help="record the progress of a batch in FILE; running the batch again with the same journal "
+                             "skips the datasets that completed and retries the failed and unfinished ones")
+    parser.add_argument("--metrics", metavar="DIR",
+                        help="write per-stage timings and counters of each dataset as JSON files to DIR")
+    parser.add_argument("--profile", action="store_true",
+                        help="add a cProfile capture to the metrics and save it as a .prof file (requires --metrics)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="add the peak memory use and largest allocations to the metrics (requires --metrics)")
+    parser.add_argument("--log-level", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="logging level (default: INFO in watch and service mode, WARNING otherwise)")
+    args = parser.parse_args()
+    if (args.profile or args.trace_memory) and not args.metrics:
+        parser.error("--profile and --trace-memory require --metrics")
+    if args.pipeline and not (args.batch or args.layout):
+        parser.error("--pipeline requires --batch or --layout")
+    if args.journal and not (args.batch or args.layout):
+        parser.error("--journal requires --batch or --layout")
+    if args.pipeline and args.metrics:
+        parser.error("--metrics cannot be combined with --pipeline, which reports the utilization of each stage")
+    return args
+
+
+def add_dataset_options(dataset_info, args):
+    if args.cache:
+        dataset_info[CACHE_DIR] = args.cache
+        dataset_info[CACHE_SIZE] = int(args.cache_size * 1e6)
+    if args.index:
+        dataset_info[RESULTS_INDEX] = os.path.abspath(args.index)
+    if args.metrics:
+        dataset_info[METRICS_DIR] = args.metrics
+        dataset_info[METRICS_PROFILE] = args.profile
+        dataset_info[METRICS_TRACE_MEMORY] = args.trace_memory
+    return dataset_info
+
+
 def get_dataset_info():
     output = {PATH: input("Enter path or 'q' to exit: ") or DEFAULT_PATH,
               PLATE_FORMAT: COLUMN_PLATE_FORMAT,
@@ -48,153 +186,5 @@ def get_dataset_info():
     return output
 
 
-def dataProcess(dataset_info):
-    input_data_as_df = parse_dataset(dataset_info)
-
-    raw_signal = format_raw_signal(input_data_as_df)
-
-    corrected_signal = {SIGNAL_VALUES: correct_signal(raw_signal)}
-
-    dataset_info[NUM_REPEATS] = len(corrected_signal[SIGNAL_VALUES])
-    dataset_info[NUM_DATAPOINTS] = len(next(iter(corrected_signal[SIGNAL_VALUES].values())))
-
-    corrected_signal[STATS] = calculate_signal_statistics(corrected_signal)
-
-    normalized_signal = {SIGNAL_VALUES: normalize_signal(corrected_signal)}
-    corrected_signal[CONC] = normalized_signal[CONC] = calculate_concentrations(dataset_info)
-    corrected_signal[LOG_CONC] = normalized_signal[LOG_CONC] = convert_conc_to_log(corrected_signal[CONC])
-    normalized_signal[STATS] = calculate_signal_statistics(normalized_signal)
-
-    fit_results = {SIMPLE_MODEL: fit_curve(normalized_signal, simple_model_equation),
-                   QUADRATIC_MODEL: fit_curve(normalized_signal, quadratic_model_equation),
-                   COOPERATIVE_MODEL: fit_curve(normalized_signal, hill_equation)}
-
-    output_results(dataset_info, corrected_signal, normalized_signal, fit_results)
-
-    return
-
-
-def parse_dataset(dataset_info):
-    path = dataset_info[PATH]
-    plate_format = dataset_info[PLATE_FORMAT]
-    dfs = []
-    if os.path.isdir(path):
-        for root, dirs, files in os.walk(path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                if file_path.endswith(".csv"):
-                    dfs.append(pd.read_csv(file_path, header=None, skip_blank_lines=False))
-    else:
-        dfs.append(pd.read_csv(path, header=None, skip_blank_lines=False))
-
-    if plate_format == ROW_PLATE_FORMAT:
-        for i in range(0, len(dfs)):
-            dfs[i] = dfs[i].transpose()
-
-    return dfs
-
-
-def format_raw_signal(dfs):
-    output = {"615": {}, "665": {}}
-    repeat = 0
-    for df in dfs:
-        repeat += 1
-        output["615"][repeat] = []
-        output["665"][repeat] = []
-        for col in df:
-            if df[col].any():
-                filter_ = "615"
-                for value in df[col]:
-                    if value > 0:
-                        output[filter_][repeat].append(value)
-                    else:
-                        filter_ = "665"
-    return output
-
-
-def correct_signal(data):
-    output = {}
-    for i in range(1, len(data["615"]) + 1):
-        data_615 = data["615"][i]
-        data_665 = data["665"][i]
-        repeat_signal = []
-        last_index = len(data_615) - 1
-        alpha = data_665[last_index] / data_615[last_index]
-        first_index_of_donor_plus = len(data_615) // 2
-        for p in range(first_index_of_donor_plus, last_index):
-            m = p - first_index_of_donor_plus
-            corrected = ((data_665[p] - (alpha * data_615[p])) - (data_665[m] - (alpha * data_615[m])))
-            repeat_signal.append(corrected)
-        output[i] = repeat_signal
-    return output
-
-
-def parse_values_from_file(reader, line):
-    data_arr = []
-    while line:
-        data_arr.append(int(line[0]))
-        line = next(reader, None)
-
-    return data_arr
-
-
-def normalize_signal(data):
-    output = {}
-    global_max = float('-inf')
-    global_min = float('inf')
-    for value in data[STATS][AVERAGE_SIGNAL]:
-        max_value, min_value = value, value
-        if max_value > global_max:
-            global_max = max_value
-        if min_value <= global_min:
-            global_min = min_value
-
-    for repeat, values in data[SIGNAL_VALUES].items():
-        output[repeat] = []
-        for i in range(len(values)):
-            output[repeat].append((values[i] - global_min) / (global_max - global_min))
-
-    return output
-
-
-def calculate_concentrations(data_info):
-    max_concentration = data_info[MAX_CONC]
-    dilution_factor = data_info[DIL_FACTOR]
-    num_datapoints = data_info[NUM_DATAPOINTS]
-
-    concentrations = []
-    current_concentration = float(max_concentration) * 1000
-    for i in range(1, num_datapoints + 1):
-        if data_info[CONC_REVERSE]:
-            concentrations.insert(0, current_concentration)
-        else:
-            concentrations.append(current_concentration)
-        current_concentration /= dilution_factor
-
-    return concentrations
-
-
-def convert_conc_to_log(array_of_concentrations):
-    output = []
-    for value in array_of_concentrations:
-        output.append(np.log10(value))
-
-    return output
-
-
-def calculate_signal_statistics(data):
-    repeat_num = len(data[SIGNAL_VALUES])
-    datapoint_num = len(next(iter(data[SIGNAL_VALUES].values())))
-
-    values = np.zeros((repeat_num, datapoint_num))
-    for i in range(repeat_num):
-        values[i, :] = np.array(data[SIGNAL_VALUES][i + 1])
-    averages = (np.mean(values, axis=0)).tolist()
-
-    std_devs_pop = np.std(values, axis=0, ddof=1, dtype=np.float64).tolist()
-    std_errors_mean = (std_devs_pop / np.sqrt(repeat_num)).tolist()
-
-    return {AVERAGE_SIGNAL: averages, STD_DEV: std_devs_pop, STD_ERR: std_errors_mean}
-
-
-main()
+if __name__ == "__main__":
+    sys.exit(main())
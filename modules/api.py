@@ -0,0 +1,181 @@
+from modules.pipeline import *
+
+# fit_results keys of the pipeline -> attribute names of ParameterEstimate
+ESTIMATE_FIELDS = {PARAMETER: "value", CONF_INT_LOWER: "ci_lower", CONF_INT_UPPER: "ci_upper", STD_DEV: "std_dev",
+                   STD_ERR: "std_err"}
+# only present when bootstrap intervals were computed
+BOOTSTRAP_FIELDS = {BOOTSTRAP_CI_LOWER: "bootstrap_ci_lower", BOOTSTRAP_CI_UPPER: "bootstrap_ci_upper"}
+
+
+class SignalResult:
+    # values has shape (replicates, datapoints), the statistics are per datapoint
+    __slots__ = ("values", "mean", "std_dev", "std_err")
+
+    def __init__(self, values, mean, std_dev, std_err):
+        self.values = values
+        self.mean = mean
+        self.std_dev = std_dev
+        self.std_err = std_err
+
+    def __repr__(self):
+        return f"SignalResult(replicates={self.values.shape[0]}, datapoints={self.values.shape[1]})"
+
+
+class ParameterEstimate:
+    __slots__ = tuple(ESTIMATE_FIELDS.values()) + tuple(BOOTSTRAP_FIELDS.values())
+
+    def __init__(self, value, ci_lower, ci_upper, std_dev, std_err, bootstrap_ci_lower=np.nan,
+                 bootstrap_ci_upper=np.nan):
+        self.value = value
+        self.ci_lower = ci_lower
+        self.ci_upper = ci_upper
+        self.std_dev = std_dev
+        self.std_err = std_err
+        self.bootstrap_ci_lower = bootstrap_ci_lower
+        self.bootstrap_ci_upper = bootstrap_ci_upper
+
+    def __repr__(self):
+        return f"ParameterEstimate(value={self.value:g}, ci=({self.ci_lower:g}, {self.ci_upper:g}))"
+
+
+class FitResult:
+    # kd is in nM; hill_slope is only set for the cooperative model; parameters of a fit that did not converge are
+    # 999 as in the output file, those of a skipped model nan; aicc and f_test_p come from the model comparison
+    __slots__ = ("model", "converged", "kd", "hill_slope", "evaluations", "excluded", "exclusion_candidates",
+                 "skipped", "r_squared", "aicc", "f_test_p", "bootstrap_converged")
+
+    def __init__(self, model, converged, kd, hill_slope, evaluations, excluded, exclusion_candidates, skipped=False,
+                 r_squared=np.nan, aicc=np.nan, f_test_p=np.nan, bootstrap_converged=0):
+        self.model = model
+        self.converged = converged
+        self.kd = kd
+        self.hill_slope = hill_slope
+        self.evaluations = evaluations
+        self.excluded = excluded
+        self.exclusion_candidates = exclusion_candidates
+        self.skipped = skipped
+        self.r_squared = r_squared
+        self.aicc = aicc
+        self.f_test_p = f_test_p
+        self.bootstrap_converged = bootstrap_converged
+
+    def __repr__(self):
+        return f"FitResult(model={self.model!r}, converged={self.converged}, kd={self.kd!r})"
+
+
+class AnalysisResult:
+    __slots__ = ("concentrations", "log_concentrations", "corrected", "normalized", "fits", "preferred_model")
+
+    def __init__(self, concentrations, log_concentrations, corrected, normalized, fits, preferred_model=None):
+        self.concentrations = concentrations
+        self.log_concentrations = log_concentrations
+        self.corrected = corrected
+        self.normalized = normalized
+        self.fits = fits
+        self.preferred_model = preferred_model
+
+    def __repr__(self):
+        return (f"AnalysisResult(datapoints={len(self.concentrations)}, fits={list(self.fits)}, "
+                f"preferred_model={self.preferred_model!r})")
+
+
+def analyze_arrays(data_615, data_665, max_conc=DEFAULT_MAX_CONC, dilution_factor=DEFAULT_DIL_FACTOR,
+                   increasing=False, **fit_options):
+    # data_615 and data_665 are the readings of each well, with shape (wells,) or (replicates, wells) and wells in
+    # the same order as they are read from a plate export
+    data_615, data_665 = np.atleast_2d(data_615).astype(np.float64), np.atleast_2d(data_665).astype(np.float64)
+    if data_615.shape != data_665.shape or data_615.ndim != 2:
+        raise ValueError(f"615 nm and 665 nm readings must have the same (replicates, wells) shape, "
+                         f"got {data_615.shape} and {data_665.shape}")
+    plates = list(np.stack((data_615, data_665), axis=-1))
+    return analyze_plates(plates, max_conc, dilution_factor, increasing, **fit_options)
+
+
+def analyze_files(files, max_conc=DEFAULT_MAX_CONC, dilution_factor=DEFAULT_DIL_FACTOR, increasing=False,
+                  plate_format=COLUMN_PLATE_FORMAT, **fit_options):
+    # files are paths or open files (text or binary) of plate exports, one replicate each
+    plates = [read_plate_export(file, plate_format) for file in files]
+    return analyze_plates(plates, max_conc, dilution_factor, increasing, **fit_options)
+
+
+def analyze_plates(plates, max_conc=DEFAULT_MAX_CONC, dilution_factor=DEFAULT_DIL_FACTOR, increasing=False,
+                   outlier_search=OUTLIER_SEARCH_ON_FAILURE, max_excluded=1, criterion=AICC, skip_r2=None,
+                   fit_workers=1, bootstrap_samples=0, bootstrap_seed=DEFAULT_BOOTSTRAP_SEED, bootstrap_workers=1):
+    dataset_info = {PATH: "", MAX_CONC: max_conc, DIL_FACTOR: dilution_factor, CONC_REVERSE: increasing,
+                    OUTLIER_SEARCH: outlier_search, MAX_EXCLUDED: max_excluded, EXCLUSION_CRITERION: criterion,
+                    SKIP_MODELS_R2: skip_r2, FIT_WORKERS: fit_workers, BOOTSTRAP_SAMPLES: bootstrap_samples,
+                    BOOTSTRAP_SEED: bootstrap_seed, BOOTSTRAP_WORKERS: bootstrap_workers}
+    corrected_signal, normalized_signal, fit_results = process_plates(dataset_info, plates)
+    return create_analysis_result(corrected_signal, normalized_signal, fit_results)
+
+
+def create_analysis_result(corrected_signal, normalized_signal, fit_results):
+    selection = fit_results[MODEL_SELECTION]
+    return AnalysisResult(np.array(corrected_signal[CONC]), np.array(corrected_signal[LOG_CONC]),
+                          create_signal_result(corrected_signal), create_signal_result(normalized_signal),
+                          {model: create_fit_result(model, fit_results[model], selection) for model in MODELS},
+                          selection[PREFERRED_MODEL])
+
+
+def create_signal_result(signal_data):
+    stats = signal_data[STATS]
+    return SignalResult(signal_data[SIGNAL_VALUES], stats[AVERAGE_SIGNAL], stats[STD_DEV], stats[STD_ERR])
+
+
+def create_fit_result(model, fit_data, selection=None):
+    selection = selection or {AICC_SCORES: {}, F_TEST_P_VALUES: {}}
+    skipped = fit_data.get(FIT_SKIPPED, False)
+    converged = not skipped and fit_data[KD][PARAMETER] != 999
+    estimates = {param: ParameterEstimate(*(fit_data[param][key] for key in ESTIMATE_FIELDS),
+                                          *(fit_data[param].get(key, np.nan) for key in BOOTSTRAP_FIELDS))
+                 for param in FIT_PARAMETERS if param in fit_data}
+    return FitResult(model, converged, estimates[KD], estimates.get(NH) if model == COOPERATIVE_MODEL else None,
+                     fit_data[FIT_EVALUATIONS], list(fit_data[EXCLUDED_DATAPOINTS]), fit_data[EXCLUSION_CANDIDATES],
+                     skipped, fit_data.get(FIT_R2, np.nan), selection[AICC_SCORES].get(model, np.nan),
+                     selection[F_TEST_P_VALUES].get(model, np.nan), fit_data.get(BOOTSTRAP_CONVERGED, 0))
+
+
+def render_xlsx(result, file, low_memory=False, curve_step_ratio=DEFAULT_CURVE_STEP_RATIO):
+    # writes the same workbook as the command line program to file, a path or an open binary file
+    from modules.save_xlsx import output_results
+
+    num_repeats, num_datapoints = result.corrected.values.shape
+    data_info = {NUM_REPEATS: num_repeats, NUM_DATAPOINTS: num_datapoints, CURVE_STEP_RATIO: curve_step_ratio}
+    signal_corrected, signal_normalized, fit_data = to_pipeline_results(result)
+    return output_results(data_info, signal_corrected, signal_normalized, fit_data, low_memory, filename=file)
+
+
+def to_pipeline_results(result):
+    # the dicts used by the pipeline's output writers
+    signals = []
+    for signal in (result.corrected, result.normalized):
+        signals.append({SIGNAL_VALUES: signal.values,
+                        STATS: {AVERAGE_SIGNAL: signal.mean, STD_DEV: signal.std_dev, STD_ERR: signal.std_err},
+                        CONC: list(result.concentrations), LOG_CONC: list(result.log_concentrations)})
+
+    fit_data = {MODEL_SELECTION: {PREFERRED_MODEL: result.preferred_model, AICC_SCORES: {}, F_TEST_P_VALUES: {}}}
+    for model, fit in result.fits.items():
+        fit_data[model] = {KD: to_pipeline_estimate(fit.kd)}
+        if fit.hill_slope is not None:
+            fit_data[model][NH] = to_pipeline_estimate(fit.hill_slope)
+        elif not fit.converged and not fit.skipped:
+            fit_data[model][NH] = {key: 999 for key in ESTIMATE_FIELDS}
+        fit_data[model][FIT_EVALUATIONS] = fit.evaluations
+        fit_data[model][EXCLUDED_DATAPOINTS] = fit.excluded
+        fit_data[model][EXCLUSION_CANDIDATES] = fit.exclusion_candidates
+        fit_data[model][FIT_R2] = fit.r_squared
+        if fit.skipped:
+            fit_data[model][FIT_SKIPPED] = True
+        if not np.isnan(fit.aicc):
+            fit_data[MODEL_SELECTION][AICC_SCORES][model] = fit.aicc
+        if not np.isnan(fit.f_test_p):
+            fit_data[MODEL_SELECTION][F_TEST_P_VALUES][model] = fit.f_test_p
+
+    return signals[0], signals[1], fit_data
+
+
+def to_pipeline_estimate(estimate):
+    output = {key: getattr(estimate, field) for key, field in ESTIMATE_FIELDS.items()}
+    output.update({key: getattr(estimate, field) for key, field in BOOTSTRAP_FIELDS.items()
+                   if not np.isnan(getattr(estimate, field))})
+    return output
@@ -0,0 +1,18 @@
+import os
+import uuid
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_output(path):
+    # yields a temporary path in the same directory; the complete file is moved to path in one step, so a crash or an
+    # error while writing never leaves a partial file at path
+    # the temporary name starts with a dot so that parquet readers and the watch mode ignore it
+    directory, name = os.path.split(os.path.abspath(path))
+    temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
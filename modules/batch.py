@@ -0,0 +1,197 @@
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from modules.constants import *
+
+
+def read_manifest(manifest_path):
+    extension = os.path.splitext(manifest_path)[1].lower()
+    if extension == ".csv":
+        with open(manifest_path, newline="") as f:
+            entries = list(csv.DictReader(f))
+    elif extension == ".json":
+        with open(manifest_path) as f:
+            entries = json.load(f)
+        if isinstance(entries, dict):
+            entries = entries.get(MANIFEST_DATASETS, [])
+    elif extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            raise ImportError("Reading TOML manifests requires Python 3.11+, use a CSV or JSON manifest instead")
+        with open(manifest_path, "rb") as f:
+            entries = tomllib.load(f).get(MANIFEST_DATASETS, [])
+    else:
+        raise ValueError(f"Unsupported manifest format '{extension}', expected .csv, .json or .toml")
+
+    # relative dataset paths are resolved against the directory containing the manifest
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    return [create_dataset_info(entry, manifest_dir) for entry in entries]
+
+
+def create_dataset_info(entry, base_dir="."):
+    # empty manifest cells fall back to the same defaults used by the interactive prompts
+    entry = {key.strip().lower(): value for key, value in entry.items() if value not in (None, "")}
+    if MANIFEST_PATH not in entry:
+        raise ValueError(f"Manifest entry is missing '{MANIFEST_PATH}': {entry}")
+
+    output = {PATH: os.path.join(base_dir, os.path.expanduser(str(entry[MANIFEST_PATH]))),
+              PLATE_FORMAT: COLUMN_PLATE_FORMAT,
+              MAX_CONC: float(entry.get(MANIFEST_MAX_CONC, DEFAULT_MAX_CONC)),
+              CONC_REVERSE: False,
+              DIL_FACTOR: int(entry.get(MANIFEST_DIL_FACTOR, DEFAULT_DIL_FACTOR))}
+
+    direction = str(entry.get(MANIFEST_DIRECTION, "decreasing")).strip().lower()
+    if direction.startswith("i"):
+        output[CONC_REVERSE] = True
+    elif not direction.startswith("d"):
+        raise ValueError(f"Invalid direction '{direction}', expected 'decreasing' or 'increasing'")
+
+    outlier_search = str(entry.get(MANIFEST_OUTLIER_SEARCH, OUTLIER_SEARCH_ON_FAILURE)).strip().lower()
+    if outlier_search not in (OUTLIER_SEARCH_OFF, OUTLIER_SEARCH_ON_FAILURE, OUTLIER_SEARCH_ALWAYS):
+        raise ValueError(f"Invalid outlier search '{outlier_search}', expected '{OUTLIER_SEARCH_OFF}', "
+                         f"'{OUTLIER_SEARCH_ON_FAILURE}' or '{OUTLIER_SEARCH_ALWAYS}'")
+    output[OUTLIER_SEARCH] = outlier_search
+    output[MAX_EXCLUDED] = int(entry.get(MANIFEST_MAX_EXCLUDED, 1))
+    output[EXCLUSION_CRITERION] = str(entry.get(MANIFEST_EXCLUSION_CRITERION, AICC)).strip().lower()
+    if output[EXCLUSION_CRITERION] not in EXCLUSION_CRITERIA:
+        raise ValueError(f"Invalid exclusion criterion '{output[EXCLUSION_CRITERION]}', expected '{AICC}' or "
+                         f"'{RESIDUAL}'")
+
+    if MANIFEST_PLATES_PER_DATASET in entry:
+        output[PLATES_PER_DATASET] = int(entry[MANIFEST_PLATES_PER_DATASET])
+        if output[PLATES_PER_DATASET] < 1:
+            raise ValueError(f"Invalid plates per dataset {output[PLATES_PER_DATASET]}, expected at least 1")
+
+    # the quadratic and cooperative models are only fitted when the simple model leaves something to explain
+    if MANIFEST_SKIP_MODELS_R2 in entry:
+        output[SKIP_MODELS_R2] = float(entry[MANIFEST_SKIP_MODELS_R2])
+        if not 0 < output[SKIP_MODELS_R2] <= 1:
+            raise ValueError(f"Invalid skip models R squared {output[SKIP_MODELS_R2]}, expected a value in (0, 1]")
+    output[FIT_WORKERS] = max(int(entry.get(MANIFEST_FIT_WORKERS, 1)), 1)
+
+    # bootstrap intervals are only computed when a number of resamples is given
+    output[BOOTSTRAP_SAMPLES] = int(entry.get(MANIFEST_BOOTSTRAP_SAMPLES, 0))
+    if output[BOOTSTRAP_SAMPLES] < 0:
+        raise ValueError(f"Invalid bootstrap samples {output[BOOTSTRAP_SAMPLES]}, expected 0 or more")
+    output[BOOTSTRAP_SEED] = int(entry.get(MANIFEST_BOOTSTRAP_SEED, DEFAULT_BOOTSTRAP_SEED))
+    output[BOOTSTRAP_WORKERS] = max(int(entry.get(MANIFEST_BOOTSTRAP_WORKERS, 1)), 1)
+
+    output[CURVE_STEP_RATIO] = float(entry.get(MANIFEST_CURVE_STEP_RATIO, DEFAULT_CURVE_STEP_RATIO))
+    if not 0 < output[CURVE_STEP_RATIO] < 1:
+        raise ValueError(f"Invalid curve step ratio {output[CURVE_STEP_RATIO]}, expected a value between 0 and 1")
+
+    output[LOW_MEMORY_OUTPUT] = str(entry.get(MANIFEST_LOW_MEMORY, "")).strip().lower() in ("1", "true", "yes", "y")
+
+    output[OUTPUT_FORMATS] = parse_output_formats(entry.get(MANIFEST_OUTPUT, XLSX_OUTPUT))
+    if MANIFEST_COLUMNAR_PATH in entry:
+        output[COLUMNAR_PATH] = os.path.join(base_dir, os.path.expanduser(str(entry[MANIFEST_COLUMNAR_PATH])))
+
+    plate_format = str(entry.get(MANIFEST_PLATE_FORMAT, "column")).strip().lower()
+    if plate_format.startswith("r"):
+        output[PLATE_FORMAT] = ROW_PLATE_FORMAT
+    elif not plate_format.startswith("c"):
+        raise ValueError(f"Invalid plate format '{plate_format}', expected 'column' or 'row'")
+
+    return output
+
+
+def parse_output_formats(value):
+    # output formats are separated by "+", "," or whitespace, e.g. "xlsx+parquet"
+    formats = [output_format for output_format in re.split(r"[+,\s]+", str(value).strip().lower()) if output_format]
+    for output_format in formats:
+        if output_format not in (XLSX_OUTPUT, PARQUET_OUTPUT):
+            raise ValueError(f"Invalid output format '{output_format}', expected '{XLSX_OUTPUT}' or '{PARQUET_OUTPUT}'")
+    return formats
+
+
+def run_batch(datasets, process, workers=None, on_result=None):
+    # each dataset runs in its own process so one bad plate cannot stop the rest of the batch
+    # on_result is called with the result of each dataset as soon as it finishes
+    # datasets can also be a generator: at most 2 * workers datasets are submitted ahead of the running ones, so
+    # datasets are processed while later ones are still being read and memory stays bounded
+    workers = workers or os.cpu_count() or 1
+    results = {}
+    running = {}
+
+    def collect(futures):
+        for future in futures:
+            i, dataset_info = running.pop(future)
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # the worker itself died (e.g. killed by the OS), record it like any other failure
+                results[i] = {PATH: dataset_info[PATH], BATCH_STATUS: BATCH_FAILED,
+                              BATCH_ERROR: f"{type(e).__name__}: {e}", BATCH_TIME: 0.0, BATCH_INGEST_TIME: 0.0,
+                              JOURNAL_KEY: dataset_info.get(JOURNAL_KEY)}
+            print_dataset_result(results[i])
+            if on_result:
+                on_result(results[i])
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for i, dataset_info in enumerate(datasets):
+            running[executor.submit(run_dataset, process, dataset_info)] = (i, dataset_info)
+            if len(running) >= 2 * workers:
+                collect(wait(list(running), return_when=FIRST_COMPLETED)[0])
+        collect(wait(list(running))[0])
+
+    return [results[i] for i in sorted(results)]
+
+
+def shutdown_executor(executor):
+    # jobs that have not started are cancelled; Python 3.8 has no cancel_futures and waits for them to run
+    if sys.version_info >= (3, 9):
+        executor.shutdown(cancel_futures=True)
+    else:
+        executor.shutdown()
+
+
+def run_dataset(process, dataset_info):
+    start = time.perf_counter()
+    if dataset_info.get(DATASET_ERROR):
+        # datasets that could not be read are reported like any other failure
+        status, error = BATCH_FAILED, dataset_info[DATASET_ERROR]
+    else:
+        try:
+            process(dataset_info)
+            status, error = BATCH_OK, None
+        except Exception as e:
+            status, error = BATCH_FAILED, f"{type(e).__name__}: {e}"
+
+    path = dataset_info[PATH]
+    if dataset_info.get(DATASET_NAME):
+        path = f"{path} [{dataset_info[DATASET_NAME]}]"
+    return {PATH: path, BATCH_STATUS: status, BATCH_ERROR: error,
+            BATCH_TIME: time.perf_counter() - start,
+            BATCH_INGEST_TIME: sum(dataset_info.get(INGEST_TIMES, {}).values()),
+            CACHE_STATS: dataset_info.get(CACHE_STATS),
+            RESULTS_INDEX: dataset_info.get(RESULTS_INDEX), INDEX_RECORDS: dataset_info.get(INDEX_RECORDS),
+            JOURNAL_KEY: dataset_info.get(JOURNAL_KEY), OUTPUT_FILES: dataset_info.get(OUTPUT_FILES)}
+
+
+def print_dataset_result(result):
+    line = f"[{result[BATCH_STATUS]}] {result[PATH]} ({result[BATCH_TIME]:.2f} s, " \
+           f"ingest {result[BATCH_INGEST_TIME] * 1000:.1f} ms)"
+    if result[BATCH_ERROR]:
+        line += f": {result[BATCH_ERROR]}"
+    print(line)
+
+
+def print_batch_report(results, wall_time):
+    failed = [result for result in results if result[BATCH_STATUS] != BATCH_OK]
+    print(f"\n{'*' * 50}\n")
+    print(f"Processed {len(results)} dataset(s): {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    for result in failed:
+        print(f"  failed: {result[PATH]}: {result[BATCH_ERROR]}")
+    print(f"Total ingest time: {sum(result[BATCH_INGEST_TIME] for result in results):.2f} s")
+    cache_stats = [result[CACHE_STATS] for result in results if result.get(CACHE_STATS)]
+    if cache_stats:
+        print(f"Cache: {sum(stats[CACHE_HITS] for stats in cache_stats)} hit(s), "
+              f"{sum(stats[CACHE_MISSES] for stats in cache_stats)} miss(es), "
+              f"{sum(stats[CACHE_EVICTIONS] for stats in cache_stats)} eviction(s)")
+    print(f"Total wall time: {wall_time:.2f} s")
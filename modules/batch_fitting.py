@@ -0,0 +1,156 @@
+from modules.curve_fitting import *
+
+
+def fit_curves(x_data, y_data, model, weights=None, p0=None, df=None, max_iterations=100):
+    # fits N curves at once, x_data is shared (M,) or per curve (N, M) and y_data is (N, M)
+    # returns the same structure as fit_curve with arrays of length N in place of single values
+    y_data = np.atleast_2d(np.asarray(y_data, dtype=np.float64))
+    x_data = np.broadcast_to(np.asarray(x_data, dtype=np.float64), y_data.shape)
+    weights = np.ones(y_data.shape) if weights is None else np.broadcast_to(weights, y_data.shape)
+    if p0 is None:
+        p0 = estimate_initial_parameters_batch(model, x_data, y_data, weights)
+
+    popt, pcov, converged, evaluations, ssr = solve_levenberg_marquardt(model, x_data, y_data, weights, p0,
+                                                                         max_iterations)
+
+    if df is None:
+        df = np.count_nonzero(weights, axis=1) - 1
+    if model == hill_equation:
+        df = df - 1
+
+    perr = np.sqrt(np.diagonal(pcov, axis1=1, axis2=2))
+    result_dict = {KD: create_parameter_statistics(popt[:, 0], perr[:, 0], df, converged)}
+    if model == hill_equation:
+        result_dict[NH] = create_parameter_statistics(popt[:, 1], perr[:, 1], df, converged)
+    result_dict[FIT_EVALUATIONS] = evaluations
+    result_dict[FIT_SSR] = np.where(converged, ssr, np.nan)
+
+    return result_dict
+
+
+def create_parameter_statistics(param, perr, df, converged):
+    with np.errstate(invalid="ignore"):
+        conf_int_low, conf_int_hi, std_dev, std_err = calculate_statistics_from_fit(param, perr, df)
+
+    # failed fits get the same placeholder value used by fit_curve
+    output = {PARAMETER: param, CONF_INT_LOWER: conf_int_low, CONF_INT_UPPER: conf_int_hi,
+              STD_DEV: std_dev, STD_ERR: std_err}
+    return {key: np.where(converged, np.broadcast_to(value, converged.shape), 999) for key, value in output.items()}
+
+
+def solve_levenberg_marquardt(model, x_data, y_data, weights, p0, max_iterations=100, tolerance=1e-10):
+    # every curve has its own damping factor and stops updating once converged
+    # KD is solved as log10(KD) like fit_model, the returned parameters and covariance are in linear space
+    jacobian = MODEL_JACOBIANS[model]
+    num_curves, num_params = p0.shape
+    log_x = np.where(weights > 0, np.log10(x_data), np.nan)
+    lower_bound = np.nanmin(log_x, axis=1) - KD_SEARCH_DECADES
+    upper_bound = np.nanmax(log_x, axis=1) + KD_SEARCH_DECADES
+
+    params = np.array(p0, dtype=np.float64)
+    params[:, 0] = np.clip(np.log10(params[:, 0]), lower_bound, upper_bound)
+    damping = np.full(num_curves, 1e-3)
+    active = np.ones(num_curves, dtype=bool)
+    converged = np.zeros(num_curves, dtype=bool)
+    evaluations = np.ones(num_curves, dtype=np.int64)
+
+    residuals, jac = evaluate_weighted_model(model, jacobian, x_data, y_data, weights, params)
+    ssr = np.sum(residuals ** 2, axis=1)
+    with np.errstate(all="ignore"):
+        for _ in range(max_iterations):
+            if not np.any(active):
+                break
+
+            # Levenberg-Marquardt step with Marquardt scaling of the normal equations
+            jtj = np.einsum("nmp,nmq->npq", jac, jac)
+            jtr = np.einsum("nmp,nm->np", jac, residuals)
+            diagonal = np.diagonal(jtj, axis1=1, axis2=2)
+            augmented = jtj + (damping[:, None] * np.maximum(diagonal, 1e-12))[:, :, None] * np.eye(num_params)
+            augmented[~active] = np.eye(num_params)
+            step = np.linalg.solve(augmented, jtr[:, :, None])[:, :, 0]
+
+            trial = params + step
+            trial[:, 0] = np.clip(trial[:, 0], lower_bound, upper_bound)
+            trial_residuals, trial_jac = evaluate_weighted_model(model, jacobian, x_data, y_data, weights, trial)
+            trial_ssr = np.sum(trial_residuals ** 2, axis=1)
+            evaluations += active
+
+            improved = active & np.isfinite(trial_ssr) & (trial_ssr <= ssr)
+            small_change = (np.abs(ssr - trial_ssr) <= tolerance * np.maximum(ssr, 1e-30)) | \
+                           (np.max(np.abs(step), axis=1) <= tolerance * (1 + np.max(np.abs(params), axis=1)))
+
+            params[improved] = trial[improved]
+            residuals[improved] = trial_residuals[improved]
+            jac[improved] = trial_jac[improved]
+            ssr[improved] = trial_ssr[improved]
+            damping = np.where(improved, damping / 10, damping * 10)
+
+            newly_converged = active & ((improved & small_change) | ((damping > 1e12) & np.isfinite(ssr)))
+            converged |= newly_converged
+            active &= ~newly_converged
+
+        # covariance is scaled by the residual variance as curve_fit does
+        num_points = np.count_nonzero(weights, axis=1)
+        residual_variance = ssr / np.maximum(num_points - num_params, 1)
+        pcov = np.linalg.pinv(np.einsum("nmp,nmq->npq", jac, jac)) * residual_variance[:, None, None]
+
+    params[:, 0] = 10 ** params[:, 0]
+    scale = np.ones((num_curves, num_params))
+    scale[:, 0] = params[:, 0] * np.log(10)
+    pcov = pcov * scale[:, :, None] * scale[:, None, :]
+
+    converged &= np.all(np.isfinite(params), axis=1) & np.all(np.isfinite(pcov), axis=(1, 2))
+    return params, pcov, converged, evaluations, ssr
+
+
+def evaluate_weighted_model(model, jacobian, x_data, y_data, weights, params):
+    kd = (10 ** params[:, 0])[:, None]
+    other_params = [params[:, i][:, None] for i in range(1, params.shape[1])]
+    residuals = weights * (y_data - model(x_data, kd, *other_params))
+    jac = jacobian(x_data, kd, *other_params) * weights[:, :, None]
+    jac[:, :, 0] *= kd * np.log(10)
+    # masked points must not contribute NaN from model evaluations outside their domain
+    return np.where(weights > 0, residuals, 0), np.where(weights[:, :, None] > 0, jac, 0)
+
+
+def estimate_initial_parameters_batch(model, x_data, y_data, weights):
+    # vectorized equivalent of estimate_initial_parameters, masked points are ignored for the signal range and nH
+    order = np.argsort(x_data, axis=1)
+    x_data = np.take_along_axis(x_data, order, axis=1)
+    y_data = np.take_along_axis(y_data, order, axis=1)
+    used = np.take_along_axis(weights, order, axis=1) > 0
+    log_x = np.log10(x_data)
+
+    y_min = np.min(np.where(used, y_data, np.inf), axis=1, keepdims=True)
+    y_max = np.max(np.where(used, y_data, -np.inf), axis=1, keepdims=True)
+    span = np.where(y_max > y_min, y_max - y_min, 1)
+    fraction = (y_data - y_min) / span
+
+    # half-maximum crossing, interpolated on a log scale; curves without a crossing start mid-range
+    above = fraction >= 0.5
+    crossings = above[:, 1:] != above[:, :-1]
+    j = np.argmax(crossings, axis=1)[:, None]
+    x0, x1 = np.take_along_axis(log_x, j, axis=1)[:, 0], np.take_along_axis(log_x, j + 1, axis=1)[:, 0]
+    f0, f1 = np.take_along_axis(fraction, j, axis=1)[:, 0], np.take_along_axis(fraction, j + 1, axis=1)[:, 0]
+    with np.errstate(all="ignore"):
+        kd = np.where(np.any(crossings, axis=1) & (f1 != f0), x0 + (0.5 - f0) * (x1 - x0) / (f1 - f0),
+                      (log_x[:, 0] + log_x[:, -1]) / 2)
+    kd = 10 ** kd
+
+    if model == hill_equation:
+        # least squares slope of logit(signal) vs. ln(concentration) over the transition region of each curve
+        transition = used & (fraction > 0.05) & (fraction < 0.95)
+        count = np.count_nonzero(transition, axis=1)
+        with np.errstate(all="ignore"):
+            u = np.where(transition, np.log(x_data), 0)
+            v = np.where(transition, np.log(fraction / (1 - fraction)), 0)
+            u_mean = np.sum(u, axis=1) / count
+            v_mean = np.sum(v, axis=1) / count
+            du = np.where(transition, u - u_mean[:, None], 0)
+            dv = np.where(transition, v - v_mean[:, None], 0)
+            slope = np.sum(du * dv, axis=1) / np.sum(du ** 2, axis=1)
+        slope = np.where((count >= 2) & np.isfinite(slope), np.clip(slope, 0.2, 10), 1.0)
+        return np.stack((kd, slope), axis=-1)
+    if model == quadratic_model_equation:
+        return np.stack((kd, np.ones(len(kd))), axis=-1)
+    return kd[:, None]
@@ -0,0 +1,76 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.batch_fitting import *
+
+
+def add_bootstrap_intervals(signal_data, fit_results, num_samples, seed=DEFAULT_BOOTSTRAP_SEED, workers=1,
+                            confidence=BOOTSTRAP_CONFIDENCE):
+    # percentile intervals of KD and nH from fits to resampled replicates, added next to the intervals of each fit
+    # models that were skipped or did not converge get no bootstrap interval
+    models = [model for model in MODEL_FIT_ORDER if model in fit_results and fit_results[model].get(FIT_POPT)]
+    if not models or num_samples < 1:
+        return fit_results
+
+    bootstrap_params = bootstrap_fits(signal_data, {model: fit_results[model] for model in models}, num_samples,
+                                      seed, workers)
+    tail = (1 - confidence) / 2 * 100
+    for model in models:
+        params, converged = bootstrap_params[model]
+        fit_results[model][BOOTSTRAP_CONVERGED] = int(np.count_nonzero(converged))
+        for index, param in enumerate(param for param in FIT_PARAMETERS if param in fit_results[model]):
+            if converged.any():
+                lower, upper = np.percentile(params[converged, index], [tail, 100 - tail])
+            else:
+                lower, upper = np.nan, np.nan
+            fit_results[model][param][BOOTSTRAP_CI_LOWER] = float(lower)
+            fit_results[model][param][BOOTSTRAP_CI_UPPER] = float(upper)
+
+    return fit_results
+
+
+def bootstrap_fits(signal_data, fit_results, num_samples, seed=DEFAULT_BOOTSTRAP_SEED, workers=1):
+    # every chunk of resamples has its own child seed, so the samples are the same for any number of workers
+    # returns {model: (parameters of shape (num_samples, num_params), converged)}
+    values = np.asarray(signal_data[SIGNAL_VALUES], dtype=np.float64)
+    x_data = np.asarray(signal_data[CONC], dtype=np.float64)
+    chunk_sizes = [min(BOOTSTRAP_CHUNK_SIZE, num_samples - start)
+                   for start in range(0, num_samples, BOOTSTRAP_CHUNK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+    # the resamples start from the parameters of the fit to all replicates and exclude the same datapoints
+    starts = {model: (fit[FIT_POPT], fit[EXCLUDED_DATAPOINTS]) for model, fit in fit_results.items()}
+    tasks = [(values, x_data, starts, chunk_seed, size) for chunk_seed, size in zip(seeds, chunk_sizes)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            chunks = list(executor.map(fit_bootstrap_chunk, *zip(*tasks)))
+    else:
+        chunks = [fit_bootstrap_chunk(*task) for task in tasks]
+
+    return {model: (np.concatenate([chunk[model][0] for chunk in chunks]),
+                    np.concatenate([chunk[model][1] for chunk in chunks])) for model in fit_results}
+
+
+def fit_bootstrap_chunk(values, x_data, starts, seed, num_samples):
+    y_data = resample_replicates(values, np.random.default_rng(seed), num_samples)
+
+    results = {}
+    for model, (popt, excluded) in starts.items():
+        weights = np.ones(y_data.shape)
+        weights[:, list(excluded)] = 0
+        x_batch = np.broadcast_to(x_data, y_data.shape)
+        p0 = np.tile(popt, (num_samples, 1))
+        params, _, converged, _, _ = solve_levenberg_marquardt(MODEL_EQUATIONS[model], x_batch, y_data, weights, p0)
+        results[model] = (params, converged)
+    return results
+
+
+def resample_replicates(values, rng, num_samples):
+    # values has shape (replicates, datapoints); each resample averages as many replicates drawn with replacement and
+    # is normalized to its own minimum and maximum like the averages of the pipeline
+    num_repeats = values.shape[0]
+    indices = rng.integers(0, num_repeats, size=(num_samples, num_repeats))
+    averages = values[indices].mean(axis=1)
+    minimum = averages.min(axis=1, keepdims=True)
+    maximum = averages.max(axis=1, keepdims=True)
+    with np.errstate(all="ignore"):
+        return (averages - minimum) / (maximum - minimum)
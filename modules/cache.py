@@ -0,0 +1,109 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+
+from modules.atomic import atomic_output
+from modules.constants import *
+
+# parameters that change the computed results, and therefore the cache key
+CACHE_KEY_PARAMETERS = [MAX_CONC, DIL_FACTOR, CONC_REVERSE, PLATE_FORMAT, OUTLIER_SEARCH, MAX_EXCLUDED,
+                        EXCLUSION_CRITERION, SKIP_MODELS_R2, BOOTSTRAP_SAMPLES, BOOTSTRAP_SEED, CURVE_STEP_RATIO,
+                        DATASET_NAME]
+
+_code_version = None
+
+
+class ResultCache:
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key):
+        entry_path = self.entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                entry = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+
+        # the modification time is used as the last access time for LRU eviction
+        os.utime(entry_path)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        # entries are written to a temporary file first so concurrent readers never see a partial entry
+        with atomic_output(self.entry_path(key)) as temp_path:
+            with open(temp_path, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.evict()
+
+    def evict(self):
+        # remove least recently used entries until the cache fits in max_size
+        entries = []
+        for entry_path in glob.glob(os.path.join(self.cache_dir, "*.pkl")):
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry_path)
+                self.evictions += 1
+            except OSError:
+                pass
+            total_size -= size
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def stats(self):
+        return {CACHE_HITS: self.hits, CACHE_MISSES: self.misses, CACHE_EVICTIONS: self.evictions}
+
+
+def create_cache_key(dataset_info, file_paths):
+    digest = hashlib.sha256()
+    digest.update(get_code_version().encode())
+    parameters = {key: dataset_info.get(key) for key in CACHE_KEY_PARAMETERS}
+    digest.update(json.dumps(parameters, sort_keys=True, default=str).encode())
+
+    # datasets extracted from a plate layout are identified by their wells rather than by whole files
+    if dataset_info.get(PLATES) is not None:
+        for plate in dataset_info[PLATES]:
+            digest.update(np.ascontiguousarray(plate).tobytes())
+        return digest.hexdigest()
+
+    # file names are relative so that moving a dataset directory does not invalidate it
+    for file_path in file_paths:
+        digest.update(os.path.relpath(file_path, dataset_info[PATH]).encode())
+        with open(file_path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+
+    return digest.hexdigest()
+
+
+def get_code_version():
+    # hash of the program's source, so that results are recomputed after the code changes
+    global _code_version
+    if _code_version is None:
+        digest = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        source_files = sorted(glob.glob(os.path.join(package_dir, "*.py")) +
+                              glob.glob(os.path.join(package_dir, "modules", "*.py")))
+        for source_file in source_files:
+            with open(source_file, "rb") as f:
+                digest.update(f.read())
+        _code_version = digest.hexdigest()
+    return _code_version
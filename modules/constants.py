@@ -13,6 +13,14 @@ DIL_FACTOR = "Dilution factor"
 DEFAULT_COL_NUM = 6
 CHART_COL_WIDTH = 6
 CHART_ROW_HEIGHT = 27
+INGEST_TIMES = "Ingest time per file (s)"
+DATASET_NAME = "Dataset name"
+PLATES = "Plates"
+PLATES_PER_DATASET = "Plates per dataset"
+DATASET_ERROR = "Dataset error"
+SIGNALS = "Signals"
+OUTPUT_FILES = "Output files"
+JOURNAL_KEY = "Journal key"
 
 # constant names for replicate number and dataset length
 NUM_REPEATS = "Number of replicates"
@@ -51,12 +59,79 @@ def hill_equation(lt, ec50, hill_slope):
 
 MODEL_EQUATIONS = {COOPERATIVE_MODEL: hill_equation, SIMPLE_MODEL: simple_model_equation,
                    QUADRATIC_MODEL: quadratic_model_equation}
+
+
+# partial derivatives of each model with respect to its parameters, one column per parameter
+def simple_model_jacobian(lt, kd):
+    return np.stack((-lt / ((kd + lt) ** 2),), axis=-1)
+
+
+def quadratic_model_jacobian(lt, kd, rt=1):
+    s = rt + lt + kd
+    d = np.sqrt((s ** 2) - (4 * rt * lt))
+    free_lt = lt - ((s - d) / 2)
+    dfree_dkd = -(1 - (s / d)) / 2
+    dfree_drt = -(1 - ((s - (2 * lt)) / d)) / 2
+    denominator = (kd + free_lt) ** 2
+    return np.stack(((kd * dfree_dkd - free_lt) / denominator, (kd * dfree_drt) / denominator), axis=-1)
+
+
+def hill_jacobian(lt, ec50, hill_slope):
+    y = hill_equation(lt, ec50, hill_slope)
+    return np.stack((-y * (1 - y) * hill_slope / ec50, y * (1 - y) * np.log(lt / ec50)), axis=-1)
+
+
+MODEL_JACOBIANS = {hill_equation: hill_jacobian, simple_model_equation: simple_model_jacobian,
+                   quadratic_model_equation: quadratic_model_jacobian}
 KD = "KD (nM)"
 NH = "nH"
 CONF_INT_LOWER = "CI lower bound"
 CONF_INT_UPPER = "CI upper bound"
 STD_DEV_FIT = "Std deviation"
 STD_ERR_FIT = "Std error"
+FIT_PARAMETERS = [KD, NH]
+FIT_EVALUATIONS = "Function evaluations"
+KD_SEARCH_DECADES = 4
+KD_BOUND_MARGIN = 0.01  # decades, a KD closer than this to the limits of the search stopped there
+FIT_MAX_EVALUATIONS = 2000
+FIT_SSR = "Sum of squared residuals"
+FIT_R2 = "R squared"
+FIT_POPT = "Fitted parameters"
+FIT_SKIPPED = "Skipped"
+OUTLIER_SEARCH = "Outlier search"
+OUTLIER_SEARCH_OFF = "off"
+OUTLIER_SEARCH_ON_FAILURE = "on failure"
+OUTLIER_SEARCH_ALWAYS = "always"
+MAX_EXCLUDED = "Maximum excluded datapoints"
+EXCLUSION_CRITERION = "Exclusion criterion"
+AICC = "aicc"
+RESIDUAL = "residual"
+EXCLUDED_DATAPOINTS = "Excluded datapoints"
+EXCLUSION_CANDIDATES = "Exclusion candidates"
+EXCLUSION_CRITERIA = [AICC, RESIDUAL]
+OUTLIER_ALPHA = 0.05
+
+# constant names for model selection
+MODEL_FIT_ORDER = [SIMPLE_MODEL, QUADRATIC_MODEL, COOPERATIVE_MODEL]  # cheapest first
+MODEL_SELECTION = "Model selection"
+PREFERRED_MODEL = "Preferred model"
+SELECTION_MODEL = "Model"
+AICC_SCORES = "AICc"
+F_TEST_P_VALUES = "F-test p-value"
+F_TEST_ALPHA = 0.05
+SKIP_MODELS_R2 = "Skip models above R squared"
+FIT_WORKERS = "Fit workers"
+
+# constant names for bootstrap confidence intervals
+BOOTSTRAP_SAMPLES = "Bootstrap samples"
+BOOTSTRAP_SEED = "Bootstrap seed"
+BOOTSTRAP_WORKERS = "Bootstrap workers"
+BOOTSTRAP_CI_LOWER = "Bootstrap CI lower bound"
+BOOTSTRAP_CI_UPPER = "Bootstrap CI upper bound"
+BOOTSTRAP_CONVERGED = "Bootstrap fits converged"
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_CHUNK_SIZE = 250  # resamples per seed and per task, so results do not depend on the number of workers
+DEFAULT_BOOTSTRAP_SEED = 0
 
 # constant names related to output file
 WS_NAME = "Data"
@@ -66,3 +141,76 @@ VALUE = "Value"
 HELPER_X = "Helper x"
 HELPER_Y = "Helper y"
 HELPER_LABEL = "Helper label"
+CURVE_STEP_RATIO = "Curve step ratio"
+DEFAULT_CURVE_STEP_RATIO = 0.9
+LOW_MEMORY_OUTPUT = "Low memory output"
+
+# constant names related to output formats
+OUTPUT_FORMATS = "Output formats"
+XLSX_OUTPUT = "xlsx"
+PARQUET_OUTPUT = "parquet"
+COLUMNAR_PATH = "Columnar output directory"
+SIGNAL_TABLE = "signal"
+FIT_TABLE = "fits"
+CURVE_TABLE = "curves"
+DATASET_TABLE = "datasets"
+
+# constant names for the result cache
+CACHE_DIR = "Cache directory"
+CACHE_SIZE = "Cache size (bytes)"
+DEFAULT_CACHE_SIZE = 500_000_000
+CACHED_RESULTS = "Results"
+CACHED_OUTPUTS = "Outputs"
+CACHE_STATS = "Cache statistics"
+CACHE_HITS = "Hits"
+CACHE_MISSES = "Misses"
+CACHE_EVICTIONS = "Evictions"
+
+# constant names for instrumentation
+METRICS = "Metrics"
+METRICS_DIR = "Metrics directory"
+METRICS_PROFILE = "Profile"
+METRICS_TRACE_MEMORY = "Trace memory"
+METRICS_FILE = "Metrics file"
+METRICS_TOP_ENTRIES = 25
+
+# constant names for the results index
+RESULTS_INDEX = "Results index"
+INDEX_RECORDS = "Index records"
+INDEX_TIMEOUT = 60  # seconds a writer waits for another one to finish
+
+# constant names for the analysis service
+DEFAULT_SERVICE_HOST = "127.0.0.1"
+DEFAULT_SERVICE_PORT = 8765
+SERVICE_MAX_REQUEST_BYTES = 50_000_000
+SERVICE_REQUEST_TIMEOUT = 300  # seconds
+SERVICE_LATENCY_WINDOW = 10_000  # latest requests kept for the latency percentiles
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# constant names for batch processing
+MANIFEST_DATASETS = "dataset"
+DATASET_PARAMETERS_FILE = "dataset.json"
+MANIFEST_PATH = "path"
+MANIFEST_MAX_CONC = "max_conc"
+MANIFEST_DIRECTION = "direction"
+MANIFEST_PLATE_FORMAT = "plate_format"
+MANIFEST_DIL_FACTOR = "dilution_factor"
+MANIFEST_OUTLIER_SEARCH = "outlier_search"
+MANIFEST_MAX_EXCLUDED = "max_excluded"
+MANIFEST_EXCLUSION_CRITERION = "exclusion_criterion"
+MANIFEST_LOW_MEMORY = "low_memory"
+MANIFEST_OUTPUT = "output"
+MANIFEST_COLUMNAR_PATH = "columnar_path"
+MANIFEST_CURVE_STEP_RATIO = "curve_step_ratio"
+MANIFEST_PLATES_PER_DATASET = "plates_per_dataset"
+MANIFEST_SKIP_MODELS_R2 = "skip_models_r2"
+MANIFEST_FIT_WORKERS = "fit_workers"
+MANIFEST_BOOTSTRAP_SAMPLES = "bootstrap_samples"
+MANIFEST_BOOTSTRAP_SEED = "bootstrap_seed"
+MANIFEST_BOOTSTRAP_WORKERS = "bootstrap_workers"
+BATCH_STATUS = "Status"
+BATCH_ERROR = "Error"
+BATCH_TIME = "Time (s)"
+BATCH_INGEST_TIME = "Ingest time (s)"
+BATCH_OK = "OK"
+BATCH_FAILED = "FAILED"
@@ -1,66 +1,381 @@
-from scipy.optimize import curve_fit
-from scipy.stats import t
+import itertools
+import logging
+from concurrent.futures import ThreadPoolExecutor
 
 from modules.constants import *
 
+logger = logging.getLogger(__name__)
 
-def fit_curve(data, model, remove_index=0):
-    x_data = np.array(data[CONC])
-    y_data = np.array(data[STATS][AVERAGE_SIGNAL])
-    df = count_dps(data) - 1
 
-    # Check if there are data points left
-    if remove_index < len(x_data):
-        # Remove the specified data point
-        x_data = np.delete(x_data, remove_index)
-        y_data = np.delete(y_data, remove_index)
+def fit_models(data, outlier_search=OUTLIER_SEARCH_ON_FAILURE, max_excluded=1, criterion=AICC, skip_r2=None,
+               workers=1):
+    # fits every model to the same precomputed inputs and adds the model comparison under MODEL_SELECTION
+    # with skip_r2, the simple model is fitted first and the other models are skipped if its R squared reaches skip_r2
+    inputs = prepare_fit_inputs(data)
+    fit_options = {"outlier_search": outlier_search, "max_excluded": max_excluded, "criterion": criterion,
+                   "inputs": inputs}
+    fit_results = {}
+    pending = list(MODEL_FIT_ORDER)
+    if skip_r2 is not None:
+        model = pending.pop(0)
+        fit_results[model] = fit_curve(data, MODEL_EQUATIONS[model], **fit_options)
+        if fit_results[model][FIT_R2] >= skip_r2:
+            fit_results.update({model: create_skipped_result(model) for model in pending})
+            pending = []
 
-        try:
-            popt, pcov = curve_fit(model, x_data, y_data)
-            kd = popt[0]
-
-            if model == hill_equation:
-                df -= 1
-                nH = popt[1]
-                conf_int_low, conf_int_hi, std_dev, std_err, conf_int_low_nH, conf_int_hi_nH, std_dev_nh, std_err_nh \
-                    = calculate_statistics_from_fit_nh(
-                    kd,
-                    nH,
-                    pcov,
-                    df)
-                result_dict = {KD: {PARAMETER: kd, CONF_INT_LOWER: conf_int_low, CONF_INT_UPPER: conf_int_hi,
-                                    STD_DEV: std_dev, STD_ERR: std_err},
-                               NH: {PARAMETER: nH, CONF_INT_LOWER: conf_int_low_nH, CONF_INT_UPPER: conf_int_hi_nH,
-                                    STD_DEV: std_dev_nh, STD_ERR: std_err_nh}}
-            else:
-                conf_int_low, conf_int_hi, std_dev, std_err = calculate_statistics_from_fit(kd,
-                                                                                            np.sqrt(np.diag(pcov))[0],
-                                                                                            df)
-                result_dict = {KD: {PARAMETER: kd, CONF_INT_LOWER: conf_int_low, CONF_INT_UPPER: conf_int_hi,
-                                    STD_DEV: std_dev, STD_ERR: std_err}}
-
-        except RuntimeError:
-            result_dict = {KD: {PARAMETER: 999, CONF_INT_LOWER: 999, CONF_INT_UPPER: 999,
-                                STD_DEV: 999, STD_ERR: 999},
-                           NH: {PARAMETER: 999, CONF_INT_LOWER: 999, CONF_INT_UPPER: 999,
-                                STD_DEV: 999, STD_ERR: 999}}
-            # Call the function again with the next data point to be removed
-            result_dict = fit_curve(data, model, remove_index + 1)
+    # the fits are independent, but most of their time is spent holding the GIL, so threads are off by default
+    if workers > 1 and len(pending) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+            results = list(executor.map(lambda model: fit_curve(data, MODEL_EQUATIONS[model], **fit_options), pending))
     else:
-        # No data points left, return a default result
+        results = [fit_curve(data, MODEL_EQUATIONS[model], **fit_options) for model in pending]
+    fit_results.update(zip(pending, results))
+
+    fit_results = {model: fit_results[model] for model in MODEL_FIT_ORDER}
+    fit_results[MODEL_SELECTION] = select_model(fit_results, inputs[0], inputs[1])
+    return fit_results
+
+
+def prepare_fit_inputs(data):
+    # x and y values and degrees of freedom shared by the fits of every model
+    x_data = np.array(data[CONC], dtype=np.float64)
+    y_data = np.array(data[STATS][AVERAGE_SIGNAL], dtype=np.float64)
+    return x_data, y_data, count_dps(data) - 1
+
+
+def fit_curve(data, model, outlier_search=OUTLIER_SEARCH_ON_FAILURE, max_excluded=1, criterion=AICC, inputs=None):
+    x_data, y_data, df = inputs or prepare_fit_inputs(data)
+
+    popt, pcov, evaluations = fit_model(model, x_data, y_data)
+    excluded = []
+    candidates = 0
+
+    # the exclusion search is warm-started from the full-data fit when there is one
+    if outlier_search == OUTLIER_SEARCH_ALWAYS or (popt is None and outlier_search != OUTLIER_SEARCH_OFF):
+        search_popt, search_pcov, excluded, search_evaluations, candidates = search_exclusions(
+            model, x_data, y_data, popt, max_excluded, criterion, include_full_data=popt is not None)
+        evaluations += search_evaluations
+        if excluded or popt is None:
+            popt, pcov = search_popt, search_pcov
+
+    if popt is None:
+        # no exclusion converged, return a default result
         result_dict = {KD: {PARAMETER: 999, CONF_INT_LOWER: 999, CONF_INT_UPPER: 999,
                             STD_DEV: 999, STD_ERR: 999},
                        NH: {PARAMETER: 999, CONF_INT_LOWER: 999, CONF_INT_UPPER: 999,
                             STD_DEV: 999, STD_ERR: 999}}
+    else:
+        kd = popt[0]
+        if model == hill_equation:
+            df -= 1
+            nH = popt[1]
+            conf_int_low, conf_int_hi, std_dev, std_err, conf_int_low_nH, conf_int_hi_nH, std_dev_nh, std_err_nh \
+                = calculate_statistics_from_fit_nh(
+                kd,
+                nH,
+                pcov,
+                df)
+            result_dict = {KD: {PARAMETER: kd, CONF_INT_LOWER: conf_int_low, CONF_INT_UPPER: conf_int_hi,
+                                STD_DEV: std_dev, STD_ERR: std_err},
+                           NH: {PARAMETER: nH, CONF_INT_LOWER: conf_int_low_nH, CONF_INT_UPPER: conf_int_hi_nH,
+                                STD_DEV: std_dev_nh, STD_ERR: std_err_nh}}
+        else:
+            conf_int_low, conf_int_hi, std_dev, std_err = calculate_statistics_from_fit(kd,
+                                                                                        np.sqrt(np.diag(pcov))[0],
+                                                                                        df)
+            result_dict = {KD: {PARAMETER: kd, CONF_INT_LOWER: conf_int_low, CONF_INT_UPPER: conf_int_hi,
+                                STD_DEV: std_dev, STD_ERR: std_err}}
+
+    result_dict[FIT_EVALUATIONS] = evaluations
+    result_dict[EXCLUDED_DATAPOINTS] = excluded
+    result_dict[EXCLUSION_CANDIDATES] = candidates
+    result_dict[FIT_POPT] = None if popt is None else [float(param) for param in popt]
+    result_dict[FIT_SSR], result_dict[FIT_R2] = calculate_goodness_of_fit(model, x_data, y_data, popt, excluded)
+
+    return result_dict
+
+
+def calculate_goodness_of_fit(model, x_data, y_data, popt, excluded=()):
+    # sum of squared residuals and R squared over the datapoints used by the fit
+    if popt is None:
+        return np.nan, np.nan
+    included = np.ones(len(x_data), dtype=bool)
+    included[list(excluded)] = False
+    residuals = y_data[included] - model(x_data[included], *popt)
+    ssr = float(np.sum(residuals ** 2))
+    sst = float(np.sum((y_data[included] - np.mean(y_data[included])) ** 2))
+    return ssr, 1 - ssr / sst if sst > 0 else np.nan
+
 
+def create_skipped_result(model):
+    # parameters of models that were not fitted are left empty in the outputs
+    skipped = {PARAMETER: np.nan, CONF_INT_LOWER: np.nan, CONF_INT_UPPER: np.nan, STD_DEV: np.nan, STD_ERR: np.nan}
+    result_dict = {KD: dict(skipped)}
+    if model == COOPERATIVE_MODEL:
+        result_dict[NH] = dict(skipped)
+    result_dict.update({FIT_EVALUATIONS: 0, EXCLUDED_DATAPOINTS: [], EXCLUSION_CANDIDATES: 0, FIT_POPT: None,
+                        FIT_SSR: np.nan, FIT_R2: np.nan, FIT_SKIPPED: True})
     return result_dict
 
 
+def select_model(fit_results, x_data, y_data, alpha=F_TEST_ALPHA):
+    # the models are compared on the datapoints used by all of the valid fits
+    # AICc ranks the models; the quadratic and cooperative models both contain the simple model as a special case
+    # (rt -> 0, nH = 1), so each is only preferred over it if the extra sum of squares F-test is significant
+    # no model is preferred when none of them has a valid fit
+    from scipy.special import fdtrc
+
+    fitted = [model for model in MODEL_FIT_ORDER if fit_results[model][FIT_POPT] is not None]
+    valid = [model for model in fitted if is_valid_fit(fit_results[model], x_data)]
+    included = np.ones(len(x_data), dtype=bool)
+    for model in valid:
+        included[list(fit_results[model][EXCLUDED_DATAPOINTS])] = False
+    num_points = int(np.count_nonzero(included))
+
+    ssr, num_params = {}, {}
+    for model in fitted:
+        popt = fit_results[model][FIT_POPT]
+        ssr[model] = float(np.sum((y_data[included] - MODEL_EQUATIONS[model](x_data[included], *popt)) ** 2))
+        num_params[model] = len(popt)
+    aicc = {model: float(calculate_exclusion_scores(ssr[model], num_points, num_params[model])) for model in fitted}
+
+    p_values = {}
+    if SIMPLE_MODEL in valid:
+        for model in valid:
+            extra_params = num_params[model] - num_params[SIMPLE_MODEL]
+            df = num_points - num_params[model]
+            if model == SIMPLE_MODEL or extra_params <= 0 or df <= 0:
+                continue
+            with np.errstate(all="ignore"):
+                f_value = ((ssr[SIMPLE_MODEL] - ssr[model]) / extra_params) / (ssr[model] / df)
+            p_values[model] = float(fdtrc(extra_params, df, max(f_value, 0))) if np.isfinite(f_value) else np.nan
+        candidates = [SIMPLE_MODEL] + [model for model, p in p_values.items() if p < alpha]
+    else:
+        candidates = valid
+
+    preferred = min(candidates, key=lambda model: aicc[model]) if candidates else None
+    return {PREFERRED_MODEL: preferred, AICC_SCORES: aicc, F_TEST_P_VALUES: p_values}
+
+
+def is_valid_fit(fit_result, x_data):
+    # a fit only describes binding if it explains some of the variance, its KD did not stop at the limits of the search
+    # and its other parameters (rt, nH) are positive
+    popt = fit_result[FIT_POPT]
+    if popt is None or not fit_result[FIT_R2] > 0:
+        return False
+    log_x = np.log10(x_data)
+    log_kd = np.log10(popt[0]) if popt[0] > 0 else -np.inf
+    if not (np.min(log_x) - KD_SEARCH_DECADES + KD_BOUND_MARGIN < log_kd <
+            np.max(log_x) + KD_SEARCH_DECADES - KD_BOUND_MARGIN):
+        return False
+    return all(param > 0 for param in popt[1:])
+
+
+def search_exclusions(model, x_data, y_data, p0=None, max_excluded=1, criterion=AICC, include_full_data=False):
+    # every combination of up to max_excluded points is fitted at once with the batch solver
+    # returns the parameters, covariance and excluded indices of the best candidate according to criterion
+    from modules.batch_fitting import solve_levenberg_marquardt, estimate_initial_parameters_batch
+    from scipy.special import fdtrc
+
+    num_datapoints = len(x_data)
+    num_params = len(p0) if p0 is not None else len(estimate_initial_parameters(model, x_data, y_data))
+    exclusions = [()] if include_full_data else []
+    for num_excluded in range(1, max_excluded + 1):
+        # at least one point more than the number of parameters has to remain
+        if num_datapoints - num_excluded > num_params:
+            exclusions.extend(itertools.combinations(range(num_datapoints), num_excluded))
+    if not exclusions:
+        return None, None, [], 0, 0
+
+    weights = np.ones((len(exclusions), num_datapoints))
+    for i, excluded in enumerate(exclusions):
+        weights[i, list(excluded)] = 0
+    x_batch = np.broadcast_to(x_data, weights.shape)
+    y_batch = np.broadcast_to(y_data, weights.shape)
+    if p0 is None:
+        p0_batch = estimate_initial_parameters_batch(model, x_batch, y_batch, weights)
+    else:
+        p0_batch = np.tile(p0, (len(exclusions), 1))
+
+    popt, pcov, converged, evaluations, ssr = solve_levenberg_marquardt(model, x_batch, y_batch, weights, p0_batch)
+    # candidates are scored on all datapoints, an excluded point counts as one more parameter (it is fitted exactly)
+    num_excluded = np.array([len(excluded) for excluded in exclusions])
+    scores = calculate_exclusion_scores(ssr, num_datapoints, num_params + num_excluded, criterion)
+    scores[~converged] = np.inf
+
+    # removing the worst points always improves the fit a little, so when the full-data fit converged an exclusion is
+    # only kept if each of its points is an outlier: excluding it has to decrease the sum of squares of the best fit
+    # with one point less excluded significantly, after correcting for the number of points that could be excluded
+    if include_full_data and converged[0]:
+        best_ssr = np.full(max_excluded + 1, np.inf)
+        for num in range(max_excluded + 1):
+            candidates = (num_excluded == num) & converged
+            if np.any(candidates):
+                best_ssr[num] = np.min(ssr[candidates])
+        outliers = num_excluded > 0
+        previous_ssr = best_ssr[num_excluded[outliers] - 1]
+        df = num_datapoints - num_params - num_excluded[outliers]
+        with np.errstate(all="ignore"):
+            f_value = (previous_ssr - ssr[outliers]) / (ssr[outliers] / df)
+            p_values = fdtrc(1, df, np.where(np.isfinite(f_value), np.maximum(f_value, 0), 0))
+        significant = p_values < OUTLIER_ALPHA / (num_datapoints - num_excluded[outliers] + 1)
+        scores[np.flatnonzero(outliers)[~significant]] = np.inf
+        # a level without any significant candidate also rules out the levels above it
+        for num in range(1, max_excluded + 1):
+            if not np.any(np.isfinite(scores[num_excluded == num])):
+                scores[num_excluded > num] = np.inf
+    if not np.any(np.isfinite(scores)):
+        return None, None, [], int(np.sum(evaluations)), len(exclusions)
+
+    best = int(np.argmin(scores))
+    return popt[best], pcov[best], list(exclusions[best]), int(np.sum(evaluations)), len(exclusions)
+
+
+def calculate_exclusion_scores(ssr, num_points, num_params, criterion=AICC):
+    with np.errstate(all="ignore"):
+        if criterion == RESIDUAL:
+            # residual standard error, so that more parameters have to pay for themselves
+            df = num_points - num_params
+            return np.where(df > 0, np.sqrt(ssr / df), np.inf)
+        if criterion == AICC:
+            # the residual variance counts as an additional parameter
+            k = num_params + 1
+            aicc = num_points * np.log(ssr / num_points) + 2 * k + (2 * k * (k + 1)) / (num_points - k - 1)
+            return np.where(num_points - k - 1 > 0, aicc, np.inf)
+    raise ValueError(f"Unknown exclusion criterion '{criterion}', expected '{AICC}' or '{RESIDUAL}'")
+
+
+def fit_model(model, x_data, y_data, p0=None):
+    # KD is fitted as log10(KD) for better conditioning, the returned parameters and covariance are in linear space
+    # returns None for popt and pcov if the fit did not converge
+    if p0 is None:
+        p0 = estimate_initial_parameters(model, x_data, y_data)
+    jacobian = MODEL_JACOBIANS[model]
+    evaluations = 0
+
+    def log_model(x, log_kd, *params):
+        nonlocal evaluations
+        evaluations += 1
+        return model(x, 10 ** log_kd, *params)
+
+    def log_jacobian(x, log_kd, *params):
+        kd = 10 ** log_kd
+        jac = jacobian(x, kd, *params)
+        jac[:, 0] *= kd * np.log(10)
+        return jac
+
+    # log10(KD) is kept within a few decades of the tested concentrations so flat fits cannot drift away
+    log_x = np.log10(x_data)
+    lower_bounds = [np.min(log_x) - KD_SEARCH_DECADES] + [-np.inf] * (len(p0) - 1)
+    upper_bounds = [np.max(log_x) + KD_SEARCH_DECADES] + [np.inf] * (len(p0) - 1)
+    log_p0 = [np.clip(np.log10(p0[0]), lower_bounds[0], upper_bounds[0]), *p0[1:]]
+
+    # scipy is loaded on the first fit instead of at startup
+    from scipy.optimize import curve_fit
+    try:
+        popt, pcov = curve_fit(log_model, x_data, y_data, p0=log_p0, jac=log_jacobian,
+                               bounds=(lower_bounds, upper_bounds), max_nfev=FIT_MAX_EVALUATIONS)
+    except (RuntimeError, ValueError):
+        # the bounded solver gives up on some flat or noisy datasets that the unbounded one still fits
+        try:
+            with np.errstate(all="ignore"):
+                popt, pcov = curve_fit(log_model, x_data, y_data, p0=log_p0, jac=log_jacobian,
+                                       maxfev=FIT_MAX_EVALUATIONS)
+        except (RuntimeError, ValueError):
+            return None, None, evaluations
+
+    popt[0] = 10 ** popt[0]
+    scale = np.ones(len(popt))
+    scale[0] = popt[0] * np.log(10)
+    return popt, pcov * np.outer(scale, scale), evaluations
+
+
+def estimate_initial_parameters(model, x_data, y_data):
+    order = np.argsort(x_data)
+    x_data = np.asarray(x_data, dtype=np.float64)[order]
+    y_data = np.asarray(y_data, dtype=np.float64)[order]
+    kd = estimate_half_max_concentration(x_data, y_data)
+
+    if model == hill_equation:
+        return [kd, estimate_hill_slope(x_data, y_data, kd)]
+    if model == quadratic_model_equation:
+        return [kd, 1]
+    return [kd]
+
+
+def estimate_half_max_concentration(x_data, y_data):
+    # KD is taken where the signal crosses halfway between its extremes, interpolated on a log scale
+    half_max = (np.min(y_data) + np.max(y_data)) / 2
+    above = y_data >= half_max
+    crossings = np.flatnonzero(above[1:] != above[:-1])
+    if len(crossings) == 0:
+        return float(np.sqrt(x_data[0] * x_data[-1]))
+
+    i = crossings[0]
+    log_x = np.log10(x_data[i:i + 2])
+    y = y_data[i:i + 2]
+    if y[1] == y[0]:
+        return float(10 ** log_x[0])
+    return float(10 ** (log_x[0] + (half_max - y[0]) * (log_x[1] - log_x[0]) / (y[1] - y[0])))
+
+
+def estimate_hill_slope(x_data, y_data, kd):
+    # nH is the slope of logit(signal) vs. ln(concentration) in the transition region of the curve
+    span = np.max(y_data) - np.min(y_data)
+    if span <= 0:
+        return 1.0
+    fraction = (y_data - np.min(y_data)) / span
+    transition = (fraction > 0.05) & (fraction < 0.95)
+    if np.count_nonzero(transition) < 2:
+        return 1.0
+
+    logit = np.log(fraction[transition] / (1 - fraction[transition]))
+    slope = np.polyfit(np.log(x_data[transition] / kd), logit, 1)[0]
+    return float(np.clip(slope, 0.2, 10)) if np.isfinite(slope) else 1.0
+
+
+def calculate_fitted_curves(signal_data, fit_data, step_ratio=DEFAULT_CURVE_STEP_RATIO):
+    # all models are sampled on the same concentration grid, each with a single array evaluation
+    x_values = create_curve_grid(signal_data, step_ratio)
+    return {model: calculate_fitted_curve_datapoints(x_values, fit_data, model) for model in MODELS}
+
+
+def create_curve_grid(signal_data, step_ratio=DEFAULT_CURVE_STEP_RATIO):
+    # from 1.2 times the first to 0.8 times the last concentration, each point step_ratio times the previous one;
+    # cumprod repeats the same multiplications a loop would, so the points are exactly x, x * r, (x * r) * r, ...
+    if not 0 < step_ratio < 1:
+        raise ValueError(f"Invalid curve step ratio {step_ratio}, expected a value between 0 and 1")
+    max_concentration = signal_data[CONC][0] * 1.2
+    min_concentration = signal_data[CONC][-1] * 0.8
+    if max_concentration <= min_concentration:
+        return np.empty(0)
+
+    num_steps = int(np.ceil(np.log(min_concentration / max_concentration) / np.log(step_ratio))) + 1
+    x_values = np.cumprod(np.concatenate([[max_concentration], np.full(num_steps, step_ratio)]))
+    return x_values[x_values > min_concentration]
+
+
+def calculate_fitted_curve_datapoints(x_values, fit_data, model):
+    kd = fit_data[model][KD][PARAMETER]
+    model_equation = MODEL_EQUATIONS[model]
+
+    if model == COOPERATIVE_MODEL:
+        fit_y_values = model_equation(x_values, kd, fit_data[model][NH][PARAMETER])
+    else:
+        fit_y_values = model_equation(x_values, kd)
+
+    # a curve that cannot be evaluated everywhere is left out
+    if np.isnan(fit_y_values).any():
+        x_values = fit_y_values = np.empty(0)
+
+    x_values_label = f"x_{model}"
+    y_values_label = f"y_{model}"
+
+    return {x_values_label: x_values, y_values_label: fit_y_values}
+
+
 def count_dps(data):
-    total = 0
-    for _, values in data[SIGNAL_VALUES].items():
-        total = len(values)
-    return total
+    return np.shape(data[SIGNAL_VALUES])[1]
 
 
 def calculate_statistics_from_fit_nh(kd, nH, pcov, df):
@@ -71,12 +386,14 @@ def calculate_statistics_from_fit_nh(kd, nH, pcov, df):
 
 
 def calculate_statistics_from_fit(param, perr, df):
+    # stdtrit is the quantile function behind scipy.stats.t.ppf, without loading all of scipy.stats
+    from scipy.special import stdtrit
     alpha = 0.05
-    tcrit = t.ppf((1 - alpha / 2), df)
-    conf_int = param + np.array([-1, 1]) * tcrit * perr
-    print(df)
-    print(tcrit)
-    std_dev = np.sqrt(df) * ((conf_int[1] - conf_int[0]) / (2 * tcrit))
+    tcrit = stdtrit(df, 1 - alpha / 2)
+    conf_int_low = param - tcrit * perr
+    conf_int_hi = param + tcrit * perr
+    logger.debug("df = %s, tcrit = %s", df, tcrit)
+    std_dev = np.sqrt(df) * ((conf_int_hi - conf_int_low) / (2 * tcrit))
     std_err = std_dev / np.sqrt(df)
 
-    return conf_int[0], conf_int[1], std_dev, std_err
+    return conf_int_low, conf_int_hi, std_dev, std_err
@@ -1,52 +1,8 @@
-import csv
+import json
+import sys
 import tkinter as tk
 
-
-class Grid:
-    def __init__(self, m, n):
-        self.m = m
-        self.n = n
-        self.sets = []
-        self.cells = [[0 for _ in range(n)] for _ in range(m)]  # 0 represents an unpopulated cell
-
-    def add_set(self, set):
-        self.sets.append(set)
-
-    def display_sets(self):
-        for set in self.sets:
-            print(f"Set: {set.control1}, {set.control2}")
-
-    # def populate_from_csv(self, file_path):
-    #     with open(file_path, 'r') as f:
-    #         reader = csv.reader(f)
-    #         for i, row in enumerate(reader):
-    #             # print(row)
-    #             for j, cell in enumerate(row):
-    #                 self.cells[i][j] = 1
-    def populate_from_csv(self, file_path):
-        with open(file_path, 'r') as f:
-            reader = csv.reader(f)
-            for i, row in enumerate(reader):
-                # If the row is empty or contains only whitespace, stop reading
-                print(f"row {row}")
-                if not row or all(cell.isspace() or cell == '' for cell in row):
-                    print("end of row?")
-                    break
-                # elif :
-                #     print("empty row")
-                #     break
-                for j, cell in enumerate(row):
-                    self.cells[i][j] = 1
-
-
-class Set:
-    def __init__(self, control1, control2):
-        self.control1 = control1
-        self.control2 = control2
-        self.xmin = min(control1[0], control2[0])
-        self.ymin = min(control1[1], control2[1])
-        self.xmax = max(control1[0], control2[0])
-        self.ymax = max(control1[1], control2[1])
+from modules.plate_layout import *
 
 
 class GridGUI:
@@ -95,7 +51,16 @@ class GridGUI:
         self.root.mainloop()
 
 
-# Create the grid and run the GUI
-grid = Grid(16, 24)
-grid.populate_from_csv('/Users/jespinol/Downloads/TR-FRET/gui/c.csv')  # read grid cells from csv
-GridGUI(grid).run()
+if __name__ == "__main__":
+    # python3 -m modules.grid_gui EXPORT.csv [LAYOUT.json]
+    # select two control wells for each set, the layout is written when the window is closed
+    grid = Grid(16, 24)
+    grid.populate_from_csv(sys.argv[1])  # read grid cells from csv
+    GridGUI(grid).run()
+
+    layout = {**grid.to_layout(), "plates": [os.path.abspath(sys.argv[1])]}
+    if len(sys.argv) > 2:
+        with open(sys.argv[2], "w") as f:
+            json.dump(layout, f, indent=2)
+    else:
+        print(json.dumps(layout, indent=2))
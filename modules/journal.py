@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import time
+
+from modules.cache import *
+from modules.plate_reader import *
+
+JOURNAL_STARTED = "started"
+JOURNAL_OK = "ok"
+JOURNAL_FAILED = "failed"
+
+
+class BatchJournal:
+    # an append-only file with one json record per line: a "started" record when a dataset is submitted and an "ok" or
+    # "failed" record when it finishes; each record is flushed to disk before the batch moves on, so after a crash the
+    # journal tells which datasets completed and a re-run only processes the others
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self.skipped = []
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.records[record["key"]] = record
+                    except (ValueError, KeyError, TypeError):
+                        # the last line is cut short when the run was killed while writing it
+                        continue
+
+    def is_completed(self, key):
+        # a dataset is only skipped while every output of its completed run is still there
+        record = self.records.get(key)
+        return record is not None and record["status"] == JOURNAL_OK and \
+            all(os.path.exists(file) for file in record.get("outputs", []))
+
+    def pending(self, datasets):
+        # yields the datasets without a completed run, failed and unfinished ones included
+        for dataset_info in datasets:
+            dataset_info[JOURNAL_KEY] = key = create_journal_key(dataset_info)
+            if self.is_completed(key):
+                self.skipped.append(dataset_info)
+                continue
+            self.append({"key": key, "path": dataset_info[PATH], "name": dataset_info.get(DATASET_NAME),
+                         "status": JOURNAL_STARTED})
+            yield dataset_info
+
+    def record(self, result):
+        status = JOURNAL_OK if result[BATCH_STATUS] == BATCH_OK else JOURNAL_FAILED
+        outputs = []
+        for files in (result.get(OUTPUT_FILES) or {}).values():
+            outputs.extend([files] if isinstance(files, str) else files)
+        self.append({"key": result[JOURNAL_KEY], "path": result[PATH], "status": status,
+                     "error": result[BATCH_ERROR], "outputs": outputs, "time": result[BATCH_TIME]})
+
+    def append(self, record):
+        record["at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.records[record["key"]] = record
+
+
+def create_journal_key(dataset_info):
+    # the input files are identified by their size and modification time, which is cheap enough to check for every
+    # dataset of a batch before it is submitted; datasets of a plate layout read every export of the layout
+    digest = hashlib.sha256()
+    parameters = {key: dataset_info.get(key) for key in CACHE_KEY_PARAMETERS + [OUTPUT_FORMATS, COLUMNAR_PATH]}
+    parameters[PATH] = os.path.abspath(dataset_info[PATH])
+    parameters[DATASET_NAME] = dataset_info.get(DATASET_NAME)
+    digest.update(json.dumps(parameters, sort_keys=True, default=str).encode())
+
+    if dataset_info.get(PLATES) is not None:
+        file_paths = list(dataset_info.get(INGEST_TIMES, {}))
+    elif os.path.exists(dataset_info[PATH]):
+        file_paths = find_plate_exports(dataset_info[PATH])
+    else:
+        file_paths = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        digest.update(f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+    return digest.hexdigest()
@@ -0,0 +1,107 @@
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from modules.constants import *
+
+
+class DatasetMetrics:
+    def __init__(self, path, profile=False, trace_memory=False, name=None):
+        self.path = path
+        self.name = name
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.stages = {}
+        self.counters = {}
+        self.profiler = cProfile.Profile() if profile else None
+        # memory is not traced here when the caller is already tracing it
+        self.trace_memory = trace_memory and not tracemalloc.is_tracing()
+        self.memory = None
+
+    def start(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profiler:
+            self.profiler.enable()
+
+    def stop(self):
+        if self.profiler:
+            self.profiler.disable()
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.memory = {"peak_bytes": peak, "current_bytes": current,
+                           "top_allocations": [{"location": str(stat.traceback), "size_bytes": stat.size,
+                                                "count": stat.count}
+                                               for stat in snapshot.statistics("lineno")[:METRICS_TOP_ENTRIES]]}
+
+    @contextmanager
+    def stage(self, name):
+        # stages entered several times, e.g. once per replicate, are summed
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            timing = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0})
+            timing["wall_s"] += time.perf_counter() - wall_start
+            timing["cpu_s"] += time.process_time() - cpu_start
+            timing["calls"] += 1
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def profile_stats(self):
+        stats = pstats.Stats(self.profiler)
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [{"function": f"{file}:{line}({name})", "calls": calls, "total_s": total_time,
+                 "cumulative_s": cumulative_time}
+                for (file, line, name), (_, calls, total_time, cumulative_time, _) in functions[:METRICS_TOP_ENTRIES]]
+
+    def to_dict(self):
+        output = {"dataset": os.path.abspath(self.path), "name": self.name, "started": self.started,
+                  "stages": self.stages, "counters": self.counters}
+        if self.profiler:
+            output["profile"] = self.profile_stats()
+        if self.memory:
+            output["memory"] = self.memory
+        return output
+
+    def write(self, metrics_dir):
+        # one json file per processed dataset, plus the raw profile that can be opened with pstats or snakeviz
+        os.makedirs(metrics_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(os.path.normpath(self.path)))[0]
+        if self.name:
+            name = f"{name}_{self.name}"
+        file_root = os.path.join(metrics_dir, f"{name}_{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}")
+        if self.profiler:
+            self.profiler.dump_stats(f"{file_root}.prof")
+        with open(f"{file_root}.json", "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return f"{file_root}.json"
+
+
+def create_metrics(dataset_info):
+    # metrics are only collected when a metrics directory was given, otherwise the helpers below do nothing
+    if not dataset_info.get(METRICS_DIR):
+        dataset_info[METRICS] = None
+        return None
+    dataset_info[METRICS] = DatasetMetrics(dataset_info[PATH], dataset_info.get(METRICS_PROFILE, False),
+                                           dataset_info.get(METRICS_TRACE_MEMORY, False),
+                                           dataset_info.get(DATASET_NAME))
+    return dataset_info[METRICS]
+
+
+def measure_stage(dataset_info, name):
+    metrics = dataset_info.get(METRICS)
+    return metrics.stage(name) if metrics else nullcontext()
+
+
+def count(dataset_info, name, value=1):
+    metrics = dataset_info.get(METRICS)
+    if metrics:
+        metrics.count(name, value)
@@ -0,0 +1,253 @@
+import os
+
+from modules.cache import *
+from modules.curve_fitting import *
+from modules.metrics import *
+from modules.plate_reader import *
+
+
+def dataProcess(dataset_info):
+    metrics = create_metrics(dataset_info)
+    if metrics:
+        metrics.start()
+    try:
+        process_dataset(dataset_info)
+    finally:
+        if metrics:
+            metrics.stop()
+            dataset_info[METRICS_FILE] = metrics.write(dataset_info[METRICS_DIR])
+
+    return
+
+
+def process_dataset(dataset_info):
+    cache, cache_key, entry = lookup_results(dataset_info)
+    if entry is None:
+        entry = create_results_entry(dataset_info, *process_signal(dataset_info))
+    finish_dataset(dataset_info, entry, cache, cache_key)
+
+
+def lookup_results(dataset_info):
+    # results are served from the cache when the input files and parameters are unchanged
+    # returns the cache, the key of the dataset and its cached entry, or None for each when they are not available
+    if not dataset_info.get(CACHE_DIR):
+        return None, None, None
+    with measure_stage(dataset_info, "cache_lookup"):
+        cache = ResultCache(dataset_info[CACHE_DIR], dataset_info.get(CACHE_SIZE, DEFAULT_CACHE_SIZE))
+        cache_key = create_cache_key(dataset_info, find_plate_exports(dataset_info[PATH]))
+        entry = cache.get(cache_key)
+    if entry is not None:
+        dataset_info[NUM_REPEATS], dataset_info[NUM_DATAPOINTS] = entry[NUM_REPEATS], entry[NUM_DATAPOINTS]
+    return cache, cache_key, entry
+
+
+def create_results_entry(dataset_info, corrected_signal, normalized_signal, fit_results):
+    return {NUM_REPEATS: dataset_info[NUM_REPEATS], NUM_DATAPOINTS: dataset_info[NUM_DATAPOINTS],
+            CACHED_RESULTS: (corrected_signal, normalized_signal, fit_results), CACHED_OUTPUTS: {}}
+
+
+def finish_dataset(dataset_info, entry, cache=None, cache_key=None):
+    # writes the outputs, stores new results in the cache and prepares the rows of the results index
+    corrected_signal, normalized_signal, fit_results = entry[CACHED_RESULTS]
+    outputs = write_outputs(dataset_info, corrected_signal, normalized_signal, fit_results, entry[CACHED_OUTPUTS])
+    dataset_info[OUTPUT_FILES] = outputs
+
+    if cache is not None:
+        if outputs != entry[CACHED_OUTPUTS] or cache.misses:
+            with measure_stage(dataset_info, "cache_store"):
+                entry[CACHED_OUTPUTS] = outputs
+                cache.put(cache_key, entry)
+        dataset_info[CACHE_STATS] = cache.stats()
+        for name, value in dataset_info[CACHE_STATS].items():
+            count(dataset_info, f"cache_{name.lower()}", value)
+
+    # the rows for the results index are inserted by the caller, so a batch is added in one transaction
+    if dataset_info.get(RESULTS_INDEX):
+        from modules.results_index import create_index_records
+        # the files read for the dataset, e.g. every export of a plate layout; incremental updates in watch mode only
+        # read the files that changed, and cached results none
+        input_files = [] if dataset_info.get(SIGNALS) is not None else list(dataset_info.get(INGEST_TIMES, {}))
+        input_files = input_files or find_plate_exports(dataset_info[PATH])
+        dataset_info[INDEX_RECORDS] = create_index_records(dataset_info, fit_results, input_files, outputs)
+
+
+def process_signal(dataset_info):
+    # datasets updated incrementally in watch mode come with their corrected and normalized signal
+    if dataset_info.get(SIGNALS) is not None:
+        corrected_signal, normalized_signal = dataset_info[SIGNALS]
+        dataset_info[NUM_REPEATS], dataset_info[NUM_DATAPOINTS] = np.shape(corrected_signal[SIGNAL_VALUES])
+        return fit_signals(dataset_info, corrected_signal, normalized_signal)
+
+    with measure_stage(dataset_info, "parse_dataset"):
+        plates = parse_dataset(dataset_info)
+    count(dataset_info, "plate_files_read", len(plates))
+
+    return process_plates(dataset_info, plates)
+
+
+def process_plates(dataset_info, plates):
+    # plates is a list of (wells, channel) arrays, one per replicate
+    with measure_stage(dataset_info, "format_raw_signal"):
+        raw_signal = format_raw_signal(plates)
+
+    with measure_stage(dataset_info, "correct_signal"):
+        corrected_signal = {SIGNAL_VALUES: correct_signal(raw_signal)}
+
+    dataset_info[NUM_REPEATS] = len(corrected_signal[SIGNAL_VALUES])
+    dataset_info[NUM_DATAPOINTS] = corrected_signal[SIGNAL_VALUES].shape[1]
+
+    with measure_stage(dataset_info, "normalize_signal"):
+        corrected_signal[STATS] = calculate_signal_statistics(corrected_signal)
+
+        normalized_signal = {SIGNAL_VALUES: normalize_signal(corrected_signal)}
+        corrected_signal[CONC] = normalized_signal[CONC] = calculate_concentrations(dataset_info)
+        corrected_signal[LOG_CONC] = normalized_signal[LOG_CONC] = convert_conc_to_log(corrected_signal[CONC])
+        normalized_signal[STATS] = calculate_signal_statistics(normalized_signal)
+
+    return fit_signals(dataset_info, corrected_signal, normalized_signal)
+
+
+def fit_signals(dataset_info, corrected_signal, normalized_signal):
+    fit_options = {"outlier_search": dataset_info.get(OUTLIER_SEARCH, OUTLIER_SEARCH_ON_FAILURE),
+                   "max_excluded": dataset_info.get(MAX_EXCLUDED, 1),
+                   "criterion": dataset_info.get(EXCLUSION_CRITERION, AICC),
+                   "skip_r2": dataset_info.get(SKIP_MODELS_R2),
+                   "workers": dataset_info.get(FIT_WORKERS, 1)}
+    with measure_stage(dataset_info, "fit_models"):
+        fit_results = fit_models(normalized_signal, **fit_options)
+    if dataset_info.get(BOOTSTRAP_SAMPLES):
+        from modules.bootstrap import add_bootstrap_intervals
+        with measure_stage(dataset_info, "bootstrap"):
+            add_bootstrap_intervals(normalized_signal, fit_results, dataset_info[BOOTSTRAP_SAMPLES],
+                                    dataset_info.get(BOOTSTRAP_SEED, DEFAULT_BOOTSTRAP_SEED),
+                                    dataset_info.get(BOOTSTRAP_WORKERS, 1))
+        count(dataset_info, "bootstrap_fits", dataset_info[BOOTSTRAP_SAMPLES] *
+              sum(BOOTSTRAP_CONVERGED in fit_results[model] for model in MODEL_FIT_ORDER))
+    for model in MODEL_FIT_ORDER:
+        count(dataset_info, "models_skipped", int(fit_results[model].get(FIT_SKIPPED, False)))
+        count(dataset_info, f"fit_evaluations[{model}]", fit_results[model][FIT_EVALUATIONS])
+        count(dataset_info, f"exclusion_candidates[{model}]", fit_results[model][EXCLUSION_CANDIDATES])
+        count(dataset_info, f"excluded_datapoints[{model}]", len(fit_results[model][EXCLUDED_DATAPOINTS]))
+
+    return corrected_signal, normalized_signal, fit_results
+
+
+def write_outputs(dataset_info, corrected_signal, normalized_signal, fit_results, previous_outputs=None):
+    # outputs that were already written for the same results and still exist are not written again
+    # returns the output file(s) of each format
+    previous_outputs = previous_outputs or {}
+    outputs = {}
+    output_formats = dataset_info.get(OUTPUT_FORMATS, [XLSX_OUTPUT])
+
+    # the fitted curves are sampled once and shared by every output
+    with measure_stage(dataset_info, "fitted_curves"):
+        fitted_curves = calculate_fitted_curves(normalized_signal, fit_results,
+                                                dataset_info.get(CURVE_STEP_RATIO, DEFAULT_CURVE_STEP_RATIO))
+
+    if XLSX_OUTPUT in output_formats:
+        if previous_outputs.get(XLSX_OUTPUT) and os.path.exists(previous_outputs[XLSX_OUTPUT]):
+            outputs[XLSX_OUTPUT] = previous_outputs[XLSX_OUTPUT]
+        else:
+            # openpyxl and the chart classes are only loaded when a workbook is written
+            from modules.save_xlsx import output_results
+            with measure_stage(dataset_info, "output_results"):
+                outputs[XLSX_OUTPUT] = output_results(dataset_info, corrected_signal, normalized_signal,
+                                                      fit_results, dataset_info.get(LOW_MEMORY_OUTPUT, False),
+                                                      fitted_curves)
+    if PARQUET_OUTPUT in output_formats:
+        previous_files = previous_outputs.get(PARQUET_OUTPUT, [])
+        columnar_path = dataset_info.get(COLUMNAR_PATH)
+        if previous_files and all(os.path.exists(file) for file in previous_files) and \
+                (not columnar_path or all(file.startswith(os.path.join(columnar_path, "")) for file in previous_files)):
+            outputs[PARQUET_OUTPUT] = previous_files
+        else:
+            from modules.save_columnar import output_columnar
+            with measure_stage(dataset_info, "output_columnar"):
+                outputs[PARQUET_OUTPUT] = output_columnar(dataset_info, corrected_signal, normalized_signal,
+                                                          fit_results, fitted_curves=fitted_curves)
+
+    return outputs
+
+
+def parse_dataset(dataset_info):
+    # datasets extracted from a plate layout come with their plates already read
+    if dataset_info.get(PLATES) is not None:
+        return dataset_info[PLATES]
+
+    file_paths = find_plate_exports(dataset_info[PATH])
+    plates, dataset_info[INGEST_TIMES] = read_plate_exports(file_paths, dataset_info[PLATE_FORMAT])
+    return plates
+
+
+def format_raw_signal(plates):
+    # returns an array of shape (replicates, wells, channel) where channel 0 is 615 nm and channel 1 is 665 nm
+    if len({len(plate) for plate in plates}) > 1:
+        raise ValueError("All replicates must contain the same number of wells")
+
+    return np.stack(plates)
+
+
+def correct_signal(data):
+    data_615 = data[:, :, 0]
+    data_665 = data[:, :, 1]
+    last_index = data.shape[1] - 1
+    alpha = data_665[:, last_index:] / data_615[:, last_index:]
+    first_index_of_donor_plus = data.shape[1] // 2
+
+    # wells in the second half (donor + acceptor) are corrected by the matching well in the first half (donor only)
+    donor_plus = slice(first_index_of_donor_plus, last_index)
+    donor_only = slice(0, last_index - first_index_of_donor_plus)
+    return ((data_665[:, donor_plus] - (alpha * data_615[:, donor_plus])) -
+            (data_665[:, donor_only] - (alpha * data_615[:, donor_only])))
+
+
+def parse_values_from_file(reader, line):
+    data_arr = []
+    while line:
+        data_arr.append(int(line[0]))
+        line = next(reader, None)
+
+    return data_arr
+
+
+def normalize_signal(data):
+    global_max = np.max(data[STATS][AVERAGE_SIGNAL])
+    global_min = np.min(data[STATS][AVERAGE_SIGNAL])
+
+    return (data[SIGNAL_VALUES] - global_min) / (global_max - global_min)
+
+
+def calculate_concentrations(data_info):
+    max_concentration = data_info[MAX_CONC]
+    dilution_factor = data_info[DIL_FACTOR]
+    num_datapoints = data_info[NUM_DATAPOINTS]
+
+    concentrations = []
+    current_concentration = float(max_concentration) * 1000
+    for i in range(1, num_datapoints + 1):
+        if data_info[CONC_REVERSE]:
+            concentrations.insert(0, current_concentration)
+        else:
+            concentrations.append(current_concentration)
+        current_concentration /= dilution_factor
+
+    return concentrations
+
+
+def convert_conc_to_log(array_of_concentrations):
+    output = []
+    for value in array_of_concentrations:
+        output.append(np.log10(value))
+
+    return output
+
+
+def calculate_signal_statistics(data):
+    values = data[SIGNAL_VALUES]
+    repeat_num = values.shape[0]
+
+    averages = np.mean(values, axis=0)
+    std_devs_pop = np.std(values, axis=0, ddof=1, dtype=np.float64)
+    std_errors_mean = std_devs_pop / np.sqrt(repeat_num)
+
+    return {AVERAGE_SIGNAL: averages, STD_DEV: std_devs_pop, STD_ERR: std_errors_mean}
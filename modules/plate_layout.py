@@ -0,0 +1,215 @@
+import json
+import os
+import re
+import time
+
+from modules.batch import *
+
+LAYOUT_KEYS = ["rows", "columns", "plates", "sets"]
+
+
+class Grid:
+    def __init__(self, m, n):
+        self.m = m
+        self.n = n
+        self.sets = []
+        self.cells = [[0 for _ in range(n)] for _ in range(m)]  # 0 represents an unpopulated cell
+
+    def add_set(self, set):
+        if not (0 <= set.xmin <= set.xmax < self.m and 0 <= set.ymin <= set.ymax < self.n):
+            raise ValueError(f"Set {set.control1}, {set.control2} does not fit on a {self.m} x {self.n} plate")
+        if set.name is None:
+            set.name = f"Set {len(self.sets) + 1}"
+        self.sets.append(set)
+
+    def display_sets(self):
+        for set in self.sets:
+            print(f"Set: {set.control1}, {set.control2}")
+
+    def populate_from_csv(self, file_path):
+        # marks the wells that have a value at 615 nm
+        plate = read_plate_grid(file_path, self.m, self.n)
+        self.cells = (~np.isnan(plate[0])).astype(int).tolist()
+
+    def to_layout(self):
+        # the layout file equivalent of this grid, with wells written as e.g. "A1"
+        return {"rows": self.m, "columns": self.n,
+                "sets": [{"name": set.name, "controls": [format_well(set.control1), format_well(set.control2)],
+                          **set.parameters} for set in self.sets]}
+
+
+class Set:
+    # a rectangle of wells between two corner (control) wells given as (row, column), both included
+    def __init__(self, control1, control2, name=None, parameters=None):
+        self.control1 = control1
+        self.control2 = control2
+        self.name = name
+        self.parameters = parameters or {}
+        self.xmin = min(control1[0], control2[0])
+        self.ymin = min(control1[1], control2[1])
+        self.xmax = max(control1[0], control2[0])
+        self.ymax = max(control1[1], control2[1])
+
+    def well_indices(self, columns, plate_format=COLUMN_PLATE_FORMAT):
+        # flat indices into a (rows * columns) plate, in the order the wells are read: each column top to bottom in
+        # column format, each row left to right in row format
+        rows = np.arange(self.xmin, self.xmax + 1)
+        cols = np.arange(self.ymin, self.ymax + 1)
+        if plate_format == ROW_PLATE_FORMAT:
+            row_index, col_index = np.meshgrid(rows, cols, indexing="ij")
+        else:
+            col_index, row_index = np.meshgrid(cols, rows, indexing="ij")
+        return (row_index * columns + col_index).ravel()
+
+
+def read_layout(layout_path):
+    # a json file with the plate size, the plate exports and the sets; keys other than rows, columns, plates and sets
+    # are dataset parameters, with the same names as in a manifest, that apply to every set unless a set overrides them
+    with open(layout_path) as f:
+        layout = json.load(f)
+
+    defaults = {key: value for key, value in layout.items() if key not in LAYOUT_KEYS}
+    grid = Grid(int(layout.get("rows", 16)), int(layout.get("columns", 24)))
+    for entry in layout.get("sets", []):
+        entry = dict(entry)
+        if "controls" not in entry or len(entry["controls"]) != 2:
+            raise ValueError(f"Layout set is missing its two 'controls' wells: {entry}")
+        control1, control2 = (parse_well(well) for well in entry.pop("controls"))
+        grid.add_set(Set(control1, control2, entry.pop("name", None), {**defaults, **entry}))
+
+    layout_dir = os.path.dirname(os.path.abspath(layout_path))
+    file_paths = [os.path.join(layout_dir, os.path.expanduser(path)) for path in layout.get("plates", [])]
+    return grid, file_paths
+
+
+def read_layout_datasets(layout_path):
+    grid, file_paths = read_layout(layout_path)
+    if not file_paths:
+        raise ValueError(f"{layout_path}: no plate exports listed under 'plates'")
+    return create_layout_datasets(grid, file_paths, os.path.dirname(os.path.abspath(layout_path)))
+
+
+def create_layout_datasets(grid, file_paths, base_dir="."):
+    # each plate export is parsed once; every export holds one replicate of each set, and sets with the same name
+    # are replicates of the same dataset
+    # an export that cannot be read or a set that cannot be extracted is reported as a failed dataset of the batch
+    plates, ingest_times, export_error = [], {}, None
+    for file_path in file_paths:
+        start = time.perf_counter()
+        try:
+            plates.append(read_plate_grid(file_path, grid.m, grid.n).reshape(2, -1))
+        except (OSError, ValueError) as e:
+            export_error = export_error or f"{type(e).__name__}: {e}"
+        ingest_times[file_path] = time.perf_counter() - start
+
+    datasets = []
+    for name, sets in sets_by_name(grid).items():
+        entry = {**sets[0].parameters, MANIFEST_PATH: file_paths[0]}
+        dataset_info = create_dataset_info(entry, base_dir)
+        # the name becomes part of the output file names
+        dataset_info[DATASET_NAME] = re.sub(r"[^\w.-]+", "_", str(name))
+        if export_error:
+            # every export holds a replicate of each set, so none of them can be processed
+            dataset_info[DATASET_ERROR] = export_error
+        else:
+            try:
+                dataset_info[PLATES] = extract_set_plates(name, sets, file_paths, plates, grid.n,
+                                                          dataset_info[PLATE_FORMAT])
+            except ValueError as e:
+                dataset_info[DATASET_ERROR] = f"{type(e).__name__}: {e}"
+        datasets.append(dataset_info)
+
+    # the time spent reading the exports is shared between the datasets extracted from them
+    for dataset_info in datasets:
+        dataset_info[INGEST_TIMES] = {file_path: seconds / len(datasets) for file_path, seconds in ingest_times.items()}
+
+    return datasets
+
+
+def extract_set_plates(name, sets, file_paths, plates, columns, plate_format=COLUMN_PLATE_FORMAT):
+    # the well indices are computed once per set and used for every export
+    well_indices = [set.well_indices(columns, plate_format) for set in sets]
+    if len({len(indices) for indices in well_indices}) > 1:
+        raise ValueError(f"Replicates of set '{name}' must contain the same number of wells")
+    set_plates = []
+    for file_path, plate in zip(file_paths, plates):
+        for indices in well_indices:
+            wells = plate[:, indices].T
+            if np.isnan(wells).any():
+                raise ValueError(f"{file_path}: set '{name}' contains empty wells")
+            set_plates.append(wells)
+    return set_plates
+
+
+def sets_by_name(grid):
+    sets = {}
+    for set in grid.sets:
+        sets.setdefault(set.name, []).append(set)
+    return sets
+
+
+def read_plate_grid(file, rows=16, columns=24):
+    # reads a whole plate export (the 615 nm plate, one or more blank lines, the 665 nm plate) into an array of shape
+    # (2, rows, columns); empty wells are nan
+    # file is a path or an open file, in text or binary mode
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, newline="") as f:
+            return read_plate_grid(f, rows, columns)
+    file_path = getattr(file, "name", "<file>")
+
+    # the plates are separated by an empty line, rows of a plate without values still contain the commas
+    blocks, block = [], []
+    for line in file:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.strip():
+            block.append(line.rstrip("\r\n").split(","))
+        elif block:
+            blocks.append(block)
+            block = []
+    if block:
+        blocks.append(block)
+    blocks = [block for block in blocks if any(cell.strip() for cells in block for cell in cells)]
+    if len(blocks) != 2:
+        raise ValueError(f"{file_path}: expected a 615 nm and a 665 nm plate separated by an empty line, "
+                         f"found {len(blocks)} plate(s)")
+
+    plate = np.full((2, rows, columns), np.nan)
+    for channel, block in enumerate(blocks):
+        for i, cells in enumerate(block):
+            for j, cell in enumerate(cells):
+                if not cell.strip():
+                    continue
+                if i >= rows or j >= columns:
+                    raise ValueError(f"{file_path}: value outside of a {rows} x {columns} plate at row {i + 1}, "
+                                     f"column {j + 1}")
+                try:
+                    plate[channel, i, j] = float(cell)
+                except ValueError as e:
+                    raise ValueError(f"{file_path}: {e}")
+
+    return plate
+
+
+def parse_well(well):
+    # "A1" style names, or zero-based [row, column] pairs
+    if isinstance(well, str):
+        match = re.fullmatch(r"\s*([A-Za-z]+)\s*(\d+)\s*", well)
+        if not match:
+            raise ValueError(f"Invalid well '{well}', expected a name like 'A1'")
+        row = 0
+        for letter in match.group(1).upper():
+            row = row * 26 + ord(letter) - ord("A") + 1
+        return row - 1, int(match.group(2)) - 1
+    row, column = well
+    return int(row), int(column)
+
+
+def format_well(well):
+    row, column = well
+    letters = ""
+    row += 1
+    while row:
+        row, remainder = divmod(row - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return f"{letters}{column + 1}"
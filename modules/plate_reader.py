@@ -0,0 +1,133 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.constants import *
+
+
+def find_plate_exports(path):
+    if not os.path.isdir(path):
+        return [path]
+
+    file_paths = []
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            file_path = os.path.join(root, file)
+            if file_path.endswith(".csv"):
+                file_paths.append(file_path)
+    return file_paths
+
+
+def read_plate_exports(file_paths, plate_format=COLUMN_PLATE_FORMAT, workers=None):
+    # files are read concurrently, results keep the order of file_paths
+    # returns a list of (wells, channel) arrays and the time spent reading each file
+    if len(file_paths) == 1:
+        results = [timed_read_plate_export(file_paths[0], plate_format)]
+    else:
+        with ThreadPoolExecutor(max_workers=workers or min(len(file_paths), 8)) as executor:
+            results = list(executor.map(lambda file_path: timed_read_plate_export(file_path, plate_format), file_paths))
+
+    plates = [plate for plate, _ in results]
+    ingest_times = {file_path: seconds for file_path, (_, seconds) in zip(file_paths, results)}
+    return plates, ingest_times
+
+
+def timed_read_plate_export(file_path, plate_format):
+    start = time.perf_counter()
+    plate = read_plate_export(file_path, plate_format)
+    return plate, time.perf_counter() - start
+
+
+def read_plate_export(file, plate_format=COLUMN_PLATE_FORMAT):
+    # file is a path or an open file, in text or binary mode
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, newline="") as f:
+            return parse_plate_export(f, plate_format, file)
+    return parse_plate_export(file, plate_format, getattr(file, "name", "<file>"))
+
+
+def iter_plate_exports(file, plate_format=COLUMN_PLATE_FORMAT):
+    # a multi-plate export holds one plate after another, separated by empty lines; in column format each plate is a
+    # 615 nm and a 665 nm block, in row format a single block with both channels side by side
+    # each plate is parsed and yielded as soon as its last line is read, so only one plate is held in memory
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, newline="") as f:
+            yield from iter_plate_exports(f, plate_format)
+        return
+    file_path = getattr(file, "name", "<file>")
+
+    blocks_per_plate = 1 if plate_format == ROW_PLATE_FORMAT else 2
+    lines, blocks, in_block = [], 0, False
+    for line in file:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.strip():
+            lines.append(line)
+            in_block = True
+        elif in_block:
+            blocks += 1
+            in_block = False
+            if blocks == blocks_per_plate:
+                yield parse_plate_export(lines, plate_format, file_path)
+                lines, blocks = [], 0
+            else:
+                # the empty line stays in the plate so the parser sees where the 665 nm block starts
+                lines.append(line)
+
+    if in_block:
+        blocks += 1
+    if blocks == blocks_per_plate:
+        yield parse_plate_export(lines, plate_format, file_path)
+    elif lines:
+        raise ValueError(f"{file_path}: the last plate is incomplete")
+
+
+def parse_plate_export(lines, plate_format=COLUMN_PLATE_FORMAT, file_path="<file>"):
+    # only populated cells are collected, unused wells are never converted or stored
+    rows, cols, cells = [], [], []
+    for i, line in enumerate(lines):
+        if isinstance(line, bytes):
+            line = line.decode()
+        line = line.rstrip("\r\n").split(",")
+        populated = [(j, cell) for j, cell in enumerate(line) if cell and not cell.isspace()]
+        if populated:
+            populated_cols, populated_cells = zip(*populated)
+            rows.extend([i] * len(populated_cols))
+            cols.extend(populated_cols)
+            cells.extend(populated_cells)
+
+    if not cells:
+        raise ValueError(f"{file_path}: no values found")
+    try:
+        values = np.array(cells, dtype=np.float64)
+    except ValueError as e:
+        raise ValueError(f"{file_path}: {e}")
+
+    # a lane is a column of the export in column format and a row of the export in row format
+    # within a lane, values before the first blank (or non-positive) cell are 615 nm and values after it are 665 nm
+    if plate_format == ROW_PLATE_FORMAT:
+        lanes, positions = np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+    else:
+        lanes, positions = np.array(cols, dtype=np.intp), np.array(rows, dtype=np.intp)
+    order = np.lexsort((positions, lanes))
+    lanes, positions, values = lanes[order], positions[order], values[order]
+
+    # a cell is a separator if it is non-positive or if a blank cell precedes it in its lane
+    lane_starts = np.flatnonzero(np.r_[True, lanes[1:] != lanes[:-1]])
+    expected_positions = np.r_[0, positions[:-1] + 1]
+    expected_positions[lane_starts] = 0
+    separators = (positions > expected_positions) | (values <= 0)
+
+    # every cell after the first separator in a lane belongs to the 665 nm block
+    separators_so_far = np.cumsum(separators)
+    lane_lengths = np.diff(np.r_[lane_starts, len(lanes)])
+    separators_before_lane = np.repeat(separators_so_far[lane_starts] - separators[lane_starts], lane_lengths)
+    after_separator = separators_so_far > separators_before_lane
+
+    populated = values > 0
+    data_615 = values[populated & ~after_separator]
+    data_665 = values[populated & after_separator]
+    if len(data_615) != len(data_665):
+        raise ValueError(f"{file_path}: found {len(data_615)} values at 615 nm but {len(data_665)} values at 665 nm")
+
+    return np.stack((data_615, data_665), axis=-1)
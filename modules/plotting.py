@@ -13,7 +13,7 @@ from openpyxl.chart.axis import ChartLines
 from modules.constants import *
 
 
-def create_chart(worksheet, model):
+def create_chart(worksheet, column_index, model):
     # initialize a chart object, set size, remove legend
     chart = ScatterChart()
     chart.height = 15.24
@@ -58,9 +58,9 @@ def create_chart(worksheet, model):
     chart.x_axis.majorUnit = 1.0
 
     # plot experimental curve as a scatter plot showing only markers
-    x_values, y_values = find_xy_values_in_worksheet(worksheet, CONC, AVERAGE_SIGNAL)
+    x_values, y_values = find_xy_values_in_worksheet(worksheet, column_index, CONC, AVERAGE_SIGNAL)
     series = SeriesFactory(y_values, x_values)
-    series.errBars = get_error_bars(worksheet)
+    series.errBars = get_error_bars(worksheet, column_index)
     series.errBars.spPr = GraphicalProperties(ln=LineProperties(w=25400, solidFill="0000FF"))
     series.marker = Marker(size=10, symbol="circle")
     series.marker.graphicalProperties = GraphicalProperties(solidFill="0000FF", ln=LineProperties(solidFill="0000FF"))
@@ -70,14 +70,14 @@ def create_chart(worksheet, model):
     # plot fitted curve as a smooth line
     x_label = f"x_{model}"
     y_label = f"y_{model}"
-    x_values, y_values = find_xy_values_in_worksheet(worksheet, x_label, y_label)
+    x_values, y_values = find_xy_values_in_worksheet(worksheet, column_index, x_label, y_label)
     series = Series(values=y_values, xvalues=x_values)
     series.graphicalProperties.line.width = 25400
     series.graphicalProperties = GraphicalProperties(ln=LineProperties(solidFill="0000FF"))
     chart.series.append(series)
 
     # plot a helper column to display exponent in x-axis label
-    x_values, y_values = find_xy_values_in_worksheet(worksheet, HELPER_X, HELPER_Y)
+    x_values, y_values = find_xy_values_in_worksheet(worksheet, column_index, HELPER_X, HELPER_Y)
     series = SeriesFactory(y_values, x_values)
     series.graphicalProperties.line.noFill = True
     series.dLbls = DataLabelList()
@@ -91,32 +91,17 @@ def create_chart(worksheet, model):
     return chart
 
 
-def find_xy_values_in_worksheet(worksheet, x_label, y_label):
-    col, row_start, row_end = find_coordinate_by_col_name(worksheet, x_label)
+def find_xy_values_in_worksheet(worksheet, column_index, x_label, y_label):
+    # column_index maps each header on the first row to (col, first row, last row) of its values
+    col, row_start, row_end = column_index[x_label]
     x_values = Reference(worksheet, min_col=col, min_row=row_start, max_row=row_end)
-    col, min_row, max_row = find_coordinate_by_col_name(worksheet, y_label)
+    col, min_row, max_row = column_index[y_label]
     y_values = Reference(worksheet, min_col=col, min_row=row_start, max_row=row_end)
     return x_values, y_values
 
 
-def find_coordinate_by_col_name(worksheet, column_name):
-    col, row_start, row_end = 0, 2, 0
-    for column_cell in worksheet.columns:
-        col += 1
-        if column_cell[0].value == column_name:
-            for column_row in worksheet.iter_cols(min_row=1, min_col=col, max_col=col):
-                for cell in column_row:
-                    if cell.value is not None:
-                        row_end += 1
-                    else:
-                        break
-            break
-
-    return col, row_start, row_end
-
-
-def get_error_bars(worksheet):
-    col, row_start, row_end = find_coordinate_by_col_name(worksheet, STD_DEV)
+def get_error_bars(worksheet, column_index):
+    col, row_start, row_end = column_index[STD_DEV]
     nds = NumDataSource(NumRef(Reference(worksheet, min_col=col, min_row=row_start, max_row=row_end)))
 
     return ErrorBars(plus=nds, minus=nds, errDir="y", errValType="cust")
@@ -0,0 +1,222 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from modules.constants import *
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    name TEXT,
+    processed_at TEXT NOT NULL,
+    max_conc REAL,
+    dilution_factor REAL,
+    direction TEXT,
+    plate_format TEXT,
+    replicates INTEGER,
+    datapoints INTEGER,
+    outlier_search TEXT,
+    max_excluded INTEGER,
+    exclusion_criterion TEXT,
+    bootstrap_samples INTEGER,
+    preferred_model TEXT,
+    input_files TEXT,
+    outputs TEXT
+);
+CREATE TABLE IF NOT EXISTS fits (
+    dataset_id INTEGER NOT NULL REFERENCES datasets (id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    parameter TEXT NOT NULL,
+    value REAL,
+    ci_lower REAL,
+    ci_upper REAL,
+    std_dev REAL,
+    std_err REAL,
+    bootstrap_ci_lower REAL,
+    bootstrap_ci_upper REAL,
+    converged INTEGER,
+    skipped INTEGER,
+    r_squared REAL,
+    aicc REAL,
+    f_test_p REAL,
+    excluded_datapoints TEXT
+);
+CREATE INDEX IF NOT EXISTS datasets_path ON datasets (path);
+CREATE INDEX IF NOT EXISTS datasets_name ON datasets (name);
+CREATE INDEX IF NOT EXISTS datasets_processed_at ON datasets (processed_at);
+CREATE INDEX IF NOT EXISTS fits_dataset ON fits (dataset_id);
+CREATE INDEX IF NOT EXISTS fits_model ON fits (model, parameter);
+"""
+DATASET_COLUMNS = ["path", "name", "processed_at", "max_conc", "dilution_factor", "direction", "plate_format",
+                   "replicates", "datapoints", "outlier_search", "max_excluded", "exclusion_criterion",
+                   "bootstrap_samples", "preferred_model", "input_files", "outputs"]
+FIT_COLUMNS = ["dataset_id", "model", "parameter", "value", "ci_lower", "ci_upper", "std_dev", "std_err",
+               "bootstrap_ci_lower", "bootstrap_ci_upper", "converged", "skipped", "r_squared", "aicc", "f_test_p",
+               "excluded_datapoints"]
+# fit_results keys -> fits columns
+ESTIMATE_COLUMNS = {PARAMETER: "value", CONF_INT_LOWER: "ci_lower", CONF_INT_UPPER: "ci_upper", STD_DEV: "std_dev",
+                    STD_ERR: "std_err", BOOTSTRAP_CI_LOWER: "bootstrap_ci_lower",
+                    BOOTSTRAP_CI_UPPER: "bootstrap_ci_upper"}
+
+
+def open_index(index_path):
+    # several processes can add to the same index, writers wait for each other instead of failing
+    connection = sqlite3.connect(index_path, timeout=INDEX_TIMEOUT)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(INDEX_SCHEMA)
+    return connection
+
+
+def create_index_records(dataset_info, fit_results, input_files, outputs):
+    # the rows describing one processed dataset, built where the results are and inserted by index_results
+    selection = fit_results.get(MODEL_SELECTION, {})
+    dataset = {"path": os.path.abspath(dataset_info[PATH]), "name": dataset_info.get(DATASET_NAME),
+               "processed_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "max_conc": dataset_info[MAX_CONC],
+               "dilution_factor": dataset_info[DIL_FACTOR],
+               "direction": "increasing" if dataset_info[CONC_REVERSE] else "decreasing",
+               "plate_format": "row" if dataset_info.get(PLATE_FORMAT) == ROW_PLATE_FORMAT else "column",
+               "replicates": dataset_info[NUM_REPEATS], "datapoints": dataset_info[NUM_DATAPOINTS],
+               "outlier_search": dataset_info.get(OUTLIER_SEARCH, OUTLIER_SEARCH_ON_FAILURE),
+               "max_excluded": dataset_info.get(MAX_EXCLUDED, 1),
+               "exclusion_criterion": dataset_info.get(EXCLUSION_CRITERION, AICC),
+               "bootstrap_samples": dataset_info.get(BOOTSTRAP_SAMPLES, 0),
+               "preferred_model": selection.get(PREFERRED_MODEL),
+               "input_files": json.dumps(describe_files(input_files)), "outputs": json.dumps(outputs)}
+
+    fits = []
+    for model in MODELS:
+        fit = fit_results[model]
+        for param in FIT_PARAMETERS:
+            if param not in fit:
+                continue
+            row = {column: to_sql_value(fit[param].get(key)) for key, column in ESTIMATE_COLUMNS.items()}
+            row.update({"model": model, "parameter": param, "converged": int(fit.get(FIT_POPT) is not None),
+                        "skipped": int(fit.get(FIT_SKIPPED, False)), "r_squared": to_sql_value(fit.get(FIT_R2)),
+                        "aicc": to_sql_value(selection.get(AICC_SCORES, {}).get(model)),
+                        "f_test_p": to_sql_value(selection.get(F_TEST_P_VALUES, {}).get(model)),
+                        "excluded_datapoints": json.dumps([int(i) for i in fit.get(EXCLUDED_DATAPOINTS, [])])})
+            fits.append(row)
+
+    return {"dataset": dataset, "fits": fits}
+
+
+def describe_files(file_paths):
+    files = []
+    for file_path in file_paths:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            files.append({"path": os.path.abspath(file_path)})
+            continue
+        files.append({"path": os.path.abspath(file_path), "size": stat.st_size,
+                      "modified": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(stat.st_mtime))})
+    return files
+
+
+def to_sql_value(value):
+    # nan is stored as NULL, the 999 of fits that did not converge are kept as in the output files
+    if value is None:
+        return None
+    value = float(value)
+    return None if value != value else value
+
+
+def index_results(entries):
+    # entries are dataset_info dicts or batch results; the records of each index are inserted in one transaction
+    # returns the number of datasets added
+    by_index = {}
+    for entry in entries:
+        if entry.get(RESULTS_INDEX) and entry.get(INDEX_RECORDS):
+            by_index.setdefault(entry[RESULTS_INDEX], []).append(entry[INDEX_RECORDS])
+
+    for index_path, records in by_index.items():
+        connection = open_index(index_path)
+        try:
+            with connection:
+                for record in records:
+                    cursor = connection.execute(
+                        f"INSERT INTO datasets ({', '.join(DATASET_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(DATASET_COLUMNS))})",
+                        [record["dataset"][column] for column in DATASET_COLUMNS])
+                    connection.executemany(
+                        f"INSERT INTO fits ({', '.join(FIT_COLUMNS)}) VALUES ({', '.join('?' * len(FIT_COLUMNS))})",
+                        [[cursor.lastrowid] + [fit[column] for column in FIT_COLUMNS[1:]] for fit in record["fits"]])
+        finally:
+            connection.close()
+    return sum(len(records) for records in by_index.values())
+
+
+def query_index(index_path, name=None, path=None, model=None, parameter=None, since=None, until=None,
+                preferred_only=False):
+    # name and path are SQL LIKE patterns (% matches anything), since and until are ISO dates or times
+    conditions, values = [], []
+    for column, value in (("d.name", name), ("d.path", path)):
+        if value:
+            conditions.append(f"{column} LIKE ?")
+            values.append(value)
+    for column, value in (("f.model", model), ("f.parameter", parameter)):
+        if value:
+            conditions.append(f"{column} = ?")
+            values.append(value)
+    if since:
+        conditions.append("d.processed_at >= ?")
+        values.append(since)
+    if until:
+        # a date includes the whole day
+        conditions.append("d.processed_at <= ?")
+        values.append(until if "T" in until else f"{until}T23:59:59")
+    if preferred_only:
+        conditions.append("f.model = d.preferred_model")
+
+    columns = [f"d.{column}" for column in DATASET_COLUMNS] + [f"f.{column}" for column in FIT_COLUMNS[1:]]
+    query = f"SELECT {', '.join(columns)} FROM fits f JOIN datasets d ON d.id = f.dataset_id"
+    if conditions:
+        query += f" WHERE {' AND '.join(conditions)}"
+    query += " ORDER BY d.processed_at, d.id, f.model, f.parameter"
+
+    connection = open_index(index_path)
+    try:
+        cursor = connection.execute(query, values)
+        yield [description[0] for description in cursor.description]
+        yield from cursor
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export fit results from a results index as CSV.")
+    parser.add_argument("index", help="SQLite results index written with dataProcess.py --index")
+    parser.add_argument("--name", help="dataset name pattern, e.g. 'construct_X%%'")
+    parser.add_argument("--path", help="dataset path pattern, e.g. '%%/2024-05/%%'")
+    parser.add_argument("--model", choices=MODELS, help="only fits of this model")
+    parser.add_argument("--parameter", choices=FIT_PARAMETERS, help="only this parameter")
+    parser.add_argument("--since", help="processed on or after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", help="processed on or before this date (YYYY-MM-DD)")
+    parser.add_argument("--preferred", action="store_true", help="only fits of each dataset's preferred model")
+    parser.add_argument("--output", help="CSV file to write (default: standard output)")
+    args = parser.parse_args()
+    if not os.path.exists(args.index):
+        parser.error(f"{args.index} does not exist")
+
+    rows = query_index(args.index, args.name, args.path, args.model, args.parameter, args.since, args.until,
+                       args.preferred)
+    f = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        writer = csv.writer(f)
+        count = 0
+        for count, row in enumerate(rows):
+            writer.writerow(row)
+    finally:
+        if args.output:
+            f.close()
+    print(f"{count} row(s) exported", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
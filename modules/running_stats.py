@@ -0,0 +1,98 @@
+import time
+
+from modules.pipeline import *
+
+
+class RunningStatistics:
+    # mean and sum of squared deviations of each datapoint, updated one replicate at a time with Welford's algorithm
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if self.count == 0:
+            self.mean = np.zeros_like(values)
+            self.m2 = np.zeros_like(values)
+        elif values.shape != self.mean.shape:
+            raise ValueError("All replicates must contain the same number of wells")
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    def remove(self, values):
+        # the reverse of add, for replicates that were changed or deleted
+        values = np.asarray(values, dtype=np.float64)
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, None, None
+            return
+        self.count -= 1
+        previous_mean = self.mean - (values - self.mean) / self.count
+        self.m2 -= (values - previous_mean) * (values - self.mean)
+        np.maximum(self.m2, 0, out=self.m2)
+        self.mean = previous_mean
+
+    def statistics(self):
+        # the same values as calculate_signal_statistics
+        with np.errstate(all="ignore"):
+            std_devs = np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.full_like(self.mean, np.nan)
+        return {AVERAGE_SIGNAL: self.mean.copy(), STD_DEV: std_devs, STD_ERR: std_devs / np.sqrt(self.count)}
+
+    def normalization_bounds(self):
+        return np.min(self.mean), np.max(self.mean)
+
+
+class IncrementalDataset:
+    # the corrected signal of each replicate file of a dataset and their running statistics; only files that are new
+    # or changed since the last update are read
+    def __init__(self, plate_format=COLUMN_PLATE_FORMAT):
+        self.plate_format = plate_format
+        self.replicates = {}
+        self.signatures = {}
+        self.statistics = RunningStatistics()
+
+    def update(self, signatures):
+        # signatures maps each file of the dataset to its size and modification time
+        # returns the time spent reading each file that was read
+        for file_path in [file_path for file_path in self.replicates if file_path not in signatures]:
+            self.statistics.remove(self.replicates.pop(file_path))
+            del self.signatures[file_path]
+
+        ingest_times = {}
+        for file_path, signature in signatures.items():
+            if self.signatures.get(file_path) == signature:
+                continue
+            start = time.perf_counter()
+            plate = read_plate_export(file_path, self.plate_format)
+            ingest_times[file_path] = time.perf_counter() - start
+            values = correct_signal(format_raw_signal([plate]))[0]
+
+            if file_path in self.replicates:
+                self.statistics.remove(self.replicates.pop(file_path))
+            self.statistics.add(values)
+            self.replicates[file_path] = values
+            self.signatures[file_path] = signature
+        return ingest_times
+
+    def create_signals(self, dataset_info):
+        # the corrected and normalized signal as built by process_plates; the normalized statistics are the running
+        # statistics scaled by the normalization bounds
+        if not self.replicates:
+            raise ValueError(f"{dataset_info[PATH]}: no plate exports")
+        order = [file_path for file_path in find_plate_exports(dataset_info[PATH]) if file_path in self.replicates]
+        order += sorted(set(self.replicates) - set(order))
+        values = np.stack([self.replicates[file_path] for file_path in order])
+        dataset_info[NUM_REPEATS], dataset_info[NUM_DATAPOINTS] = values.shape
+
+        statistics = self.statistics.statistics()
+        global_min, global_max = self.statistics.normalization_bounds()
+        scale = global_max - global_min
+        corrected_signal = {SIGNAL_VALUES: values, STATS: statistics}
+        normalized_signal = {SIGNAL_VALUES: (values - global_min) / scale,
+                             STATS: {AVERAGE_SIGNAL: (statistics[AVERAGE_SIGNAL] - global_min) / scale,
+                                     STD_DEV: statistics[STD_DEV] / scale, STD_ERR: statistics[STD_ERR] / scale}}
+        corrected_signal[CONC] = normalized_signal[CONC] = calculate_concentrations(dataset_info)
+        corrected_signal[LOG_CONC] = normalized_signal[LOG_CONC] = convert_conc_to_log(corrected_signal[CONC])
+        return corrected_signal, normalized_signal
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import time
+
+from modules.atomic import atomic_output
+from modules.curve_fitting import *
+from modules.metrics import *
+
+
+def output_columnar(data_info, signal_corrected, signal_normalized, fit_data, output_dir=None, fitted_curves=None):
+    # each table is a Parquet dataset (a directory of part files) with one part file per processed dataset,
+    # so many datasets, or concurrent batch workers, can append to the same output directory; processing a dataset
+    # again replaces its part files, so the tables never hold two runs of the same dataset
+    pa, pq = import_pyarrow()
+    output_dir = output_dir or data_info.get(COLUMNAR_PATH) or create_output_dirname(data_info[PATH])
+    dataset_id = create_dataset_id(data_info[PATH], data_info.get(DATASET_NAME))
+    if fitted_curves is None:
+        fitted_curves = calculate_fitted_curves(signal_normalized, fit_data,
+                                                data_info.get(CURVE_STEP_RATIO, DEFAULT_CURVE_STEP_RATIO))
+
+    tables = {SIGNAL_TABLE: create_signal_columns(data_info, signal_corrected, signal_normalized),
+              FIT_TABLE: create_fit_columns(fit_data),
+              CURVE_TABLE: create_curve_columns(fitted_curves),
+              DATASET_TABLE: create_dataset_columns(data_info)}
+
+    # returns the files written for this dataset
+    output_files = []
+    for table_name, columns in tables.items():
+        table_dir = os.path.join(output_dir, table_name)
+        os.makedirs(table_dir, exist_ok=True)
+        num_rows = len(next(iter(columns.values())))
+        columns = {"dataset": pa.array([dataset_id] * num_rows, pa.string()), **columns}
+        output_files.append(os.path.join(table_dir, f"{dataset_id}.parquet"))
+        with atomic_output(output_files[-1]) as temp_path:
+            pq.write_table(pa.table(columns), temp_path)
+        count(data_info, "parquet_rows_written", num_rows)
+
+    return output_files
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet output requires pyarrow, install it with 'pip3 install pyarrow'")
+    return pyarrow, pyarrow.parquet
+
+
+def create_output_dirname(path):
+    # same naming as the xlsx output, with a directory in place of the workbook
+    if path.endswith(".csv"):
+        root, extension = os.path.splitext(path)
+        return f"{root}_results"
+    return os.path.join(path, f"{os.path.basename(os.path.normpath(path))}_results")
+
+
+def create_dataset_id(path, dataset_name=None):
+    # the same for every run of a dataset; the hash of the full path tells apart datasets with the same name
+    name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+    if dataset_name:
+        name = f"{name}_{dataset_name}"
+    digest = hashlib.sha256(f"{os.path.abspath(path)}\0{dataset_name or ''}".encode()).hexdigest()
+    return f"{name}_{digest[:12]}"
+
+
+def create_signal_columns(data_info, signal_corrected, signal_normalized):
+    # one row per replicate and datapoint
+    pa, _ = import_pyarrow()
+    num_repeats, num_datapoints = np.shape(signal_corrected[SIGNAL_VALUES])
+    return {"replicate": pa.array(np.repeat(np.arange(1, num_repeats + 1), num_datapoints), pa.int32()),
+            "datapoint": pa.array(np.tile(np.arange(num_datapoints), num_repeats), pa.int32()),
+            "concentration_nM": pa.array(np.tile(signal_corrected[CONC], num_repeats), pa.float64()),
+            "log_concentration": pa.array(np.tile(signal_corrected[LOG_CONC], num_repeats), pa.float64()),
+            "corrected_signal": pa.array(np.ravel(signal_corrected[SIGNAL_VALUES]), pa.float64()),
+            "normalized_signal": pa.array(np.ravel(signal_normalized[SIGNAL_VALUES]), pa.float64())}
+
+
+def create_fit_columns(fit_data):
+    # one row per model and fitted parameter
+    pa, _ = import_pyarrow()
+    columns = {"model": [], "parameter": [], "value": [], "ci_lower": [], "ci_upper": [], "std_dev": [],
+               "std_err": [], "evaluations": [], "excluded_datapoints": [], "r_squared": [], "aicc": [],
+               "f_test_p": [], "preferred": [], "bootstrap_ci_lower": [], "bootstrap_ci_upper": [],
+               "bootstrap_converged": []}
+    selection = fit_data.get(MODEL_SELECTION, {})
+    for model in MODELS:
+        for param in FIT_PARAMETERS:
+            if param not in fit_data[model]:
+                continue
+            columns["model"].append(model)
+            columns["parameter"].append(param)
+            columns["value"].append(float(fit_data[model][param][PARAMETER]))
+            columns["ci_lower"].append(float(fit_data[model][param][CONF_INT_LOWER]))
+            columns["ci_upper"].append(float(fit_data[model][param][CONF_INT_UPPER]))
+            columns["std_dev"].append(float(fit_data[model][param][STD_DEV]))
+            columns["std_err"].append(float(fit_data[model][param][STD_ERR]))
+            columns["evaluations"].append(int(fit_data[model].get(FIT_EVALUATIONS, 0)))
+            columns["excluded_datapoints"].append([int(i) for i in fit_data[model].get(EXCLUDED_DATAPOINTS, [])])
+            columns["r_squared"].append(float(fit_data[model].get(FIT_R2, np.nan)))
+            columns["aicc"].append(float(selection.get(AICC_SCORES, {}).get(model, np.nan)))
+            columns["f_test_p"].append(float(selection.get(F_TEST_P_VALUES, {}).get(model, np.nan)))
+            columns["preferred"].append(selection.get(PREFERRED_MODEL) == model)
+            columns["bootstrap_ci_lower"].append(float(fit_data[model][param].get(BOOTSTRAP_CI_LOWER, np.nan)))
+            columns["bootstrap_ci_upper"].append(float(fit_data[model][param].get(BOOTSTRAP_CI_UPPER, np.nan)))
+            columns["bootstrap_converged"].append(int(fit_data[model].get(BOOTSTRAP_CONVERGED, 0)))
+
+    types = {"model": pa.string(), "parameter": pa.string(), "evaluations": pa.int64(),
+             "excluded_datapoints": pa.list_(pa.int32()), "preferred": pa.bool_(),
+             "bootstrap_converged": pa.int64()}
+    return {name: pa.array(values, types.get(name, pa.float64())) for name, values in columns.items()}
+
+
+def create_curve_columns(fitted_curves):
+    # one row per sampled point of each fitted curve
+    pa, _ = import_pyarrow()
+    models = [model for model in MODELS for _ in range(len(fitted_curves[model][f"x_{model}"]))]
+    return {"model": pa.array(models, pa.string()),
+            "concentration_nM": pa.array(np.concatenate([fitted_curves[model][f"x_{model}"] for model in MODELS]),
+                                         pa.float64()),
+            "fitted_signal": pa.array(np.concatenate([fitted_curves[model][f"y_{model}"] for model in MODELS]),
+                                      pa.float64())}
+
+
+def create_dataset_columns(data_info):
+    # a single row describing the input and the parameters it was processed with
+    pa, _ = import_pyarrow()
+    return {"path": pa.array([os.path.abspath(data_info[PATH])], pa.string()),
+            "max_conc_mM": pa.array([float(data_info[MAX_CONC])], pa.float64()),
+            "dilution_factor": pa.array([float(data_info[DIL_FACTOR])], pa.float64()),
+            "increasing_conc": pa.array([bool(data_info[CONC_REVERSE])], pa.bool_()),
+            "plate_format": pa.array([data_info[PLATE_FORMAT]], pa.string()),
+            "replicates": pa.array([int(data_info[NUM_REPEATS])], pa.int32()),
+            "datapoints": pa.array([int(data_info[NUM_DATAPOINTS])], pa.int32()),
+            "processed_at": pa.array([time.strftime("%Y-%m-%dT%H:%M:%S")], pa.string())}
@@ -1,69 +1,107 @@
 import os
 import time
 
-import openpyxl.chart.label
+import openpyxl
 import openpyxl.utils.cell
-import pandas as pd
-from openpyxl.styles import Font
+from openpyxl.cell import WriteOnlyCell
+import openpyxl.styles
 
+from modules.atomic import atomic_output
+from modules.curve_fitting import *
+from modules.metrics import *
 from modules.plotting import *
 
 
-def output_results(data_info, signal_corrected, signal_normalized, fit_data):
-    path = data_info[PATH]
-    workbook = create_workbook(path)
-    writer = pd.ExcelWriter(workbook, engine="openpyxl", mode="a", if_sheet_exists="overlay")
+def output_results(data_info, signal_corrected, signal_normalized, fit_data, low_memory=False, fitted_curves=None,
+                   filename=None):
+    # the "Data" sheet is laid out in memory as a map of (row, col) -> value and written to the workbook in one pass
+    cells = {}
+    bold_cells = set()
+    column_index = {}
 
     # add normalized data to the output file
     row = 0
-    write_signal_data(signal_normalized, writer, WS_NAME, row)
+    write_table(cells, create_signal_table(signal_normalized), row, column_index=column_index)
 
     # add unnormalized data to output file
     row = data_info[NUM_DATAPOINTS] + 5
-    write_signal_data(signal_corrected, writer, WS_NAME, row)
+    write_table(cells, create_signal_table(signal_corrected), row)
 
     # add theoretical data based on models
+    if fitted_curves is None:
+        fitted_curves = calculate_fitted_curves(signal_normalized, fit_data,
+                                                data_info.get(CURVE_STEP_RATIO, DEFAULT_CURVE_STEP_RATIO))
     col = 17
     for model in MODELS:
-        fitted_curve_datapoints = calculate_fitted_curve_datapoints(signal_normalized, fit_data, model)
-        df_fitted_data = pd.DataFrame(data=fitted_curve_datapoints)
-        df_fitted_data.to_excel(writer, sheet_name=WS_NAME, index=False, startcol=col)
+        write_table(cells, fitted_curves[model], col=col, column_index=column_index)
         col += 3
 
     # add helper series for chart x-axis labels
-    df_helper_data = pd.DataFrame(
-        data={HELPER_X: [1e-1, 1e0, 1e1, 1e2, 1e3, 1e4, 1e5], HELPER_Y: [-0.1, -0.1, -0.1, -0.1, -0.1, -0.1, -0.1],
-              HELPER_LABEL: [f"{' ' * 10}-1", f"{' ' * 9}0", f"{' ' * 9}1", f"{' ' * 9}2", f"{' ' * 9}3", f"{' ' * 9}4",
-                             f"{' ' * 9}5"]})
-    df_helper_data.to_excel(writer, sheet_name=WS_NAME, index=False, startcol=col)
+    helper_data = {HELPER_X: [1e-1, 1e0, 1e1, 1e2, 1e3, 1e4, 1e5], HELPER_Y: [-0.1, -0.1, -0.1, -0.1, -0.1, -0.1, -0.1],
+                   HELPER_LABEL: [f"{' ' * 10}-1", f"{' ' * 9}0", f"{' ' * 9}1", f"{' ' * 9}2", f"{' ' * 9}3",
+                                  f"{' ' * 9}4", f"{' ' * 9}5"]}
+    write_table(cells, helper_data, col=col, column_index=column_index)
 
-    # add plots of log(concentration) vs. normalized signal including the fitted curve according to each model
-    plot_worksheet = writer.sheets[WS_NAME]
+    # add curve fitting data below each chart
     row = 2
-    chart_col = chr(DEFAULT_COL_NUM + data_info[NUM_REPEATS] + ord("A"))
     fit_col = DEFAULT_COL_NUM + data_info[NUM_REPEATS]
+    chart_rows = []
     for model in MODELS:
-        chart = create_chart(plot_worksheet, model)
-        plot_worksheet.add_chart(chart, f"{chart_col}{row}")
+        chart_rows.append(row)
         row += CHART_ROW_HEIGHT + 3
 
-        # add curve fitting data
-        title_cell = plot_worksheet[f"{chr(fit_col + ord('A'))}{row}"]
-        title_cell.value = model
-        title_cell.font = openpyxl.styles.Font(bold=True)
-        df_fit = create_fit_DataFrame(fit_data[model])
-        df_fit.to_excel(writer, sheet_name=WS_NAME, index=False, header=True, startrow=row, startcol=fit_col)
+        title = model
+        if fit_data[model].get(FIT_SKIPPED):
+            title = f"{model} (not fitted)"
+        elif fit_data[model].get(EXCLUDED_DATAPOINTS):
+            excluded_conc = ", ".join(f"{signal_normalized[CONC][i]:g}" for i in fit_data[model][EXCLUDED_DATAPOINTS])
+            title = f"{model} (excluded {excluded_conc} nM)"
+        cells[(row, fit_col + 1)] = title
+        bold_cells.add((row, fit_col + 1))
+        write_table(cells, create_fit_table(fit_data[model]), row, fit_col)
+        # bootstrap intervals go below the fit table, the columns to its right hold the fitted curves
+        if BOOTSTRAP_CI_LOWER in fit_data[model][KD]:
+            write_table(cells, create_bootstrap_table(fit_data[model]), row + 3, fit_col)
 
         row += 7
 
-    writer.close()
+    # add the model comparison below the last fit
+    if fit_data.get(MODEL_SELECTION):
+        cells[(row, fit_col + 1)] = f"{PREFERRED_MODEL}: {fit_data[MODEL_SELECTION][PREFERRED_MODEL] or 'none'}"
+        bold_cells.add((row, fit_col + 1))
+        write_table(cells, create_selection_table(fit_data[MODEL_SELECTION]), row, fit_col)
 
-    return
+    workbook, worksheet = create_workbook(low_memory)
+    if not low_memory:
+        write_cells(worksheet, cells, bold_cells)
+
+    # add plots of log(concentration) vs. normalized signal including the fitted curve according to each model
+    chart_col = chr(DEFAULT_COL_NUM + data_info[NUM_REPEATS] + ord("A"))
+    for model, chart_row in zip(MODELS, chart_rows):
+        chart = create_chart(worksheet, column_index, model)
+        worksheet.add_chart(chart, f"{chart_col}{chart_row}")
+
+    if low_memory:
+        stream_cells(worksheet, cells, bold_cells)
+
+    # filename can also be an open binary file
+    filename = filename or create_output_filename(data_info[PATH], data_info.get(DATASET_NAME))
+    if isinstance(filename, (str, os.PathLike)):
+        with atomic_output(filename) as temp_path:
+            workbook.save(temp_path)
+    else:
+        workbook.save(filename)
+    count(data_info, "xlsx_rows_written", max(row for row, _ in cells))
 
+    return filename
 
-def create_workbook(path):
+
+def create_output_filename(path, dataset_name=None):
     # add a suffix with the current time so the file will always be unique
     filename_suffix = time.strftime("%Y%m%d-%H%M%S")
+    # datasets extracted from a plate layout share their input file and are told apart by their name
+    if dataset_name:
+        filename_suffix = f"{dataset_name}_{filename_suffix}"
 
     # if a single input file was provided, output will have the same filename with xlsx extension
     # if a directory was provided as input, the output name will have the name of the directory
@@ -74,55 +112,109 @@ def create_workbook(path):
         parent_dir = os.path.basename(path)
         filename = f"{path}/{parent_dir}_{filename_suffix}.xlsx"
 
-    # open a new workbook and rename the default worksheet name
-    workbook = openpyxl.Workbook()
-    workbook["Sheet"].title = WS_NAME
-
-    # increase the width of a number of columns
-    resize_columns(workbook)
+    return filename
 
-    workbook.save(filename)
 
-    # returns the path to the output file so that ExcelWriter and other writing functions can find it
-    return filename
+def create_workbook(low_memory=False):
+    # in low memory mode rows are streamed to the file when it is saved instead of being kept as cell objects
+    if low_memory:
+        workbook = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet(WS_NAME)
+    else:
+        workbook = openpyxl.Workbook()
+        worksheet = workbook["Sheet"]
+        worksheet.title = WS_NAME
 
+    # increase the width of a number of columns
+    resize_columns(worksheet)
 
-def resize_columns(workbook):
-    for worksheet in workbook.sheetnames:
-        sheet = workbook[worksheet]
-        for col_idx in range(1, 40):
-            col_letter = openpyxl.utils.get_column_letter(col_idx)
-            sheet.column_dimensions[col_letter].width = 17
+    return workbook, worksheet
 
-    return
 
+def resize_columns(worksheet):
+    for col_idx in range(1, 40):
+        col_letter = openpyxl.utils.get_column_letter(col_idx)
+        worksheet.column_dimensions[col_letter].width = 17
 
-def write_signal_data(data, writer, worksheet, row=0, col=0):
-    df = create_signal_DataFrame(data)
-    df.to_excel(writer, sheet_name=worksheet, index=False, startrow=row, startcol=col)
+    return
 
 
-def create_signal_DataFrame(signal_data):
+def write_table(cells, table, row=0, col=0, column_index=None):
+    # same placement as DataFrame.to_excel(startrow=row, startcol=col, index=False): header first, then values
+    # tables starting on the first row are added to column_index as header -> (col, first row, last row) so that
+    # chart series can be found without scanning the sheet; a series ends at its first empty cell
+    for j, (header, values) in enumerate(table.items()):
+        cells[(row + 1, col + j + 1)] = header
+        series_end = None
+        for i, value in enumerate(values):
+            value = to_cell_value(value)
+            cells[(row + i + 2, col + j + 1)] = value
+            if value is None and series_end is None:
+                series_end = row + i + 1
+        if column_index is not None and row == 0:
+            column_index.setdefault(header, (col + j + 1, 2, series_end or len(values) + 1))
+
+
+def to_cell_value(value):
+    # missing values are left empty and infinite values written as text, as pandas does
+    if isinstance(value, (float, np.floating)):
+        if np.isnan(value):
+            return None
+        if np.isinf(value):
+            return "inf" if value > 0 else "-inf"
+        return float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+def write_cells(worksheet, cells, bold_cells):
+    for (row, col), value in cells.items():
+        if value is None:
+            continue
+        cell = worksheet.cell(row=row, column=col, value=value)
+        if (row, col) in bold_cells:
+            cell.font = openpyxl.styles.Font(bold=True)
+
+
+def stream_cells(worksheet, cells, bold_cells):
+    rows = {}
+    for (row, col), value in cells.items():
+        rows.setdefault(row, {})[col] = value
+
+    for row in range(1, max(rows, default=0) + 1):
+        row_cells = rows.get(row, {})
+        values = [None] * max(row_cells, default=0)
+        for col, value in row_cells.items():
+            if (row, col) in bold_cells:
+                value = WriteOnlyCell(worksheet, value=value)
+                value.font = openpyxl.styles.Font(bold=True)
+            values[col - 1] = value
+        worksheet.append(values)
+
+
+def create_signal_table(signal_data):
     data = {}
     for column in SIGNAL_DATAFRAME_FORMAT:
         if column == SIGNAL_VALUES:
-            for repeat in signal_data[column]:
+            for repeat, values in enumerate(signal_data[column], start=1):
                 label = f"Repeat {repeat}"
-                data[label] = signal_data[column][repeat]
+                data[label] = values
         elif column == STATS:
             for stat in signal_data[column]:
                 data[stat] = signal_data[column][stat]
         else:
             data[column] = signal_data[column]
 
-    data = {**{CONC: signal_data[CONC]}, **data}
-    df = pd.DataFrame(data)
-    return df
+    return {**{CONC: signal_data[CONC]}, **data}
 
 
-def create_fit_DataFrame(fit_data):
+def create_fit_table(fit_data):
     data = {PARAMETER: [], VALUE: [], CONF_INT_LOWER: [], CONF_INT_UPPER: [], STD_DEV: [], STD_ERR: []}
-    for param, value in fit_data.items():
+    for param in FIT_PARAMETERS:
+        if param not in fit_data:
+            continue
+        value = fit_data[param]
         data[PARAMETER].append(param)
         data[VALUE].append(value[PARAMETER])
         data[CONF_INT_LOWER].append(value[CONF_INT_LOWER])
@@ -130,34 +222,16 @@ def create_fit_DataFrame(fit_data):
         data[STD_DEV].append(value[STD_DEV])
         data[STD_ERR].append(value[STD_ERR])
 
-    df = pd.DataFrame(data)
-    return df
-
+    return data
 
-def calculate_fitted_curve_datapoints(signal_data, fit_data, model):
-    max_concentration = signal_data[CONC][0] * 1.2
-    min_concentration = signal_data[CONC][-1] * 0.8
-    kd = fit_data[model][KD][PARAMETER]
-    model_equation = MODEL_EQUATIONS[model]
 
-    fit_x_values = []
-    fit_y_values = []
-
-    current_x = max_concentration
-    while current_x > min_concentration:
-        fit_x_values.append(current_x)
-        if model == COOPERATIVE_MODEL:
-            nH = fit_data[model][NH][PARAMETER]
-            y_val = model_equation(current_x, kd, nH)
-        else:
-            y_val = model_equation(current_x, kd)
-        fit_y_values.append(y_val)
-        if np.any(np.isnan(y_val)):
-            fit_x_values = fit_y_values = []
-            break
-        current_x *= 0.9
+def create_bootstrap_table(fit_data):
+    params = [param for param in FIT_PARAMETERS if param in fit_data]
+    return {PARAMETER: params, BOOTSTRAP_CI_LOWER: [fit_data[param][BOOTSTRAP_CI_LOWER] for param in params],
+            BOOTSTRAP_CI_UPPER: [fit_data[param][BOOTSTRAP_CI_UPPER] for param in params]}
 
-    x_values_label = f"x_{model}"
-    y_values_label = f"y_{model}"
 
-    return {x_values_label: fit_x_values, y_values_label: fit_y_values}
+def create_selection_table(selection):
+    models = [model for model in MODEL_FIT_ORDER if model in selection[AICC_SCORES]]
+    return {SELECTION_MODEL: models, AICC_SCORES: [selection[AICC_SCORES][model] for model in models],
+            F_TEST_P_VALUES: [selection[F_TEST_P_VALUES].get(model, np.nan) for model in models]}
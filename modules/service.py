@@ -0,0 +1,225 @@
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from modules.api import *
+from modules.batch import *
+from modules.watch import warm_up_worker
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceStats:
+    # latencies are measured from the end of reading the request to the end of writing the response
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=SERVICE_LATENCY_WINDOW)
+
+    def record(self, seconds, failed=False):
+        with self.lock:
+            self.completed += 1
+            self.failed += failed
+            self.latencies.append(seconds)
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            uptime = time.perf_counter() - self.started
+            output = {"uptime_s": uptime, "requests": self.completed, "failed": self.failed,
+                      "rejected": self.rejected, "in_flight": self.in_flight,
+                      "throughput_per_s": self.completed / uptime if uptime > 0 else 0.0}
+        if len(latencies):
+            output["latency_ms"] = {"mean": float(latencies.mean()), "max": float(latencies.max()),
+                                    **{f"p{q}": float(np.percentile(latencies, q)) for q in (50, 90, 99)}}
+        return output
+
+
+class AnalysisService(ThreadingHTTPServer):
+    # requests are handled in threads and analysed in a pool of worker processes that are started and warmed up
+    # before the first request; at most max_pending requests are queued or running, others are rejected with 503
+    daemon_threads = True
+
+    def __init__(self, address, workers=None, max_pending=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_up_service_worker)
+        self.slots = threading.BoundedSemaphore(max_pending or 2 * self.workers)
+        self.stats = ServiceStats()
+        super().__init__(address, AnalysisRequestHandler)
+
+    def warm_up(self):
+        # every worker has to be busy at once for all of them to be started
+        pids = set(self.executor.map(get_worker_pid, [0.2] * self.workers))
+        logger.info("%d worker(s) ready", len(pids))
+
+    def server_close(self):
+        super().server_close()
+        shutdown_executor(self.executor)
+
+
+class AnalysisRequestHandler(BaseHTTPRequestHandler):
+    server_version = "TRFRETService/1.0"
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self.send_json(200, {"status": "ok", "workers": self.server.workers})
+        elif path == "/stats":
+            self.send_json(200, self.server.stats.summary())
+        else:
+            self.send_json(404, {"error": f"Unknown path '{path}'"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/analyze":
+            self.send_json(404, {"error": f"Unknown path '{url.path}'"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > SERVICE_MAX_REQUEST_BYTES:
+            self.send_json(413, {"error": f"Request larger than {SERVICE_MAX_REQUEST_BYTES} bytes"})
+            self.close_connection = True
+            return
+        body = self.rfile.read(length)
+
+        if not self.server.slots.acquire(blocking=False):
+            with self.server.stats.lock:
+                self.server.stats.rejected += 1
+            self.send_json(503, {"error": "Too many requests, try again later"}, {"Retry-After": "1"})
+            return
+
+        start = time.perf_counter()
+        with self.server.stats.lock:
+            self.server.stats.in_flight += 1
+        status = 500
+        future, release_slot = None, True
+        try:
+            plates, parameters = parse_analysis_request(body, self.headers.get("Content-Type", ""),
+                                                        dict(parse_qsl(url.query)))
+            output_format = str(parameters.pop("format", "json")).lower()
+            future = self.server.executor.submit(analyze_request, plates, parameters, output_format == "xlsx")
+            status, content = 200, future.result(timeout=SERVICE_REQUEST_TIMEOUT)
+            headers = {"X-Processing-Time-Ms": f"{(time.perf_counter() - start) * 1000:.1f}"}
+            if output_format == "xlsx":
+                self.send_body(status, content, XLSX_CONTENT_TYPE, headers)
+            else:
+                self.send_json(status, content, headers)
+        except ValueError as e:
+            status = 400
+            self.send_json(status, {"error": str(e)})
+        except TimeoutError:
+            status = 504
+            # a job that is still running keeps its slot until it finishes, so timed out requests cannot pile up
+            # more work than max_pending
+            if not future.cancel():
+                release_slot = False
+                future.add_done_callback(lambda _: self.server.slots.release())
+            self.send_json(status, {"error": f"Analysis took longer than {SERVICE_REQUEST_TIMEOUT} s"})
+        except Exception as e:
+            logger.exception("Request failed")
+            self.send_json(status, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            if release_slot:
+                self.server.slots.release()
+            latency = time.perf_counter() - start
+            with self.server.stats.lock:
+                self.server.stats.in_flight -= 1
+            self.server.stats.record(latency, status != 200)
+            logger.info("POST %s %d %.1f ms", url.path, status, latency * 1000)
+
+    def send_json(self, status, content, headers=None):
+        self.send_body(status, json.dumps(to_json_value(content)).encode(), "application/json", headers)
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def serve(host=DEFAULT_SERVICE_HOST, port=DEFAULT_SERVICE_PORT, workers=None, max_pending=None):
+    with AnalysisService((host, port), workers, max_pending) as server:
+        server.warm_up()
+        logger.info("Serving on http://%s:%d", *server.server_address[:2])
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopped, %s", json.dumps(to_json_value(server.stats.summary())))
+
+
+def parse_analysis_request(body, content_type, query):
+    # a JSON object with the plate exports under "plates" (one per replicate) and the parameters of a batch
+    # manifest, or a single plate export as the body with the parameters in the query string
+    if content_type.startswith("application/json"):
+        try:
+            request = json.loads(body)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if not isinstance(request, dict) or not isinstance(request.get("plates"), list) or not request["plates"]:
+            raise ValueError("Expected a JSON object with a non-empty list of plate exports under 'plates'")
+        plates = request.pop("plates")
+        return plates, {**query, **request}
+    if not body:
+        raise ValueError("Request has no plate export")
+    return [body], query
+
+
+def analyze_request(plates, parameters, xlsx=False):
+    # runs in a worker process; returns the results as a dict, or the workbook as bytes
+    # the path only names the dataset, nothing is read from or written to it
+    dataset_info = create_dataset_info({**parameters, MANIFEST_PATH: "<request>"})
+    files = []
+    for number, plate in enumerate(plates, start=1):
+        files.append(io.BytesIO(plate.encode() if isinstance(plate, str) else plate))
+        files[-1].name = f"plate {number}"  # used in error messages
+    plates = [read_plate_export(file, dataset_info[PLATE_FORMAT]) for file in files]
+    result = create_analysis_result(*process_plates(dataset_info, plates))
+    if xlsx:
+        buffer = io.BytesIO()
+        render_xlsx(result, buffer, dataset_info[LOW_MEMORY_OUTPUT], dataset_info[CURVE_STEP_RATIO])
+        return buffer.getvalue()
+    return result
+
+
+def to_json_value(value):
+    # result objects become objects of their attributes, arrays become lists and nan and infinity become null
+    if hasattr(value, "__slots__"):
+        return {name: to_json_value(getattr(value, name)) for name in value.__slots__}
+    if isinstance(value, dict):
+        return {str(key): to_json_value(item) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        return to_json_value(value.tolist())
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def warm_up_service_worker():
+    warm_up_worker()
+    import modules.save_xlsx
+
+
+def get_worker_pid(delay):
+    time.sleep(delay)
+    return os.getpid()
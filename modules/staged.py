@@ -0,0 +1,174 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from modules.batch import *
+from modules.pipeline import *
+
+logger = logging.getLogger(__name__)
+
+# marks the end of the datasets on a stage's queue
+END_OF_DATASETS = None
+
+
+class Stage:
+    # a step of the staged executor: workers threads take datasets from the stage's queue and pass them to the next
+    # stage's queue, waiting while it is full; in processes=True stages the threads hand the work to a process pool
+    def __init__(self, name, function, workers=1, processes=False, queue_size=None):
+        self.name = name
+        self.function = function
+        self.workers = max(workers, 1)
+        self.processes = processes
+        self.queue = queue.Queue(maxsize=queue_size or 2 * self.workers)
+        self.executor = None
+        self.lock = threading.Lock()
+        self.busy_time = 0.0
+        self.completed = 0
+        self.max_queue_depth = 0
+
+    def run(self, job):
+        start = time.perf_counter()
+        try:
+            if self.executor:
+                return self.executor.submit(self.function, job).result()
+            return self.function(job)
+        finally:
+            with self.lock:
+                self.busy_time += time.perf_counter() - start
+                self.completed += 1
+
+    def put(self, job):
+        self.queue.put(job)
+        with self.lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def summary(self, wall_time):
+        return {"workers": self.workers, "processes": self.processes, "datasets": self.completed,
+                "busy_s": self.busy_time, "max_queue_depth": self.max_queue_depth,
+                "utilization": self.busy_time / (wall_time * self.workers) if wall_time > 0 else 0.0}
+
+
+def run_staged(datasets, ingest_workers=2, compute_workers=None, output_workers=None, queue_size=None,
+               on_result=None):
+    # reading, computing and writing of different datasets overlap, so the time of a batch is set by its slowest
+    # stage rather than by the sum of all stages
+    # returns the results of every dataset in input order, as run_batch does, and the utilization of each stage
+    # on_result is called with the result of each dataset as soon as it finishes, from the thread that finished it
+    compute_workers = compute_workers or os.cpu_count() or 1
+    output_workers = output_workers or compute_workers
+    stages = [Stage("ingest", ingest_dataset, ingest_workers, queue_size=queue_size),
+              Stage("compute", compute_dataset, compute_workers, processes=True, queue_size=queue_size),
+              Stage("output", output_dataset, output_workers, processes=True, queue_size=queue_size)]
+    results = {}
+    results_lock = threading.Lock()
+
+    def work(stage, next_stage):
+        while True:
+            job = stage.queue.get()
+            if job is END_OF_DATASETS:
+                return
+            # a thread that stops leaves its queue full and the batch waiting forever, so every job gets a result and
+            # errors while reporting it are only logged
+            try:
+                if job["result"] is None:
+                    try:
+                        job = stage.run(job)
+                    except Exception as e:
+                        job["result"] = create_job_result(job, BATCH_FAILED, f"{type(e).__name__}: {e}")
+                if next_stage and job["result"] is None:
+                    next_stage.put(job)
+                    continue
+                if job["result"] is None:
+                    job["result"] = create_job_result(job, BATCH_OK)
+                with results_lock:
+                    results[job["index"]] = job["result"]
+                    print_dataset_result(job["result"])
+                    if on_result:
+                        on_result(job["result"])
+            except Exception as e:
+                logger.exception("Could not finish %s", job["dataset_info"].get(PATH))
+                with results_lock:
+                    results.setdefault(job["index"], {PATH: job["dataset_info"].get(PATH), BATCH_STATUS: BATCH_FAILED,
+                                                      BATCH_ERROR: f"{type(e).__name__}: {e}",
+                                                      BATCH_TIME: time.perf_counter() - job["start"],
+                                                      BATCH_INGEST_TIME: 0.0})
+
+    start = time.perf_counter()
+    for stage in stages:
+        if stage.processes:
+            stage.executor = ProcessPoolExecutor(max_workers=stage.workers)
+    try:
+        threads = []
+        for stage, next_stage in zip(stages, stages[1:] + [None]):
+            threads.append([threading.Thread(target=work, args=(stage, next_stage), daemon=True)
+                            for _ in range(stage.workers)])
+            for thread in threads[-1]:
+                thread.start()
+
+        # datasets can be a generator, the first queue being full holds back reading more of them
+        for i, dataset_info in enumerate(datasets):
+            stages[0].put({"index": i, "dataset_info": dataset_info, "start": time.perf_counter(), "result": None})
+
+        # each stage is told to stop once every dataset has left the previous one
+        for stage, stage_threads in zip(stages, threads):
+            for _ in stage_threads:
+                stage.put(END_OF_DATASETS)
+            for thread in stage_threads:
+                thread.join()
+    finally:
+        for stage in stages:
+            if stage.executor:
+                shutdown_executor(stage.executor)
+
+    wall_time = time.perf_counter() - start
+    return [results[i] for i in sorted(results)], {stage.name: stage.summary(wall_time) for stage in stages}
+
+
+def ingest_dataset(job):
+    dataset_info = job["dataset_info"]
+    if dataset_info.get(DATASET_ERROR):
+        raise ValueError(dataset_info[DATASET_ERROR])
+    job["cache"], job["cache_key"], job["entry"] = lookup_results(dataset_info)
+    if job["entry"] is None:
+        dataset_info[PLATES] = parse_dataset(dataset_info)
+    return job
+
+
+def compute_dataset(job):
+    dataset_info = job["dataset_info"]
+    if job["entry"] is None:
+        # the plates are not needed anymore and are not sent to the next stage
+        plates = dataset_info.pop(PLATES)
+        job["entry"] = create_results_entry(dataset_info, *process_plates(dataset_info, plates))
+    return job
+
+
+def output_dataset(job):
+    finish_dataset(job["dataset_info"], job["entry"], job["cache"], job["cache_key"])
+    # the results are not needed anymore and are not sent back
+    job["entry"] = None
+    return job
+
+
+def create_job_result(job, status, error=None):
+    # the same fields as the results of run_dataset
+    dataset_info = job["dataset_info"]
+    path = dataset_info[PATH]
+    if dataset_info.get(DATASET_NAME):
+        path = f"{path} [{dataset_info[DATASET_NAME]}]"
+    return {PATH: path, BATCH_STATUS: status, BATCH_ERROR: error,
+            BATCH_TIME: time.perf_counter() - job["start"],
+            BATCH_INGEST_TIME: sum(dataset_info.get(INGEST_TIMES, {}).values()),
+            CACHE_STATS: dataset_info.get(CACHE_STATS),
+            RESULTS_INDEX: dataset_info.get(RESULTS_INDEX), INDEX_RECORDS: dataset_info.get(INDEX_RECORDS),
+            JOURNAL_KEY: dataset_info.get(JOURNAL_KEY), OUTPUT_FILES: dataset_info.get(OUTPUT_FILES)}
+
+
+def print_stage_report(stage_stats):
+    print("Stage utilization:")
+    for name, stats in stage_stats.items():
+        print(f"  {name:<8} {stats['workers']:>3} {'process(es)' if stats['processes'] else 'thread(s)':<12} "
+              f"{stats['utilization'] * 100:5.1f}% busy, {stats['busy_s']:.2f} s over {stats['datasets']} dataset(s), "
+              f"queue up to {stats['max_queue_depth']}")
@@ -0,0 +1,54 @@
+import logging
+import time
+
+from modules.batch import *
+from modules.plate_reader import *
+
+logger = logging.getLogger(__name__)
+
+
+def expand_datasets(datasets):
+    # manifest entries with plates_per_dataset are multi-plate exports, their datasets are read while the batch runs
+    for dataset_info in datasets:
+        if dataset_info.get(PLATES_PER_DATASET):
+            yield from stream_datasets(dataset_info)
+        else:
+            yield dataset_info
+
+
+def stream_datasets(dataset_info, plates_per_dataset=None):
+    # yields a dataset for every plates_per_dataset consecutive plates of a multi-plate export (its replicates) as
+    # soon as they are read; only the plates of the current dataset are kept in memory
+    plates_per_dataset = plates_per_dataset or dataset_info[PLATES_PER_DATASET]
+    plates, first_plate, ingest_time = [], 1, 0.0
+    try:
+        plate_iterator = iter_plate_exports(dataset_info[PATH], dataset_info[PLATE_FORMAT])
+        while True:
+            start = time.perf_counter()
+            plate = next(plate_iterator, None)
+            ingest_time += time.perf_counter() - start
+            if plate is None:
+                break
+            plates.append(plate)
+            if len(plates) == plates_per_dataset:
+                yield create_stream_dataset(dataset_info, plates, first_plate, ingest_time)
+                plates, first_plate, ingest_time = [], first_plate + len(plates), 0.0
+    except (OSError, ValueError) as e:
+        yield {**dataset_info, DATASET_NAME: create_stream_dataset_name(first_plate, plates_per_dataset),
+               DATASET_ERROR: f"{type(e).__name__}: {e}"}
+        return
+
+    if plates:
+        logger.warning("%s: the last dataset has %d of %d plates", dataset_info[PATH], len(plates), plates_per_dataset)
+        yield create_stream_dataset(dataset_info, plates, first_plate, ingest_time)
+
+
+def create_stream_dataset(dataset_info, plates, first_plate, ingest_time):
+    return {**dataset_info, PLATES: plates, DATASET_NAME: create_stream_dataset_name(first_plate, len(plates)),
+            INGEST_TIMES: {dataset_info[PATH]: ingest_time}}
+
+
+def create_stream_dataset_name(first_plate, num_plates):
+    if num_plates == 1:
+        return f"plate{first_plate}"
+    return f"plates{first_plate}-{first_plate + num_plates - 1}"
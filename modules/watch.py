@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from modules.batch import *
+from modules.results_index import index_results
+from modules.running_stats import IncrementalDataset
+
+logger = logging.getLogger(__name__)
+
+
+def watch_directory(root, process, workers=None, poll_interval=1.0, settle_time=2.0, process_existing=False,
+                    dataset_options=None):
+    # csv files directly in root are single-replicate datasets, csv files anywhere below a subdirectory of root
+    # belong to the dataset of that subdirectory, as they would if the subdirectory was given to parse_dataset
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    seen = {}
+    processed = {}
+    running = {}
+    incremental = {}
+    completed = 0
+    logger.info("Watching %s with %d worker(s)", root, workers)
+
+    # workers are started once and keep their imports loaded between datasets
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_up_worker) as executor:
+        try:
+            first_scan = True
+            while True:
+                now = time.time()
+                update_seen_files(seen, scan_csv_files(root), now, settle_time if first_scan else 0)
+                datasets = group_datasets(root, seen)
+                for path in set(incremental) - set(datasets):
+                    del incremental[path]
+                if first_scan and not process_existing:
+                    processed.update({path: get_dataset_state(files, seen) for path, files in datasets.items()})
+                first_scan = False
+
+                # datasets are ready once none of their files changed during the last settle_time seconds
+                running_paths = {path for path, _ in running.values()}
+                ready = []
+                for path, files in datasets.items():
+                    if path in running_paths or processed.get(path) == get_dataset_state(files, seen):
+                        continue
+                    landed_at = max(seen[file][1] for file in files)
+                    if now - landed_at >= settle_time:
+                        ready.append((landed_at, path, files))
+
+                submitted = sorted(ready)[:max(max_in_flight - len(running), 0)]
+                for landed_at, path, files in submitted:
+                    dataset_info = create_watched_dataset_info(root, path, dataset_options)
+                    add_incremental_signals(dataset_info, incremental, files, seen)
+                    processed[path] = get_dataset_state(files, seen)
+                    running[executor.submit(run_dataset, process, dataset_info)] = (path, landed_at)
+                if ready:
+                    logger.info("Queue depth: %d running, %d waiting", len(running), len(ready) - len(submitted))
+
+                if not running:
+                    time.sleep(poll_interval)
+                    continue
+                done, _ = wait(list(running), timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, landed_at = running.pop(future)
+                    completed += 1
+                    report_watched_result(future, path, time.time() - landed_at, len(running))
+        except KeyboardInterrupt:
+            logger.info("Stopping, waiting for %d running dataset(s)", len(running))
+            for future, (path, landed_at) in running.items():
+                report_watched_result(future, path, time.time() - landed_at, 0)
+                completed += 1
+
+    logger.info("Processed %d dataset(s)", completed)
+    return completed
+
+
+def warm_up_worker():
+    # load the numerical libraries and run a small fit so the first dataset does not pay for it
+    from modules.curve_fitting import fit_model
+    x_data = np.array([1e3, 1e2, 1e1, 1e0])
+    fit_model(simple_model_equation, x_data, simple_model_equation(x_data, 10))
+
+
+def scan_csv_files(root):
+    files = {}
+    for dir_path, dirs, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.endswith(".csv"):
+                file_path = os.path.join(dir_path, file_name)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                files[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def update_seen_files(seen, files, now, age=0):
+    # seen maps each file to (size and modification time, time that signature was first seen)
+    for file_path in list(seen):
+        if file_path not in files:
+            del seen[file_path]
+    for file_path, signature in files.items():
+        if file_path not in seen or seen[file_path][0] != signature:
+            seen[file_path] = (signature, now - age)
+
+
+def group_datasets(root, files):
+    datasets = {}
+    for file_path in files:
+        parts = os.path.relpath(file_path, root).split(os.sep)
+        dataset_path = file_path if len(parts) == 1 else os.path.join(root, parts[0])
+        datasets.setdefault(dataset_path, []).append(file_path)
+    return datasets
+
+
+def get_dataset_state(files, seen):
+    return frozenset((file_path, seen[file_path][0]) for file_path in files)
+
+
+def create_watched_dataset_info(root, path, dataset_options=None):
+    # parameters come from a dataset.json in the dataset's directory, or in root, with the same keys as a manifest
+    entry = {}
+    for params_dir in (root, path if os.path.isdir(path) else None):
+        params_file = os.path.join(params_dir, DATASET_PARAMETERS_FILE) if params_dir else None
+        if params_file and os.path.exists(params_file):
+            with open(params_file) as f:
+                entry.update(json.load(f))
+    entry[MANIFEST_PATH] = path
+
+    dataset_info = create_dataset_info(entry)
+    dataset_info.update(dataset_options or {})
+    return dataset_info
+
+
+def add_incremental_signals(dataset_info, incremental, files, seen):
+    # only the files that are new or changed since the dataset was last processed are read; the statistics of the
+    # earlier replicates are updated rather than recomputed and the worker only fits and writes the outputs
+    path = dataset_info[PATH]
+    dataset = incremental.get(path)
+    if dataset is None or dataset.plate_format != dataset_info[PLATE_FORMAT]:
+        dataset = incremental[path] = IncrementalDataset(dataset_info[PLATE_FORMAT])
+    try:
+        dataset_info[INGEST_TIMES] = dataset.update({file_path: seen[file_path][0] for file_path in files})
+        dataset_info[SIGNALS] = dataset.create_signals(dataset_info)
+    except (OSError, ValueError) as e:
+        # the dataset is read again from scratch once its files change
+        del incremental[path]
+        dataset_info[DATASET_ERROR] = f"{type(e).__name__}: {e}"
+        return
+    logger.debug("%s: read %d new or changed file(s), %d replicate(s)", path, len(dataset_info[INGEST_TIMES]),
+                 dataset_info[NUM_REPEATS])
+
+
+def report_watched_result(future, path, latency, queue_depth):
+    try:
+        result = future.result()
+    except Exception as e:
+        result = {PATH: path, BATCH_STATUS: BATCH_FAILED, BATCH_ERROR: f"{type(e).__name__}: {e}"}
+
+    if result[BATCH_STATUS] == BATCH_OK:
+        index_results([result])
+        logger.info("[%s] %s: %.2f s from landing to report, %d in queue", result[BATCH_STATUS], path, latency,
+                    queue_depth)
+    else:
+        logger.error("[%s] %s: %s (%.2f s after landing), %d in queue", result[BATCH_STATUS], path,
+                     result[BATCH_ERROR], latency, queue_depth)
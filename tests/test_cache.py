@@ -0,0 +1,56 @@
+import os
+
+from modules.cache import *
+
+
+def create_entry(size):
+    return {CACHED_RESULTS: b"x" * size, CACHED_OUTPUTS: {}}
+
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    assert cache.get("a") is None
+
+    cache.put("a", create_entry(10))
+
+    assert cache.get("a") == create_entry(10)
+    assert cache.stats() == {CACHE_HITS: 1, CACHE_MISSES: 1, CACHE_EVICTIONS: 0}
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_size=2500)
+    cache.put("a", create_entry(1000))
+    cache.put("b", create_entry(1000))
+    # "a" was used more recently than "b"
+    os.utime(cache.entry_path("a"), (2_000_000_000, 2_000_000_000))
+    os.utime(cache.entry_path("b"), (1_000_000_000, 1_000_000_000))
+
+    cache.put("c", create_entry(1000))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.evictions == 1
+
+
+def test_key_changes_with_parameters_and_files(tmp_path):
+    file_path = tmp_path / "replicate_1.csv"
+    file_path.write_text("1,2\n")
+    dataset_info = {PATH: str(tmp_path), MAX_CONC: 10, DIL_FACTOR: 2}
+    key = create_cache_key(dataset_info, [str(file_path)])
+
+    assert create_cache_key(dict(dataset_info), [str(file_path)]) == key
+    assert create_cache_key({**dataset_info, MAX_CONC: 5}, [str(file_path)]) != key
+    file_path.write_text("1,3\n")
+    assert create_cache_key(dataset_info, [str(file_path)]) != key
+
+
+def test_key_does_not_depend_on_dataset_location(tmp_path):
+    keys = []
+    for directory in ("first", "second"):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / "replicate_1.csv").write_text("1,2\n")
+        dataset_info = {PATH: str(tmp_path / directory), MAX_CONC: 10}
+        keys.append(create_cache_key(dataset_info, [str(tmp_path / directory / "replicate_1.csv")]))
+
+    assert keys[0] == keys[1]
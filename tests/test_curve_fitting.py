@@ -0,0 +1,49 @@
+import numpy as np
+
+from modules.curve_fitting import *
+
+CONCENTRATIONS = 10000 / 2.0 ** np.arange(15)
+
+
+def create_signal(y_data):
+    return {CONC: list(CONCENTRATIONS), STATS: {AVERAGE_SIGNAL: np.asarray(y_data)},
+            SIGNAL_VALUES: np.tile(y_data, (3, 1))}
+
+
+def test_simple_binding_prefers_simple_model():
+    rng = np.random.default_rng(0)
+    y_data = simple_model_equation(CONCENTRATIONS, 100) + rng.normal(0, 0.02, len(CONCENTRATIONS))
+
+    fit_results = fit_models(create_signal(y_data))
+
+    assert fit_results[MODEL_SELECTION][PREFERRED_MODEL] == SIMPLE_MODEL
+    assert 80 < fit_results[SIMPLE_MODEL][KD][PARAMETER] < 120
+
+
+def test_noise_only_has_no_preferred_model():
+    rng = np.random.default_rng(0)
+    y_data = rng.normal(0, 0.3, len(CONCENTRATIONS))
+
+    fit_results = fit_models(create_signal(y_data))
+
+    assert fit_results[MODEL_SELECTION][PREFERRED_MODEL] is None
+
+
+def test_preferred_model_is_a_valid_fit():
+    for seed in range(10):
+        y_data = np.random.default_rng(seed).normal(0, 0.3, len(CONCENTRATIONS))
+        fit_results = fit_models(create_signal(y_data))
+        preferred = fit_results[MODEL_SELECTION][PREFERRED_MODEL]
+        assert preferred is None or is_valid_fit(fit_results[preferred], CONCENTRATIONS)
+
+
+def test_invalid_fits_are_not_candidates():
+    x_data = CONCENTRATIONS
+    fit_result = {FIT_POPT: [100.0], FIT_R2: 0.9}
+    assert is_valid_fit(fit_result, x_data)
+    assert not is_valid_fit({**fit_result, FIT_R2: -0.5}, x_data)
+    assert not is_valid_fit({**fit_result, FIT_POPT: None}, x_data)
+    # KD at the upper limit of the search
+    assert not is_valid_fit({**fit_result, FIT_POPT: [np.max(x_data) * 10 ** KD_SEARCH_DECADES]}, x_data)
+    # negative hill slope or receptor concentration
+    assert not is_valid_fit({**fit_result, FIT_POPT: [100.0, -0.07]}, x_data)
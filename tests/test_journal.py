@@ -0,0 +1,101 @@
+import os
+
+import pytest
+
+from modules.atomic import atomic_output
+from modules.batch import create_dataset_info
+from modules.journal import *
+
+
+def create_datasets(tmp_path, names):
+    datasets = []
+    for name in names:
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "replicate_1.csv").write_text("1,2\n")
+        datasets.append(create_dataset_info({MANIFEST_PATH: str(tmp_path / name)}))
+    return datasets
+
+
+def create_datasets_again(datasets):
+    # a new run reads the manifest again
+    return [create_dataset_info({MANIFEST_PATH: dataset_info[PATH]}) for dataset_info in datasets]
+
+
+def create_result(dataset_info, status, outputs=None):
+    return {PATH: dataset_info[PATH], BATCH_STATUS: status, BATCH_ERROR: None if status == BATCH_OK else "error",
+            BATCH_TIME: 0.1, JOURNAL_KEY: dataset_info[JOURNAL_KEY], OUTPUT_FILES: outputs}
+
+
+def run_batch_with_journal(journal_path, datasets, statuses):
+    # records a result for the first len(statuses) pending datasets, the rest stay unfinished
+    journal = BatchJournal(journal_path)
+    pending = list(journal.pending(datasets))
+    for dataset_info, status in zip(pending, statuses):
+        output = os.path.join(dataset_info[PATH], "output.xlsx")
+        open(output, "w").close()
+        journal.record(create_result(dataset_info, status, {XLSX_OUTPUT: output}))
+    return pending
+
+
+def test_completed_datasets_are_skipped(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    datasets = create_datasets(tmp_path, ["ok", "failed", "unfinished"])
+    run_batch_with_journal(journal_path, datasets, [BATCH_OK, BATCH_FAILED])
+
+    journal = BatchJournal(journal_path)
+    pending = [dataset_info[PATH] for dataset_info in journal.pending(create_datasets_again(datasets))]
+
+    assert pending == [str(tmp_path / "failed"), str(tmp_path / "unfinished")]
+    assert [dataset_info[PATH] for dataset_info in journal.skipped] == [str(tmp_path / "ok")]
+
+
+def test_datasets_with_missing_outputs_or_changed_inputs_are_retried(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    datasets = create_datasets(tmp_path, ["deleted", "changed"])
+    run_batch_with_journal(journal_path, datasets, [BATCH_OK, BATCH_OK])
+    os.remove(tmp_path / "deleted" / "output.xlsx")
+    (tmp_path / "changed" / "replicate_1.csv").write_text("1,2\n3,4\n")
+
+    journal = BatchJournal(journal_path)
+
+    assert len(list(journal.pending(create_datasets_again(datasets)))) == 2
+    assert journal.skipped == []
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    journal_path = str(tmp_path / "journal.jsonl")
+    datasets = create_datasets(tmp_path, ["ok", "interrupted"])
+    run_batch_with_journal(journal_path, datasets, [BATCH_OK])
+    with open(journal_path, "a") as f:
+        f.write('{"key": "' + datasets[1][JOURNAL_KEY] + '", "status": "o')
+
+    journal = BatchJournal(journal_path)
+    pending = [dataset_info[PATH] for dataset_info in journal.pending(create_datasets_again(datasets))]
+
+    assert pending == [str(tmp_path / "interrupted")]
+
+
+def test_failed_write_leaves_no_file(tmp_path):
+    target = tmp_path / "output.xlsx"
+    target.write_text("previous")
+
+    with pytest.raises(RuntimeError):
+        with atomic_output(str(target)) as temp_path:
+            with open(temp_path, "w") as f:
+                f.write("partial")
+            raise RuntimeError("write failed")
+
+    assert target.read_text() == "previous"
+    assert os.listdir(tmp_path) == ["output.xlsx"]
+
+
+def test_completed_write_replaces_file(tmp_path):
+    target = tmp_path / "output.xlsx"
+
+    with atomic_output(str(target)) as temp_path:
+        assert os.path.dirname(temp_path) == str(tmp_path)
+        with open(temp_path, "w") as f:
+            f.write("complete")
+
+    assert target.read_text() == "complete"
+    assert os.listdir(tmp_path) == ["output.xlsx"]
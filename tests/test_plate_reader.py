@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_replicate, write_plate_export
+from modules.plate_reader import *
+
+
+@pytest.mark.parametrize("plate_format", [COLUMN_PLATE_FORMAT, ROW_PLATE_FORMAT])
+def test_parse_plate_export(tmp_path, plate_format):
+    data_615, data_665 = generate_replicate(15, rng=np.random.default_rng(0))
+    file_path = str(tmp_path / "plate.csv")
+    write_plate_export(file_path, data_615, data_665, plate_format=plate_format)
+
+    plate = read_plate_export(file_path, plate_format)
+
+    assert plate.shape == (len(data_615), 2)
+    np.testing.assert_array_equal(plate[:, 0], data_615)
+    np.testing.assert_array_equal(plate[:, 1], data_665)
+
+
+def test_parse_plate_export_from_lines():
+    lines = ["1,4\n", "2,5\n", "3,6\n", ",\n", "7,10\n", "8,11\n", "9,12\n"]
+
+    plate = parse_plate_export(lines)
+
+    np.testing.assert_array_equal(plate, [[1, 7], [2, 8], [3, 9], [4, 10], [5, 11], [6, 12]])
+
+
+def test_parse_plate_export_rejects_unequal_channels():
+    with pytest.raises(ValueError, match="615 nm"):
+        parse_plate_export(["1\n", "2\n", "\n", "3\n"])
+
+
+def test_parse_plate_export_rejects_text():
+    with pytest.raises(ValueError, match="plate.csv"):
+        parse_plate_export(["1,x\n"], file_path="plate.csv")
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+
+from benchmarks.synthetic import generate_dataset
+from modules.running_stats import *
+
+
+def assert_statistics_match(statistics, values):
+    np.testing.assert_allclose(statistics.mean, np.mean(values, axis=0), rtol=1e-12)
+    result = statistics.statistics()
+    np.testing.assert_allclose(result[STD_DEV], np.std(values, axis=0, ddof=1), rtol=1e-9)
+    np.testing.assert_allclose(result[STD_ERR], np.std(values, axis=0, ddof=1) / np.sqrt(len(values)), rtol=1e-9)
+
+
+def test_add_matches_numpy():
+    values = np.random.default_rng(0).normal(1000, 50, (6, 15))
+    statistics = RunningStatistics()
+    for replicate in values:
+        statistics.add(replicate)
+
+    assert_statistics_match(statistics, values)
+
+
+def test_remove_matches_numpy():
+    values = np.random.default_rng(1).normal(1000, 50, (6, 15))
+    statistics = RunningStatistics()
+    for replicate in values:
+        statistics.add(replicate)
+
+    statistics.remove(values[2])
+    statistics.remove(values[4])
+
+    assert statistics.count == 4
+    assert_statistics_match(statistics, np.delete(values, [2, 4], axis=0))
+
+
+def test_remove_last_replicate_resets():
+    statistics = RunningStatistics()
+    statistics.add(np.ones(3))
+    statistics.remove(np.ones(3))
+
+    assert statistics.count == 0 and statistics.mean is None
+
+
+def test_incremental_dataset_matches_batch_statistics(tmp_path):
+    dataset_info = generate_dataset(str(tmp_path), replicates=4, seed=0)
+    dataset = IncrementalDataset(dataset_info[PLATE_FORMAT])
+    file_paths = sorted(find_plate_exports(str(tmp_path)))
+    signatures = {file_path: (os.path.getsize(file_path), os.path.getmtime(file_path)) for file_path in file_paths}
+
+    # one file at a time, as they land in a watched directory
+    for i in range(1, len(file_paths) + 1):
+        dataset.update({file_path: signatures[file_path] for file_path in file_paths[:i]})
+    plates, _ = read_plate_exports(file_paths, dataset_info[PLATE_FORMAT])
+    corrected_signal = {SIGNAL_VALUES: correct_signal(format_raw_signal(plates))}
+
+    assert_statistics_match(dataset.statistics, corrected_signal[SIGNAL_VALUES])
+    # a deleted replicate is removed from the statistics
+    assert dataset.update({file_path: signatures[file_path] for file_path in file_paths[1:]}) == {}
+    assert_statistics_match(dataset.statistics, corrected_signal[SIGNAL_VALUES][1:])
@@ -0,0 +1,114 @@
+import io
+import os
+import zipfile
+from xml.etree import ElementTree
+
+import numpy as np
+import openpyxl
+import pytest
+from openpyxl.utils.cell import range_boundaries
+
+from modules.batch import create_dataset_info
+from modules.pipeline import *
+from modules.save_xlsx import *
+
+DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "synthetic")
+CHART_NAMESPACE = {"c": "http://schemas.openxmlformats.org/drawingml/2006/chart"}
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    dataset_info = create_dataset_info({MANIFEST_PATH: DATASET})
+    corrected_signal, normalized_signal, fit_results = process_signal(dataset_info)
+    fitted_curves = calculate_fitted_curves(normalized_signal, fit_results)
+    return dataset_info, corrected_signal, normalized_signal, fit_results, fitted_curves
+
+
+def write_workbook(dataset, low_memory):
+    dataset_info, corrected_signal, normalized_signal, fit_results, fitted_curves = dataset
+    output = io.BytesIO()
+    output_results(dataset_info, corrected_signal, normalized_signal, fit_results, low_memory, fitted_curves, output)
+    return output
+
+
+def read_chart_series(output):
+    # the x, y and error bar references of every series, one list per chart in the order the charts were added
+    with zipfile.ZipFile(output) as archive:
+        names = sorted((name for name in archive.namelist() if name.startswith("xl/charts/chart")),
+                       key=lambda name: int(name[len("xl/charts/chart"):-len(".xml")]))
+        charts = [ElementTree.fromstring(archive.read(name)) for name in names]
+    return [[{part: series.find(f"c:{part}//c:f", CHART_NAMESPACE).text
+              for part in ("xVal", "yVal", "errBars") if series.find(f"c:{part}//c:f", CHART_NAMESPACE) is not None}
+             for series in chart.iterfind(".//c:ser", CHART_NAMESPACE)] for chart in charts]
+
+
+def read_range(worksheet, reference):
+    # the header above a single column reference and the values in it
+    sheet, cells = reference.split("!")
+    assert sheet.strip("'") == WS_NAME
+    min_col, min_row, max_col, max_row = range_boundaries(cells.replace("$", ""))
+    assert min_col == max_col
+    values = [worksheet.cell(row=row, column=min_col).value for row in range(min_row, max_row + 1)]
+    return worksheet.cell(row=min_row - 1, column=min_col).value, values
+
+
+def assert_values_equal(actual, expected):
+    # numbers are written to the file with 17 significant digits at most
+    np.testing.assert_allclose(np.asarray(actual, dtype=np.float64), np.asarray(expected, dtype=np.float64),
+                               rtol=1e-15, atol=0)
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_tables(dataset, low_memory):
+    dataset_info, corrected_signal, normalized_signal, fit_results, _ = dataset
+    worksheet = openpyxl.load_workbook(write_workbook(dataset, low_memory))[WS_NAME]
+
+    num_repeats, num_datapoints = dataset_info[NUM_REPEATS], dataset_info[NUM_DATAPOINTS]
+    headers = [CONC, LOG_CONC] + [f"Repeat {repeat}" for repeat in range(1, num_repeats + 1)] + \
+        [AVERAGE_SIGNAL, STD_DEV, STD_ERR]
+    for first_row, signal in ((1, normalized_signal), (num_datapoints + 6, corrected_signal)):
+        assert [worksheet.cell(row=first_row, column=col).value for col in range(1, len(headers) + 1)] == headers
+        table = np.array([[worksheet.cell(row=first_row + 1 + i, column=col).value
+                           for col in range(1, len(headers) + 1)] for i in range(num_datapoints)], dtype=np.float64)
+        expected = np.column_stack([signal[CONC], signal[LOG_CONC], signal[SIGNAL_VALUES].T,
+                                    *(signal[STATS][stat] for stat in (AVERAGE_SIGNAL, STD_DEV, STD_ERR))])
+        assert_values_equal(table, expected)
+
+    # the title of each model and its KD, below each chart
+    fit_col = DEFAULT_COL_NUM + num_repeats
+    for i, model in enumerate(MODELS):
+        row = 2 + (i + 1) * (CHART_ROW_HEIGHT + 3) + 7 * i
+        assert worksheet.cell(row=row, column=fit_col + 1).value.startswith(model)
+        assert worksheet.cell(row=row + 1, column=fit_col + 1).value == PARAMETER
+        assert worksheet.cell(row=row + 2, column=fit_col + 1).value == KD
+        assert_values_equal(worksheet.cell(row=row + 2, column=fit_col + 2).value, fit_results[model][KD][PARAMETER])
+
+
+@pytest.mark.parametrize("low_memory", [False, True])
+def test_chart_series(dataset, low_memory):
+    _, _, normalized_signal, _, fitted_curves = dataset
+    output = write_workbook(dataset, low_memory)
+    worksheet = openpyxl.load_workbook(output)[WS_NAME]
+    charts = read_chart_series(output)
+
+    assert len(charts) == len(MODELS)
+    for model, (data_series, curve_series, helper_series) in zip(MODELS, charts):
+        expected = [(data_series["xVal"], CONC, normalized_signal[CONC]),
+                    (data_series["yVal"], AVERAGE_SIGNAL, normalized_signal[STATS][AVERAGE_SIGNAL]),
+                    (data_series["errBars"], STD_DEV, normalized_signal[STATS][STD_DEV]),
+                    (curve_series["xVal"], f"x_{model}", fitted_curves[model][f"x_{model}"]),
+                    (curve_series["yVal"], f"y_{model}", fitted_curves[model][f"y_{model}"]),
+                    (helper_series["xVal"], HELPER_X, [1e-1, 1e0, 1e1, 1e2, 1e3, 1e4, 1e5]),
+                    (helper_series["yVal"], HELPER_Y, [-0.1] * 7)]
+        for reference, header, values in expected:
+            assert read_range(worksheet, reference)[0] == header
+            assert_values_equal(read_range(worksheet, reference)[1], values)
+
+
+def test_low_memory_workbook_matches(dataset):
+    outputs = [write_workbook(dataset, low_memory) for low_memory in (False, True)]
+    worksheets = [openpyxl.load_workbook(output)[WS_NAME] for output in outputs]
+
+    assert [list(rows) for rows in worksheets[0].iter_rows(values_only=True)] == \
+        [list(rows) for rows in worksheets[1].iter_rows(values_only=True)]
+    assert read_chart_series(outputs[0]) == read_chart_series(outputs[1])
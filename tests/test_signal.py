@@ -0,0 +1,32 @@
+import os
+
+import numpy as np
+import pytest
+
+from modules.pipeline import *
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# arrays computed by the loop-based implementation this pipeline replaced, from the same files
+REFERENCE = os.path.join(DATA_DIR, "signal_reference.npz")
+DATASETS = {"sample": os.path.join(ROOT_DIR, "resources", "test_csv_original.csv"),
+            "synthetic": os.path.join(DATA_DIR, "synthetic")}
+
+
+# the sample has a single replicate, so its standard deviations are nan
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("name", list(DATASETS))
+def test_signal_matches_reference(name):
+    reference = np.load(REFERENCE)
+    plates, _ = read_plate_exports(sorted(find_plate_exports(DATASETS[name])))
+
+    corrected_signal = {SIGNAL_VALUES: correct_signal(format_raw_signal(plates))}
+    corrected_signal[STATS] = calculate_signal_statistics(corrected_signal)
+    normalized_signal = {SIGNAL_VALUES: normalize_signal(corrected_signal)}
+    normalized_signal[STATS] = calculate_signal_statistics(normalized_signal)
+
+    for label, signal in (("corrected", corrected_signal), ("normalized", normalized_signal)):
+        np.testing.assert_array_equal(signal[SIGNAL_VALUES], reference[f"{name}_{label}"])
+        np.testing.assert_array_equal(signal[STATS][AVERAGE_SIGNAL], reference[f"{name}_{label}_average"])
+        np.testing.assert_array_equal(signal[STATS][STD_DEV], reference[f"{name}_{label}_std_dev"])
+        np.testing.assert_array_equal(signal[STATS][STD_ERR], reference[f"{name}_{label}_std_err"])
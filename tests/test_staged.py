@@ -0,0 +1,27 @@
+import threading
+
+from benchmarks.synthetic import generate_dataset
+from modules.staged import *
+
+
+def test_failing_on_result_does_not_stop_the_batch(tmp_path):
+    generate_dataset(str(tmp_path / "good"), seed=0)
+    datasets = [create_dataset_info({MANIFEST_PATH: str(tmp_path / "good")}),
+                {**create_dataset_info({MANIFEST_PATH: str(tmp_path / "bad")}), DATASET_ERROR: "unreadable"},
+                {**create_dataset_info({MANIFEST_PATH: str(tmp_path / "bad2")}), DATASET_ERROR: "unreadable"}]
+    reported = []
+
+    def on_result(result):
+        reported.append(result[PATH])
+        raise OSError("journal is not writable")
+
+    output = {}
+    thread = threading.Thread(target=lambda: output.update(
+        results=run_staged(datasets, ingest_workers=1, compute_workers=1, output_workers=1, queue_size=1,
+                           on_result=on_result)[0]), daemon=True)
+    thread.start()
+    thread.join(timeout=120)
+
+    assert not thread.is_alive()
+    assert len(reported) == len(datasets)
+    assert [result[BATCH_STATUS] for result in output["results"]] == [BATCH_OK, BATCH_FAILED, BATCH_FAILED]